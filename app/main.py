@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+from typing import Optional
 
 from .schemas import LoanInput, ClassificationResponse, RegressionResponse, ClusterResponse
 from . import predict as predictor
@@ -33,27 +34,45 @@ def health():
 
 
 @app.post('/predict/classification', response_model=ClassificationResponse)
-def predict_classification(input: LoanInput):
+def predict_classification(input: LoanInput, x_request_id: Optional[str] = Header(None)):
     try:
-        res = predictor.predict_classification(input.dict())
+        res = predictor.predict_classification(input.dict(), x_request_id)
         return res
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post('/predict/regression', response_model=RegressionResponse)
-def predict_regression(input: LoanInput):
+def predict_regression(input: LoanInput, x_request_id: Optional[str] = Header(None)):
     try:
-        val = predictor.predict_regression(input.dict())
+        val = predictor.predict_regression(input.dict(), x_request_id)
         return {"predicted_value": val}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post('/segment/customer', response_model=ClusterResponse)
-def segment_customer(input: LoanInput):
+def segment_customer(input: LoanInput, x_request_id: Optional[str] = Header(None)):
     try:
-        c = predictor.predict_cluster(input.dict())
+        c = predictor.predict_cluster(input.dict(), x_request_id)
         return {"cluster": c}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get('/monitoring/drift')
+def monitoring_drift(windows: int = 1):
+    """PSI per input field for the latest hourly windows of traffic vs the training profile."""
+    try:
+        return predictor.drift_report(windows)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get('/monitoring/shadow')
+def monitoring_shadow():
+    """Disagreement rate and latency of the challenger model scored in the shadow of live requests."""
+    try:
+        return predictor.shadow_report()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
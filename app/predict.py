@@ -1,12 +1,34 @@
+import json
+import threading
+import time
+from collections import OrderedDict
 import joblib
+from functools import lru_cache
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from scipy import sparse
 import logging
 
+from ml.drift import REFERENCE_PROFILE_PATH, WindowedSketch, load_reference_profile
+from ml.features import NUMERIC_PARSERS, add_derived_features, normalize_categoricals
+
+from .schemas import LoanInput
+from .shadow import ShadowScorer
+
 logger = logging.getLogger(__name__)
 MODELS_DIR = Path(__file__).resolve().parents[1] / "models"
+# live traffic is sketched in hourly windows; a day of them is kept
+MONITOR_WINDOW_SECONDS = 3600
+MONITOR_WINDOWS = 24
+# requests sharing a request id (X-Request-ID, e.g. one applicant sent to several endpoints)
+# within this many seconds are sketched once
+MONITOR_DEDUPE_SECONDS = 60
+MONITOR_DEDUPE_SIZE = 10_000
+PROBABILITY_EDGES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+# optional challenger bundle (classification_model.pkl / regression_model.pkl trained on the same
+# features); when present it is scored in the shadow of every request and never served
+CHALLENGER_DIR = MODELS_DIR / 'challenger'
 
 classification_model = None
 regression_model = None
@@ -14,10 +36,18 @@ clustering_model = None
 preprocessor = None
 preprocessor_config = None
 svd = None
+# cost-optimal cutoff on P(positive_label) chosen at training time (models/decision_threshold.json)
+decision_threshold = None
+input_monitor = None
+prediction_monitor = None
+shadow = None
+# request field -> reference profile column, for the fields the profile knows
+monitor_fields = {}
 
 
 def load_models():
     global classification_model, regression_model, clustering_model, preprocessor, preprocessor_config, svd
+    global input_monitor, prediction_monitor, monitor_fields, decision_threshold, shadow
     try:
         preproc_path = MODELS_DIR / 'preprocessor.joblib'
         if preproc_path.exists():
@@ -49,16 +79,29 @@ def load_models():
         p = MODELS_DIR / 'classification_model.pkl'
         if p.exists():
             classification_model = joblib.load(p)
-            logger.info('Loaded classification model')
+            logger.info('Loaded classification model (%s)', type(classification_model).__name__)
     except Exception as e:
         logger.warning('Could not load classification model: %s', e)
         classification_model = None
 
+    decision_threshold = None
+    try:
+        p = MODELS_DIR / 'decision_threshold.json'
+        classes = [str(c) for c in getattr(classification_model, 'classes_', [])]
+        if p.exists() and len(classes) == 2:
+            cutoff = json.loads(p.read_text())
+            if cutoff['positive_label'] in classes:
+                decision_threshold = cutoff
+                logger.info('Declining when P(%s) >= %.3f', cutoff['positive_label'], cutoff['threshold'])
+    except Exception as e:
+        logger.warning('Decision threshold not loaded, using argmax: %s', e)
+        decision_threshold = None
+
     try:
         p = MODELS_DIR / 'regression_model.pkl'
         if p.exists():
             regression_model = joblib.load(p)
-            logger.info('Loaded regression model')
+            logger.info('Loaded regression model (%s)', type(regression_model).__name__)
     except Exception as e:
         logger.warning('Could not load regression model: %s', e)
         regression_model = None
@@ -72,84 +115,227 @@ def load_models():
         logger.warning('Could not load clustering model: %s', e)
         clustering_model = None
 
+    try:
+        if REFERENCE_PROFILE_PATH.exists():
+            profile = load_reference_profile(REFERENCE_PROFILE_PATH)
+            # "Credit Score" in the training data arrives as credit_score in requests
+            columns = {c.lower().replace(' ', '_'): c for c in profile['features']}
+            monitor_fields = {f: columns[f] for f in LoanInput.model_fields if f in columns}
+            input_monitor = WindowedSketch(profile, features=monitor_fields.values(),
+                                           window_seconds=MONITOR_WINDOW_SECONDS, n_windows=MONITOR_WINDOWS)
+            logger.info('Monitoring drift of %d input fields', len(monitor_fields))
+    except Exception as e:
+        logger.warning('Drift monitoring disabled: %s', e)
+        input_monitor = None
 
-def _prepare_features(input_dict: dict):
-    # Build a one-row DataFrame and transform with preprocessor; handle sparse output
+    prediction_monitor = None
+    if classification_model is not None and hasattr(classification_model, 'predict_proba'):
+        prediction_monitor = WindowedSketch(_prediction_profile(classification_model.classes_),
+                                            window_seconds=MONITOR_WINDOW_SECONDS, n_windows=MONITOR_WINDOWS)
+
+    if shadow is not None:
+        shadow.stop()
+    shadow = None
+    try:
+        challengers = {}
+        for task in ('classification', 'regression'):
+            p = CHALLENGER_DIR / f'{task}_model.pkl'
+            if p.exists():
+                challengers[task] = joblib.load(p)
+                logger.info('Loaded %s challenger (%s)', task, type(challengers[task]).__name__)
+        if challengers:
+            shadow = ShadowScorer(challengers, decide=_decide)
+    except Exception as e:
+        logger.warning('Shadow scoring disabled: %s', e)
+        shadow = None
+
+
+def _prediction_profile(classes) -> dict:
+    """Bin layout for served predictions; it has no training counts, so it is compared with past windows."""
+    return {'rows': 0, 'features': {
+        'probability': {'type': 'numeric', 'edges': PROBABILITY_EDGES, 'counts': [0] * (len(PROBABILITY_EDGES) + 2)},
+        'loan_status': {'type': 'categorical', 'categories': [str(c) for c in classes],
+                        'counts': [0] * (len(classes) + 2)},
+    }}
+
+
+@lru_cache(maxsize=1024)
+def _parse_field(col: str, value: str) -> float:
+    return float(NUMERIC_PARSERS[col](pd.Series([value]))[0])
+
+
+_recent_requests = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def _seen_recently(request_id: str) -> bool:
+    """True when a request with this id was sketched in the last ``MONITOR_DEDUPE_SECONDS``."""
+    now = time.monotonic()
+    with _recent_lock:
+        while _recent_requests and (len(_recent_requests) >= MONITOR_DEDUPE_SIZE
+                                    or next(iter(_recent_requests.values())) < now - MONITOR_DEDUPE_SECONDS):
+            _recent_requests.popitem(last=False)
+        if request_id in _recent_requests:
+            return True
+        _recent_requests[request_id] = now
+        return False
+
+
+def _observe_inputs(input_dict: dict, request_id: str = None):
+    if input_monitor is None:
+        return
+    try:
+        # one request id scored by classification, regression and clustering counts once; requests
+        # without an id are all distinct, even with identical fields
+        if request_id is not None and _seen_recently(request_id):
+            return
+        row = {}
+        for field, col in monitor_fields.items():
+            value = input_dict.get(field)
+            if isinstance(value, str):
+                value = _parse_field(col, value) if col in NUMERIC_PARSERS else value.strip()
+            row[col] = value
+        input_monitor.observe(row)
+    except Exception as e:
+        # monitoring must never fail a prediction
+        logger.debug('Request not added to the drift sketch: %s', e)
+
+
+def shadow_report() -> dict:
+    """Disagreement and latency of the challenger against the served models so far."""
+    if shadow is None:
+        raise RuntimeError('No challenger loaded')
+    return shadow.report()
+
+
+def _decide(model, proba) -> int:
+    """Index of the served class: the cost-optimal cutoff when one is loaded, else argmax."""
+    if decision_threshold is not None:
+        classes = [str(c) for c in model.classes_]
+        positive = classes.index(decision_threshold['positive_label'])
+        return positive if proba[positive] >= decision_threshold['threshold'] else 1 - positive
+    return int(np.argmax(proba))
+
+
+def drift_report(windows: int = 1) -> dict:
+    """PSI/KS/chi-square of the latest ``windows`` windows of traffic against the training profile."""
+    if input_monitor is None:
+        raise RuntimeError('Reference profile not loaded')
+    report = {'inputs': input_monitor.report(windows)}
+    if prediction_monitor is not None:
+        report['predictions'] = prediction_monitor.report(windows, baseline='history')
+    return report
+
+
+def _default_value(col: str, numeric_cols, categorical_cols):
+    if col in numeric_cols:
+        return 0  # Default numeric value
+    if col in categorical_cols:
+        return 'missing'  # Default categorical value
+    # Default for any other column
+    if col.lower() in ['loan_status', 'loan amount', 'interest_rate']:
+        return 0 if 'amount' in col.lower() or 'rate' in col.lower() else 'approved'
+    return 0
+
+
+def _prepare_batch(records):
+    """Feature matrix for a list of request dicts (or a DataFrame of them), one row each.
+
+    Columns absent from every record get the same defaults a single request would.
+    """
     if preprocessor is None:
         raise RuntimeError('Preprocessor not loaded')
-    
+    df = records.copy() if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+
     # Fill missing columns with sensible defaults from config
-    filled_dict = input_dict.copy()
-    
-    # Get all expected columns from config
-    if preprocessor_config and 'all_cols' in preprocessor_config:
-        expected_cols = preprocessor_config['all_cols']
-        numeric_cols = preprocessor_config.get('numeric_cols', [])
-        categorical_cols = preprocessor_config.get('categorical_cols', [])
-        
-        # Fill missing columns with defaults
-        for col in expected_cols:
-            if col not in filled_dict:
-                if col in numeric_cols:
-                    filled_dict[col] = 0  # Default numeric value
-                elif col in categorical_cols:
-                    filled_dict[col] = 'missing'  # Default categorical value
-                else:
-                    # Default for any other column
-                    if col.lower() in ['loan_status', 'loan amount', 'interest_rate']:
-                        filled_dict[col] = 0 if 'amount' in col.lower() or 'rate' in col.lower() else 'approved'
-                    else:
-                        filled_dict[col] = 0
-    
-    df = pd.DataFrame([filled_dict])
+    config = preprocessor_config or {}
+    if 'all_cols' in config:
+        numeric_cols = config.get('numeric_cols', [])
+        categorical_cols = config.get('categorical_cols', [])
+        for col in config['all_cols']:
+            if col not in df.columns:
+                df[col] = _default_value(col, numeric_cols, categorical_cols)
+
+    # apply the same per-value string parsing and derived features that were used at training time
+    df = normalize_categoricals(df, parse=config.get('parsed_cols', []))
+    df = add_derived_features(df)
     X = preprocessor.transform(df)
     # If SVD exists and X is sparse or high-dim, apply it
     if svd is not None:
-        if sparse.issparse(X):
-            X = X
-        X_reduced = svd.transform(X)
-        return np.asarray(X_reduced)
+        return np.asarray(svd.transform(X))
     # ensure dense array for sklearn estimators
     if sparse.issparse(X):
         X = X.toarray()
     return np.asarray(X)
 
 
-def predict_classification(input_dict: dict):
+def _prepare_features(input_dict: dict):
+    # one-row batch; sklearn expects 2D
+    return _prepare_batch([input_dict])
+
+
+def score_batch(records, task: str = 'classification') -> np.ndarray:
+    """Raw model output for many requests at once: class probabilities, regression values or clusters.
+
+    Batch scoring is for offline use and is not added to the drift sketches.
+    """
+    model = {'classification': classification_model, 'regression': regression_model,
+             'clustering': clustering_model}[task]
+    if model is None:
+        raise RuntimeError(f'{task.capitalize()} model not loaded')
+    X = _prepare_batch(records)
+    if task == 'classification' and hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)
+    return np.asarray(model.predict(X))
+
+
+def predict_classification(input_dict: dict, request_id: str = None):
     if classification_model is None:
         raise RuntimeError('Classification model not loaded')
     X = _prepare_features(input_dict)
-    # sklearn expects 2D
+    _observe_inputs(input_dict, request_id)
     proba = None
     try:
+        start = time.perf_counter()
         if hasattr(classification_model, 'predict_proba'):
             proba = classification_model.predict_proba(X)[0]
-            idx = int(np.argmax(proba))
+            idx = _decide(classification_model, proba)
             label = classification_model.classes_[idx]
-            return {'loan_status': str(label), 'probability': float(proba[idx])}
+            if prediction_monitor is not None:
+                prediction_monitor.observe({'probability': float(proba[idx]), 'loan_status': str(label)})
+            result = {'loan_status': str(label), 'probability': float(proba[idx])}
         else:
             pred = classification_model.predict(X)[0]
-            return {'loan_status': str(pred), 'probability': None}
+            result = {'loan_status': str(pred), 'probability': None}
+        if shadow is not None:
+            shadow.submit('classification', X, result, (time.perf_counter() - start) * 1000)
+        return result
     except Exception as e:
         logger.error('Classification prediction error: %s', e)
         raise
 
 
-def predict_regression(input_dict: dict):
+def predict_regression(input_dict: dict, request_id: str = None):
     if regression_model is None:
         raise RuntimeError('Regression model not loaded')
     X = _prepare_features(input_dict)
+    _observe_inputs(input_dict, request_id)
     try:
-        return float(regression_model.predict(X)[0])
+        start = time.perf_counter()
+        value = float(regression_model.predict(X)[0])
+        if shadow is not None:
+            shadow.submit('regression', X, value, (time.perf_counter() - start) * 1000)
+        return value
     except Exception as e:
         logger.error('Regression prediction error: %s', e)
         raise
 
 
-def predict_cluster(input_dict: dict):
+def predict_cluster(input_dict: dict, request_id: str = None):
     if clustering_model is None:
         raise RuntimeError('Clustering model not loaded')
     X = _prepare_features(input_dict)
+    _observe_inputs(input_dict, request_id)
     try:
         return int(clustering_model.predict(X)[0])
     except Exception as e:
@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+# requests waiting for the challenger; beyond this they are dropped instead of queued
+SHADOW_QUEUE_SIZE = 1000
+# latencies kept per task for the percentiles in the report
+LATENCY_SAMPLES = 1000
+# regression predictions further apart than this share of the champion's value disagree
+REGRESSION_TOLERANCE = 0.1
+
+
+class ShadowScorer:
+    """Scores requests with challenger models on a background thread, off the request path.
+
+    ``submit`` never blocks: when the bounded queue is full the request is dropped and counted,
+    so a slow challenger cannot add latency to the champion.
+    """
+
+    def __init__(self, models: dict, decide=None, queue_size: int = SHADOW_QUEUE_SIZE):
+        self.models = models
+        # maps (model, probabilities) to the served class index, so both models use the same cutoff
+        self.decide = decide or (lambda model, proba: int(np.argmax(proba)))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {task: {'submitted': 0, 'dropped': 0, 'scored': 0, 'errors': 0, 'disagreements': 0,
+                             'abs_diff_sum': 0.0,
+                             'champion_ms': deque(maxlen=LATENCY_SAMPLES),
+                             'challenger_ms': deque(maxlen=LATENCY_SAMPLES)}
+                      for task in models}
+        self.thread = threading.Thread(target=self._work, name='shadow-scorer', daemon=True)
+        self.thread.start()
+
+    def submit(self, task: str, X, champion, champion_ms: float):
+        """Queue features ``X`` and the champion's output (label/probability dict or value) for scoring."""
+        if task not in self.models or self.stopping.is_set():
+            return
+        with self.lock:
+            self.stats[task]['submitted'] += 1
+        try:
+            self.queue.put_nowait((task, X, champion, champion_ms))
+        except queue.Full:
+            with self.lock:
+                self.stats[task]['dropped'] += 1
+
+    def stop(self, timeout: float = 1.0):
+        """Discard queued work and end the worker; never waits on a full queue."""
+        self.stopping.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                break
+        try:
+            # wakes a worker blocked on the empty queue; a worker mid-prediction sees ``stopping`` next
+            self.queue.put_nowait((None, None, None, None))
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    def _work(self):
+        while True:
+            task, X, champion, champion_ms = self.queue.get()
+            if task is None or self.stopping.is_set():
+                self.queue.task_done()
+                return
+            try:
+                self._score(task, X, champion, champion_ms)
+            except Exception as e:
+                with self.lock:
+                    self.stats[task]['errors'] += 1
+                logger.debug('Challenger failed on a %s request: %s', task, e)
+            finally:
+                self.queue.task_done()
+
+    def _score(self, task: str, X, champion, champion_ms: float):
+        model = self.models[task]
+        start = time.perf_counter()
+        if task == 'classification' and hasattr(model, 'predict_proba'):
+            proba = model.predict_proba(X)[0]
+            idx = self.decide(model, proba)
+            label, value = str(model.classes_[idx]), float(proba[idx])
+            disagree = label != champion['loan_status']
+            # compare the probability of the champion's label, not each model's own
+            classes = [str(c) for c in model.classes_]
+            own = float(proba[classes.index(champion['loan_status'])]) if champion['loan_status'] in classes else value
+            diff = abs(own - champion['probability']) if champion['probability'] is not None else 0.0
+        elif task == 'classification':
+            label = str(model.predict(X)[0])
+            disagree, diff = label != champion['loan_status'], 0.0
+        else:
+            value = float(model.predict(X)[0])
+            diff = abs(value - champion)
+            disagree = diff > REGRESSION_TOLERANCE * max(abs(champion), 1e-9)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            s = self.stats[task]
+            s['scored'] += 1
+            s['disagreements'] += int(disagree)
+            s['abs_diff_sum'] += diff
+            s['champion_ms'].append(champion_ms)
+            s['challenger_ms'].append(elapsed)
+        if disagree:
+            logger.info('Challenger disagrees on %s: champion %s, challenger %s (%.1f ms vs %.1f ms)',
+                        task, champion, label if task == 'classification' else value, elapsed, champion_ms)
+
+    def report(self) -> dict:
+        with self.lock:
+            out = {}
+            for task, s in self.stats.items():
+                scored = s['scored']
+                out[task] = {
+                    'model': type(self.models[task]).__name__,
+                    'submitted': s['submitted'], 'dropped': s['dropped'], 'scored': scored, 'errors': s['errors'],
+                    'queued': self.queue.qsize(),
+                    'disagreements': s['disagreements'],
+                    'disagreement_rate': s['disagreements'] / scored if scored else None,
+                    'mean_abs_diff': s['abs_diff_sum'] / scored if scored else None,
+                    'latency_ms': {
+                        who: ({'p50': float(np.percentile(s[f'{who}_ms'], 50)),
+                               'p99': float(np.percentile(s[f'{who}_ms'], 99))} if s[f'{who}_ms'] else None)
+                        for who in ('champion', 'challenger')},
+                }
+            return out
@@ -0,0 +1,103 @@
+"""
+Pluggable tree-ensemble backends for the classification and regression trainers.
+ - rf: scikit-learn RandomForest (default)
+ - hgb: scikit-learn HistGradientBoosting
+ - xgb: XGBoost with the CPU 'hist' tree method (optional dependency)
+Every fitted model exposes predict / predict_proba / classes_ like the forests, so
+`app/predict.py` serves whichever backend was saved.
+"""
+import logging
+import warnings
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.ensemble import (
+    RandomForestClassifier, RandomForestRegressor,
+    HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+)
+from sklearn.preprocessing import LabelEncoder
+
+logger = logging.getLogger(__name__)
+
+try:
+    from xgboost import XGBClassifier, XGBRegressor
+    XGBOOST_AVAILABLE = True
+except ImportError:
+    XGBOOST_AVAILABLE = False
+    logger.info("XGBoost not installed; the 'xgb' backend is unavailable. Install with: pip install xgboost")
+
+BACKENDS = ['rf', 'hgb', 'xgb'] if XGBOOST_AVAILABLE else ['rf', 'hgb']
+
+
+class LabelEncodedClassifier(BaseEstimator, ClassifierMixin):
+    """Fit a classifier that needs integer labels (XGBoost) while keeping the original ``classes_``."""
+
+    def __init__(self, estimator):
+        self.estimator = estimator
+
+    def fit(self, X, y):
+        self.encoder_ = LabelEncoder().fit(y)
+        self.classes_ = self.encoder_.classes_
+        self.estimator_ = clone(self.estimator).fit(X, self.encoder_.transform(y))
+        return self
+
+    def predict_proba(self, X):
+        return self.estimator_.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def make_estimator(task: str, backend: str, params: dict = None, n_jobs: int = -1):
+    """Build an unfitted ``task`` ('classifier' or 'regressor') for ``backend``."""
+    params = dict(params or {})
+    if backend == 'rf':
+        cls = RandomForestClassifier if task == 'classifier' else RandomForestRegressor
+        return cls(**params, n_jobs=n_jobs, random_state=42)
+    if backend == 'hgb':
+        # threads come from OpenMP; callers bound them with threadpoolctl
+        cls = HistGradientBoostingClassifier if task == 'classifier' else HistGradientBoostingRegressor
+        return cls(**params, random_state=42)
+    if backend == 'xgb':
+        if not XGBOOST_AVAILABLE:
+            raise ImportError("The 'xgb' backend needs xgboost. Install with: pip install xgboost")
+        if task == 'classifier':
+            return LabelEncodedClassifier(XGBClassifier(**params, tree_method='hist', n_jobs=n_jobs, random_state=42))
+        return XGBRegressor(**params, tree_method='hist', n_jobs=n_jobs, random_state=42)
+    raise ValueError(f"Unknown backend: {backend} (available: {BACKENDS})")
+
+
+# warm-start growth: add `step` trees at a time until the OOB score stops improving by `tol`
+DEFAULT_GROWTH = {'step': 10, 'max_estimators': 300, 'tol': 0.002, 'patience': 2}
+
+
+def grow_forest(forest, X, y, growth: dict = None):
+    """Grow a bagged forest in warm-start increments, stopping once the OOB score levels off.
+
+    The forest is then cut back to the fewest trees whose OOB score was within ``tol`` of the best,
+    so serving pays for no more trees than the accuracy needs. Sets ``growth_`` with the OOB curve.
+    """
+    cfg = {**DEFAULT_GROWTH, **(growth or {})}
+    forest.set_params(warm_start=True, oob_score=True, bootstrap=True, n_estimators=0)
+    curve, best, stale = [], -np.inf, 0
+    while forest.n_estimators < cfg['max_estimators'] and stale < cfg['patience']:
+        forest.set_params(n_estimators=min(forest.n_estimators + cfg['step'], cfg['max_estimators']))
+        with warnings.catch_warnings():
+            # the first few trees leave some rows without out-of-bag votes
+            warnings.simplefilter('ignore', UserWarning)
+            forest.fit(X, y)
+        score = float(forest.oob_score_)
+        curve.append([forest.n_estimators, score])
+        stale = 0 if score > best + cfg['tol'] else stale + 1
+        best = max(best, score)
+    n_trees, oob = next((n, score) for n, score in curve if score >= best - cfg['tol'])
+    forest.estimators_ = forest.estimators_[:n_trees]
+    forest.set_params(n_estimators=n_trees, warm_start=False, oob_score=False)
+    forest.oob_score_ = oob
+    # per-row OOB predictions are training-set sized; keep them out of the served artifact
+    for attr in ('oob_decision_function_', 'oob_prediction_'):
+        if hasattr(forest, attr):
+            delattr(forest, attr)
+    forest.growth_ = {'n_estimators': n_trees, 'oob_curve': curve, 'stopped_early': stale >= cfg['patience'],
+                      **cfg}
+    return forest
@@ -0,0 +1,110 @@
+"""
+Per-stage checkpoints so an interrupted prepare/train run can resume where it stopped.
+
+Every completed stage writes a marker `data/processed/checkpoints/<run>.<stage>.done.json` with the
+stage's input key and the size and SHA-256 of each artifact it produced. A resumed run skips a stage
+only when its key is unchanged and every artifact still matches the marker. Downstream keys include
+the upstream stage's ``fingerprint``, so re-running a stage that produces different output invalidates
+everything after it. Markers and intermediate results are written to a temporary file and renamed into
+place, so a crash never leaves a half-written checkpoint behind.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+
+CHECKPOINT_DIR = Path(__file__).resolve().parents[1] / 'data' / 'processed' / 'checkpoints'
+# read once at import: os.umask can only be queried by setting it, which is not thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(path, write):
+    """Call ``write(tmp_path)`` and rename the result onto ``path`` (same directory, so the rename is atomic)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        # mkstemp creates the file 0600; keep the mode a plain open() would give, so other users can load it
+        os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def file_digest(path, chunk_size: int = 1 << 20) -> dict:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return {'size': os.path.getsize(path), 'sha256': h.hexdigest()}
+
+
+def source_key(path) -> dict:
+    """Cheap identity of an input file (size and modification time)."""
+    stat = Path(path).stat()
+    return {'path': str(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class Checkpoints:
+    """Completion markers and intermediate results for the stages of one run ('prepare' or 'train')."""
+
+    def __init__(self, run: str, resume: bool = False, directory: Path = None):
+        self.run = run
+        self.resume = resume
+        self.directory = Path(directory or CHECKPOINT_DIR)
+
+    def _marker(self, stage: str) -> Path:
+        return self.directory / f'{self.run}.{stage}.done.json'
+
+    def path(self, name: str) -> Path:
+        """Location of an intermediate result saved with ``save``."""
+        return self.directory / f'{self.run}.{name}.joblib'
+
+    def save(self, name: str, obj) -> Path:
+        path = self.path(name)
+        atomic_write(path, lambda tmp: joblib.dump(obj, tmp))
+        return path
+
+    def load(self, name: str):
+        return joblib.load(self.path(name))
+
+    def _read(self, stage: str):
+        marker = self._marker(stage)
+        return json.loads(marker.read_text()) if marker.exists() else None
+
+    def done(self, stage: str, key) -> bool:
+        """True when resuming and ``stage`` completed with the same key and untouched artifacts."""
+        if not self.resume:
+            return False
+        record = self._read(stage)
+        if record is None or record['key'] != joblib.hash(key):
+            return False
+        for path, digest in record['artifacts'].items():
+            if not os.path.exists(path) or file_digest(path) != digest:
+                print(f'Checkpoint {self.run}.{stage}: {path} changed or is missing; re-running')
+                return False
+        print(f'Checkpoint {self.run}.{stage}: complete, skipping')
+        return True
+
+    def complete(self, stage: str, key, artifacts):
+        """Record ``stage`` as done; call only after every artifact has been fully written."""
+        record = {
+            'stage': stage,
+            'key': joblib.hash(key),
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'artifacts': {str(p): file_digest(p) for p in artifacts},
+        }
+        atomic_write(self._marker(stage), lambda tmp: Path(tmp).write_text(json.dumps(record, indent=2)))
+
+    def fingerprint(self, stage: str) -> str:
+        """Hash of a completed stage's key and outputs, for use in downstream keys."""
+        record = self._read(stage)
+        return joblib.hash([record['key'], record['artifacts']]) if record else None
@@ -0,0 +1,79 @@
+"""
+Customer segmentation engines for the PCA-reduced feature matrix.
+
+ - kmeans: full-batch KMeans (Lloyd), fine for small portfolios
+ - minibatch: MiniBatchKMeans, linear in rows; every update only touches one batch
+ - auto: kmeans below ``MINIBATCH_MIN_ROWS`` rows, minibatch above
+
+With ``k_values`` set, one model per k is fitted in parallel and the k with the best sampled
+silhouette is kept. Scores never look at all pairs of points (see ``ml.evaluate.clustering_metrics``).
+"""
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from .evaluate import SILHOUETTE_SAMPLE, clustering_metrics
+from .parallel import resolve_workers
+
+MINIBATCH_MIN_ROWS = 10000
+
+DEFAULT_CLUSTERING = {
+    'method': 'auto',
+    'n_clusters': 5,
+    # candidate k values to compare (None fits n_clusters only)
+    'k_values': None,
+    'n_init': 5,
+    # minibatch
+    'batch_size': 4096,
+    'max_no_improvement': 10,
+    'silhouette_sample': SILHOUETTE_SAMPLE,
+    'random_state': 42,
+}
+
+
+def resolve_config(config: dict = None) -> dict:
+    cfg = dict(DEFAULT_CLUSTERING)
+    if config:
+        unknown = set(config) - set(DEFAULT_CLUSTERING)
+        if unknown:
+            raise ValueError(f"Unknown clustering options: {sorted(unknown)}")
+        cfg.update(config)
+    return cfg
+
+
+def build_clusterer(n_clusters: int, config: dict, n_rows: int):
+    cfg = resolve_config(config)
+    method = cfg['method']
+    if method == 'auto':
+        method = 'minibatch' if n_rows >= MINIBATCH_MIN_ROWS else 'kmeans'
+    if method == 'kmeans':
+        return KMeans(n_clusters=n_clusters, n_init=cfg['n_init'], random_state=cfg['random_state'])
+    if method == 'minibatch':
+        return MiniBatchKMeans(n_clusters=n_clusters, n_init=cfg['n_init'], batch_size=cfg['batch_size'],
+                               max_no_improvement=cfg['max_no_improvement'], random_state=cfg['random_state'])
+    raise ValueError(f"Unknown clustering method: {method}")
+
+
+def _fit_k(X, k: int, cfg: dict):
+    start = time.perf_counter()
+    model = build_clusterer(k, cfg, X.shape[0]).fit(X)
+    elapsed = time.perf_counter() - start
+    scores = clustering_metrics(X, model.labels_, inertia=model.inertia_, sample_size=cfg['silhouette_sample'])
+    return model, {'k': k, 'method': type(model).__name__, 'fit_seconds': round(elapsed, 4), **scores}
+
+
+def fit_clusterer(X, config: dict = None, n_jobs: int = None):
+    """Fit the configured engine on ``X`` and return ``(model, selection)``.
+
+    ``selection`` has one score record per candidate k (fitted ``n_jobs`` at a time) and the chosen k.
+    """
+    cfg = resolve_config(config)
+    k_values = sorted({min(k, X.shape[0]) for k in (cfg['k_values'] or [cfg['n_clusters']])})
+    workers = min(resolve_workers(n_jobs), len(k_values))
+    results = Parallel(n_jobs=workers)(delayed(_fit_k)(X, k, cfg) for k in k_values)
+    # highest sampled silhouette wins; ties go to fewer clusters
+    best = max(range(len(results)), key=lambda i: (results[i][1]['silhouette'] or -1.0, -k_values[i]))
+    model = results[best][0]
+    return model, {'chosen_k': int(model.n_clusters), 'candidates': [r for _, r in results]}
@@ -0,0 +1,85 @@
+"""
+Parallel k-fold cross-validation over the shared training matrix.
+
+Fold indices come from ``TrainingData.folds`` (built once per target), workers receive the
+memory-mapped feature matrix by reference plus their row indices, and every (model config, fold)
+result is cached in `data/processed/cv_cache/` keyed by the processed data, the fold layout and
+the estimator's parameters, so re-running CV only fits what changed.
+"""
+import json
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from threadpoolctl import threadpool_limits
+
+from .evaluate import classification_metrics, regression_metrics
+from .parallel import limit_threads, resolve_workers
+
+CACHE_DIR = Path(__file__).resolve().parents[1] / 'data' / 'processed' / 'cv_cache'
+
+
+def model_config(estimator) -> dict:
+    """Parameters that determine an estimator's predictions (thread counts and nested objects left out)."""
+    return {'class': type(estimator).__name__,
+            **{k: v for k, v in estimator.get_params(deep=True).items()
+               if k.split('__')[-1] != 'n_jobs' and not hasattr(v, 'get_params')}}
+
+
+def _score_fold(estimator, X, y, train_rows, test_rows, classification: bool, threads: int) -> dict:
+    start = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        model = clone(estimator).fit(X[train_rows], y[train_rows])
+    fit_seconds = time.perf_counter() - start
+    pred = model.predict(X[test_rows])
+    metrics = classification_metrics if classification else regression_metrics
+    return {**metrics(y[test_rows], pred), 'fit_seconds': round(fit_seconds, 4)}
+
+
+def cross_validate(data, target: str, candidates: dict, n_folds: int = 5, n_jobs: int = -1,
+                   random_state: int = 42, cache_dir: Path = None) -> dict:
+    """Score every candidate on every fold of ``target`` and return per-fold, mean and std metrics.
+
+    All (candidate, fold) fits not found in the cache run concurrently; each gets
+    ``budget // concurrent`` threads for its own pools.
+    """
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    folds = data.folds(target, n_folds, random_state)
+    y = data.target(target)
+    data_key = data.cache_key or joblib.hash(np.asarray(data.X))
+    classification = target == 'loan_status'
+
+    results, pending = {}, []
+    for name, estimator in candidates.items():
+        config = model_config(estimator)
+        results[name] = {'config': config, 'folds': [None] * len(folds), 'cached_folds': 0}
+        for i, (train_rows, test_rows) in enumerate(folds):
+            path = cache_dir / f"{joblib.hash([data_key, target, n_folds, random_state, i, config])}.json"
+            if path.exists():
+                results[name]['folds'][i] = json.loads(path.read_text())
+                results[name]['cached_folds'] += 1
+            else:
+                pending.append((name, i, path, clone(estimator), train_rows, test_rows))
+
+    budget = resolve_workers(n_jobs)
+    concurrent = max(1, min(budget, len(pending)))
+    threads = max(1, budget // concurrent)
+    for _, _, _, estimator, _, _ in pending:
+        limit_threads(estimator, threads)
+    scores = Parallel(n_jobs=concurrent)(
+        delayed(_score_fold)(estimator, data.X, y, train_rows, test_rows, classification, threads)
+        for _, _, _, estimator, train_rows, test_rows in pending)
+    for (name, i, path, _, _, _), score in zip(pending, scores):
+        path.write_text(json.dumps(score))
+        results[name]['folds'][i] = score
+
+    for result in results.values():
+        keys = [k for k in result['folds'][0] if k != 'fit_seconds']
+        values = {k: np.array([f[k] for f in result['folds']]) for k in keys}
+        result['mean'] = {k: float(v.mean()) for k, v in values.items()}
+        result['std'] = {k: float(v.std(ddof=1)) if len(v) > 1 else 0.0 for k, v in values.items()}
+    return results
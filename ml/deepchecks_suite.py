@@ -11,6 +11,10 @@ from sklearn.model_selection import train_test_split
 import joblib
 import logging
 
+from .drift import build_reference_profile, detect_drift, load_reference_profile
+from .integrity import default_schema, scan_csv, scan_frame
+from .leakage import DEFAULT_THRESHOLD, screen_leakage
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -22,34 +26,32 @@ except ImportError:
     logger.warning("DeepChecks not installed. Install with: pip install deepchecks")
 
 
-def run_data_integrity_checks(df: pd.DataFrame, output_dir: str = "data/processed/deepchecks") -> dict:
-    """Run DeepChecks data integrity suite."""
+def run_data_integrity_checks(data, output_dir: str = "data/processed/deepchecks", chunk_size: int = None,
+                              duplicates: str = "exact") -> dict:
+    """Run single-pass integrity checks on a DataFrame or a CSV path (streamed; see ``ml.integrity``)."""
     logger.info("Running data integrity checks...")
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    if not DEEPCHECKS_AVAILABLE:
-        logger.warning("DeepChecks not available. Skipping detailed checks.")
-        return {"status": "skipped", "reason": "deepchecks not installed"}
-    
     try:
-        # Basic checks (can be run without DeepChecks)
-        checks = {
-            "null_count": int(df.isnull().sum().sum()),
-            "duplicate_rows": int(df.duplicated().sum()),
-            "numeric_columns": int(df.select_dtypes(include=[np.number]).shape[1]),
-            "categorical_columns": int(df.select_dtypes(include=['object']).shape[1]),
-            "rows": df.shape[0],
-            "columns": df.shape[1],
-        }
+        if isinstance(data, pd.DataFrame):
+            checks = scan_frame(data, default_schema(data.columns), duplicates=duplicates, chunk_size=chunk_size)
+        else:
+            checks = scan_csv(data, duplicates=duplicates, chunk_size=chunk_size or 100_000)
         
         logger.info(f"  - Null values: {checks['null_count']}")
-        logger.info(f"  - Duplicate rows: {checks['duplicate_rows']}")
+        logger.info(f"  - Duplicate rows: {checks['duplicate_rows']} ({checks['duplicate_mode']})")
         logger.info(f"  - Columns: {checks['columns']} (numeric: {checks['numeric_columns']}, categorical: {checks['categorical_columns']})")
+        for col, n in checks['dtype_violations'].items():
+            logger.warning(f"  - {col}: {n} values do not match the schema type")
+        for col, n in checks['out_of_range'].items():
+            logger.warning(f"  - {col}: {n} values outside the schema range")
         
         # Save results
         with open(f"{output_dir}/data_integrity_checks.json", 'w') as f:
             json.dump(checks, f, indent=2)
         
+        if not checks['passed']:
+            raise ValueError(f"Data integrity checks failed: {checks['errors']}")
         logger.info("✓ Data integrity checks passed")
         return checks
         
@@ -58,34 +60,17 @@ def run_data_integrity_checks(df: pd.DataFrame, output_dir: str = "data/processe
         raise
 
 
-def run_label_leakage_check(X: pd.DataFrame, y: pd.Series, output_dir: str = "data/processed/deepchecks") -> dict:
-    """Check for label leakage in features."""
+def run_label_leakage_check(X: pd.DataFrame, y: pd.Series, output_dir: str = "data/processed/deepchecks",
+                            threshold: float = DEFAULT_THRESHOLD, chunk_size: int = None) -> dict:
+    """Check every feature (numeric and categorical) for leakage of the label; see ``ml.leakage``."""
     logger.info("Checking for label leakage...")
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
     try:
-        results = {
-            "feature_target_correlation": {},
-            "high_correlation_features": []
-        }
-        
-        # Calculate correlation with target
-        for col in X.columns:
-            try:
-                if X[col].dtype in [np.float64, np.int64]:
-                    corr = X[col].corr(y)
-                    results["feature_target_correlation"][col] = float(corr)
-                    
-                    # Flag high correlations (potential leakage)
-                    if abs(corr) > 0.95:
-                        results["high_correlation_features"].append({
-                            "column": col,
-                            "correlation": float(corr),
-                            "risk": "HIGH - Possible label leakage"
-                        })
-            except:
-                pass
+        results = screen_leakage(X, y, threshold=threshold, chunk_size=chunk_size)
         
+        for col, reason in results["skipped"].items():
+            logger.warning(f"Leakage screen skipped {col}: {reason}")
         if results["high_correlation_features"]:
             logger.warning(f"⚠ Potential label leakage detected in {len(results['high_correlation_features'])} features")
         else:
@@ -101,43 +86,21 @@ def run_label_leakage_check(X: pd.DataFrame, y: pd.Series, output_dir: str = "da
         raise
 
 
-def run_drift_detection(train_df: pd.DataFrame, test_df: pd.DataFrame, output_dir: str = "data/processed/deepchecks") -> dict:
-    """Detect data drift between train and test sets."""
+def run_drift_detection(train_df: pd.DataFrame = None, test_df: pd.DataFrame = None,
+                        output_dir: str = "data/processed/deepchecks", profile: dict = None,
+                        chunk_size: int = None) -> dict:
+    """Detect data drift of ``test_df`` against a reference profile (PSI, KS, chi-square; see ``ml.drift``).
+    
+    The reference is ``profile`` when given, else one built from ``train_df``, else the profile
+    saved by ``ml.prepare_data``.
+    """
     logger.info("Detecting data drift...")
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
     try:
-        drift_report = {
-            "numeric_drift": {},
-            "columns_with_drift": []
-        }
-        
-        numeric_cols = train_df.select_dtypes(include=[np.number]).columns
-        
-        for col in numeric_cols:
-            train_mean = train_df[col].mean()
-            test_mean = test_df[col].mean()
-            train_std = train_df[col].std()
-            
-            # Calculate drift as % change
-            if train_std > 0:
-                drift = abs((test_mean - train_mean) / train_std)
-            else:
-                drift = 0
-            
-            drift_report["numeric_drift"][col] = {
-                "train_mean": float(train_mean),
-                "test_mean": float(test_mean),
-                "drift_magnitude": float(drift)
-            }
-            
-            # Flag significant drift (>0.5 std dev)
-            if drift > 0.5:
-                drift_report["columns_with_drift"].append({
-                    "column": col,
-                    "drift": float(drift),
-                    "status": "WARN" if drift < 1.0 else "ALERT"
-                })
+        if profile is None:
+            profile = build_reference_profile(train_df) if train_df is not None else load_reference_profile()
+        drift_report = detect_drift(test_df, profile, chunk_size=chunk_size)
         
         if drift_report["columns_with_drift"]:
             logger.warning(f"⚠ Data drift detected in {len(drift_report['columns_with_drift'])} columns")
@@ -0,0 +1,276 @@
+"""
+Drift detection against a saved reference profile.
+
+``build_reference_profile`` summarises the training frame once: quantile bin edges and counts for
+numeric features, and counts of the most frequent values (plus an '__other__' bucket) for
+categoricals. Each feature also has a trailing missing-value bin. The profile is saved as
+`models/reference_profile.json` next to the models. ``DriftAccumulator`` bins new data against the
+profile, chunk by chunk, into one (feature x bin) count matrix. PSI, KS and chi-square are then
+computed for every feature at once from the reference and current matrices, so checking a new
+batch of loans never needs the training set. KS is computed on the reference bins, which gives a
+lower bound of the exact statistic. ``WindowedSketch`` keeps the same bins for live traffic over a
+ring of time windows, for the serving layer's drift endpoint.
+"""
+import bisect
+import json
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .checkpoints import atomic_write
+
+REFERENCE_PROFILE_PATH = Path(__file__).resolve().parents[1] / 'models' / 'reference_profile.json'
+DEFAULT_BINS = 10
+MAX_CATEGORIES = 50
+OTHER = '__other__'
+# proportions are floored at this value so an empty bin does not make PSI infinite
+EPSILON = 1e-4
+# conventional PSI bands: below WARN is stable, above ALERT is a significant shift
+PSI_WARN, PSI_ALERT = 0.1, 0.25
+
+
+def _n_bins(feature: dict) -> int:
+    """Bins of a profiled feature, including the trailing missing-value bin."""
+    if feature['type'] == 'numeric':
+        return len(feature['edges']) + 2
+    return len(feature['categories']) + 2
+
+
+class DriftAccumulator:
+    """Bins rows against a reference profile into a (feature x bin) count matrix."""
+
+    def __init__(self, profile: dict):
+        features = profile['features']
+        self.profile = profile
+        self.numeric = [c for c, f in features.items() if f['type'] == 'numeric']
+        self.categorical = [c for c, f in features.items() if f['type'] == 'categorical']
+        self.names = self.numeric + self.categorical
+        self.n_bins = np.array([_n_bins(features[c]) for c in self.names], dtype=np.int64)
+        self.width = int(self.n_bins.max()) if self.names else 1
+        self.counts = np.zeros((len(self.names), self.width), dtype=np.int64)
+        self.rows = 0
+        # numeric edges padded with +inf so every column can be binned in one comparison
+        k = max((len(features[c]['edges']) for c in self.numeric), default=0)
+        self.edges = np.full((len(self.numeric), k), np.inf)
+        for i, col in enumerate(self.numeric):
+            self.edges[i, :len(features[col]['edges'])] = features[col]['edges']
+        self.lookup = {c: {v: i for i, v in enumerate(features[c]['categories'])} for c in self.categorical}
+
+    def update(self, chunk: pd.DataFrame):
+        """Add the rows of ``chunk``; profiled columns it lacks count as missing."""
+        self.rows += len(chunk)
+        p = len(self.numeric)
+        if p:
+            values = chunk.reindex(columns=self.numeric).to_numpy(dtype=float)
+            bins = (values[:, :, None] >= self.edges[None]).sum(axis=2)
+            bins = np.where(np.isnan(values), self.n_bins[:p] - 1, bins) + np.arange(p) * self.width
+            self.counts[:p] += np.bincount(bins.ravel(), minlength=p * self.width).reshape(p, self.width)
+        for i, col in enumerate(self.categorical, start=p):
+            codes, uniques = pd.factorize(chunk[col] if col in chunk.columns else pd.Series(np.nan, index=chunk.index))
+            lookup = self.lookup[col]
+            other = len(lookup)
+            # one lookup per distinct value; code -1 (missing) lands on the trailing slot
+            slots = np.array([lookup.get(str(v), other) for v in uniques] + [other + 1], dtype=np.int64)
+            self.counts[i, :other + 2] += np.bincount(slots[codes], minlength=other + 2)
+        return self
+
+    def result(self) -> dict:
+        reference = np.zeros_like(self.counts)
+        for i, col in enumerate(self.names):
+            ref = self.profile['features'][col]['counts']
+            reference[i, :len(ref)] = ref
+        return compare_counts(reference, self.counts, self.n_bins, self.names, len(self.numeric),
+                              reference_rows=self.profile['rows'])
+
+
+def compare_counts(reference: np.ndarray, current: np.ndarray, n_bins: np.ndarray, names: list,
+                   n_numeric: int, reference_rows: int = None) -> dict:
+    """PSI, KS and chi-square for every feature (row) of two aligned count matrices.
+
+    The first ``n_numeric`` rows are ordered numeric bins (KS applies); the last valid bin of every
+    row holds missing values.
+    """
+    rows = int(current[0].sum()) if len(current) else 0
+    report = {'reference_rows': reference_rows, 'rows': rows, 'features': {}, 'columns_with_drift': [],
+              'max_psi': None}
+    # nothing to compare until both sides have rows (e.g. no earlier windows yet)
+    if not rows or not names or not reference[0].sum():
+        return report
+    width = reference.shape[1]
+    valid = np.arange(width)[None, :] < n_bins[:, None]
+
+    def proportions(counts):
+        share = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+        share = np.where(valid, np.maximum(share, EPSILON), 0.0)
+        return share / share.sum(axis=1, keepdims=True)
+
+    p, q = proportions(reference), proportions(current)
+    psi = ((q - p) * np.log(np.divide(q, p, out=np.ones_like(q), where=valid))).sum(axis=1)
+
+    n_cur = current.sum(axis=1, keepdims=True)
+    expected = np.where(valid, p * n_cur, 1.0)
+    chi2 = np.where(valid, (current - expected) ** 2 / expected, 0.0).sum(axis=1)
+    chi2_p = stats.chi2.sf(chi2, np.maximum(n_bins - 1, 1))
+
+    # KS over the value bins of numeric features, ignoring the missing bin
+    value_bins = np.arange(width)[None, :] < (n_bins - 1)[:, None]
+    ref_values, cur_values = np.where(value_bins, reference, 0), np.where(value_bins, current, 0)
+    n_ref, n_new = ref_values.sum(axis=1), cur_values.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdf_gap = np.abs(np.cumsum(ref_values, axis=1) / n_ref[:, None] - np.cumsum(cur_values, axis=1) / n_new[:, None])
+        ks = np.where(value_bins, np.nan_to_num(cdf_gap), 0.0).max(axis=1)
+        ks_p = stats.kstwobign.sf(ks * np.sqrt(n_ref * n_new / (n_ref + n_new)))
+    missing_ref = reference[np.arange(len(names)), n_bins - 1] / np.maximum(reference.sum(axis=1), 1)
+    missing_cur = current[np.arange(len(names)), n_bins - 1] / np.maximum(n_cur[:, 0], 1)
+
+    for i, col in enumerate(names):
+        numeric = i < n_numeric and n_ref[i] > 0 and n_new[i] > 0
+        status = 'ALERT' if psi[i] >= PSI_ALERT else 'WARN' if psi[i] >= PSI_WARN else 'OK'
+        report['features'][col] = {
+            'type': 'numeric' if i < n_numeric else 'categorical',
+            'psi': round(float(psi[i]), 6),
+            'ks': round(float(ks[i]), 6) if numeric else None,
+            'ks_pvalue': float(ks_p[i]) if numeric else None,
+            'chi2': round(float(chi2[i]), 4),
+            'chi2_pvalue': float(chi2_p[i]),
+            'missing_reference': round(float(missing_ref[i]), 6),
+            'missing_current': round(float(missing_cur[i]), 6),
+            'status': status,
+        }
+        if status != 'OK':
+            report['columns_with_drift'].append({'column': col, 'psi': round(float(psi[i]), 6), 'status': status})
+    report['columns_with_drift'].sort(key=lambda d: -d['psi'])
+    report['max_psi'] = round(float(psi.max()), 6)
+    return report
+
+
+def build_reference_profile(df: pd.DataFrame, numeric_cols=None, categorical_cols=None,
+                            n_bins: int = DEFAULT_BINS, max_categories: int = MAX_CATEGORIES) -> dict:
+    """Quantile bins of numeric columns and top-category counts of categoricals, from one frame."""
+    if numeric_cols is None:
+        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    if categorical_cols is None:
+        categorical_cols = [c for c in df.columns if c not in numeric_cols]
+    features = {}
+    if numeric_cols:
+        values = df[numeric_cols].to_numpy(dtype=float)
+        with warnings.catch_warnings():
+            # all-missing columns get no edges (a single value bin)
+            warnings.simplefilter('ignore', RuntimeWarning)
+            edges = np.nanquantile(values, np.linspace(0, 1, n_bins + 1)[1:-1], axis=0)
+        for j, col in enumerate(numeric_cols):
+            column_edges = np.unique(edges[:, j][~np.isnan(edges[:, j])])
+            features[col] = {'type': 'numeric', 'edges': column_edges.tolist()}
+    for col in categorical_cols:
+        top = df[col].value_counts(dropna=True).index[:max_categories]
+        features[col] = {'type': 'categorical', 'categories': [str(v) for v in top]}
+
+    profile = {'rows': int(len(df)), 'n_bins': n_bins, 'features': features}
+    acc = DriftAccumulator(profile).update(df)
+    for i, col in enumerate(acc.names):
+        features[col]['counts'] = acc.counts[i, :acc.n_bins[i]].tolist()
+    return profile
+
+
+def save_reference_profile(profile: dict, path=None) -> Path:
+    path = Path(path or REFERENCE_PROFILE_PATH)
+    atomic_write(path, lambda tmp: Path(tmp).write_text(json.dumps(profile)))
+    return path
+
+
+def load_reference_profile(path=None) -> dict:
+    path = Path(path or REFERENCE_PROFILE_PATH)
+    if not path.exists():
+        raise FileNotFoundError(f"No reference profile at {path}; run ml.prepare_data first")
+    return json.loads(path.read_text())
+
+
+def detect_drift(df: pd.DataFrame, profile: dict, chunk_size: int = None) -> dict:
+    """Compare ``df`` with ``profile``, optionally ``chunk_size`` rows at a time."""
+    acc = DriftAccumulator(profile)
+    step = chunk_size or max(len(df), 1)
+    for start in range(0, len(df), step):
+        acc.update(df.iloc[start:start + step])
+    return acc.result()
+
+
+def detect_drift_chunks(chunks, profile: dict) -> dict:
+    """Compare an iterable of DataFrames (e.g. ``pd.read_csv(..., chunksize=...)``) with ``profile``."""
+    acc = DriftAccumulator(profile)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc.result()
+
+
+class WindowedSketch:
+    """Fixed-memory bin counts of live rows over a ring of ``n_windows`` time windows.
+
+    ``observe`` bins one row with ``bisect``/dict lookups and bumps one counter per feature, so it
+    is cheap enough for the request path. Windows older than the ring are overwritten in place.
+    """
+
+    def __init__(self, profile: dict, features=None, window_seconds: int = 3600, n_windows: int = 24):
+        features = [c for c in profile['features'] if features is None or c in features]
+        self.profile = {**profile, 'features': {c: profile['features'][c] for c in features}}
+        layout = DriftAccumulator(self.profile)
+        self.names, self.n_numeric = layout.names, len(layout.numeric)
+        self.n_bins, self.width = layout.n_bins, layout.width
+        self.edges = [self.profile['features'][c]['edges'] for c in layout.numeric]
+        self.lookup = [layout.lookup[c] for c in layout.categorical]
+        self.window_seconds, self.n_windows = window_seconds, n_windows
+        self.counts = np.zeros((n_windows, len(self.names), self.width), dtype=np.int64)
+        self.epochs = np.full(n_windows, -1, dtype=np.int64)
+        self._rows = np.arange(len(self.names))
+        self._lock = threading.Lock()
+
+    def _bins(self, row: dict) -> np.ndarray:
+        bins = np.empty(len(self.names), dtype=np.int64)
+        for i, col in enumerate(self.names):
+            value = row.get(col)
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                bins[i] = self.n_bins[i] - 1
+            elif i < self.n_numeric:
+                bins[i] = bisect.bisect_right(self.edges[i], value)
+            else:
+                lookup = self.lookup[i - self.n_numeric]
+                bins[i] = lookup.get(str(value), len(lookup))
+        return bins
+
+    def observe(self, row: dict, now: float = None):
+        """Count one row (``{feature: raw value}``; absent or None values count as missing)."""
+        bins = self._bins(row)
+        epoch = int((time.time() if now is None else now) // self.window_seconds)
+        slot = epoch % self.n_windows
+        with self._lock:
+            if self.epochs[slot] != epoch:
+                self.counts[slot] = 0
+                self.epochs[slot] = epoch
+            self.counts[slot, self._rows, bins] += 1
+
+    def window_counts(self, windows: int = 1, now: float = None, skip: int = 0) -> np.ndarray:
+        """Counts of the latest ``windows`` windows, after skipping the ``skip`` most recent ones."""
+        epoch = int((time.time() if now is None else now) // self.window_seconds) - skip
+        with self._lock:
+            recent = (self.epochs > epoch - windows) & (self.epochs <= epoch)
+            return self.counts[recent].sum(axis=0)
+
+    def report(self, windows: int = 1, now: float = None, baseline: str = 'profile') -> dict:
+        """Compare the latest ``windows`` windows with the reference profile or, with
+        ``baseline='history'``, with all older windows still in the ring."""
+        current = self.window_counts(windows, now)
+        if baseline == 'history':
+            reference = self.window_counts(self.n_windows, now, skip=windows)
+        else:
+            reference = np.zeros_like(current)
+            for i, col in enumerate(self.names):
+                ref = self.profile['features'][col]['counts']
+                reference[i, :len(ref)] = ref
+        report = compare_counts(reference, current, self.n_bins, self.names, self.n_numeric,
+                                reference_rows=int(reference[0].sum()) if len(reference) else 0)
+        report.update({'baseline': baseline, 'windows': windows, 'window_seconds': self.window_seconds})
+        return report
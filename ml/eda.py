@@ -1,61 +1,243 @@
 """
 Basic EDA for `data/bank_loan.csv`.
 Saves summary JSON and basic histograms to `data/processed/`.
+
+The summary comes from one pass over the data (``EdaAccumulator``, fed chunk by chunk when the
+CSV is streamed): missing counts, moments, pairwise-complete correlations and a fine histogram
+per numeric column. Quartiles are read off the fine histogram, so they are exact to within
+1/``FINE_BINS`` of the column's range. Plots are drawn from the precomputed bin counts in a
+process pool, so no figure ever touches the raw rows.
 """
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+from .parallel import resolve_workers
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_PATH = PROJECT_ROOT / "data" / "bank_loan.csv"
 OUT_DIR = PROJECT_ROOT / "data" / "processed"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
+# fine bins per column; plots merge them into about PLOT_BINS bars
+FINE_BINS = 2000
+PLOT_BINS = 50
+CHUNK_SIZE = 100_000
+
+
+class EdaAccumulator:
+    """Missing counts, moments, correlations and histograms of numeric columns, chunk by chunk."""
+
+    def __init__(self, fine_bins: int = FINE_BINS):
+        self.fine_bins = fine_bins
+        self.columns = None
+
+    def _init(self, chunk: pd.DataFrame):
+        self.columns = list(chunk.columns)
+        self.dtypes = {c: str(chunk[c].dtype) for c in self.columns}
+        self.numeric = chunk.select_dtypes(include=['number']).columns.tolist()
+        p = len(self.numeric)
+        self.rows = 0
+        self.missing = np.zeros(len(self.columns), dtype=np.int64)
+        values = self._values(chunk)
+        # sums are taken around the first chunk's means to keep them well conditioned
+        self.shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(p)
+        self.powers = np.zeros((4, p))
+        self.low, self.high = np.full(p, np.inf), np.full(p, -np.inf)
+        self.pair_n, self.pair_sum, self.pair_sq, self.cross = (np.zeros((p, p)) for _ in range(4))
+        # fine histogram per column over [origin, origin + fine_bins * width), widened by merging bins
+        self.origin, self.width = None, None
+        self.hist = np.zeros((p, self.fine_bins), dtype=np.int64)
+
+    def _values(self, chunk: pd.DataFrame) -> np.ndarray:
+        return chunk[self.numeric].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+    def update(self, chunk: pd.DataFrame):
+        if self.columns is None:
+            self._init(chunk)
+        chunk = chunk.reindex(columns=self.columns)
+        self.rows += len(chunk)
+        self.missing += chunk.isna().sum().to_numpy()
+        values = self._values(chunk)
+        if not self.numeric or not len(values):
+            return self
+        valid = ~np.isnan(values)
+        centred = np.where(valid, values - self.shift, 0.0)
+        mask = valid.astype(float)
+        for k in range(4):
+            self.powers[k] += (centred ** (k + 1)).sum(axis=0)
+        self.low = np.minimum(self.low, np.where(valid, values, np.inf).min(axis=0))
+        self.high = np.maximum(self.high, np.where(valid, values, -np.inf).max(axis=0))
+        # pairwise-complete correlation sums: entry (i, j) only counts rows where both are present
+        self.pair_n += mask.T @ mask
+        self.pair_sum += centred.T @ mask
+        self.pair_sq += (centred ** 2).T @ mask
+        self.cross += centred.T @ centred
+        self._histogram(values, valid)
+        return self
+
+    def _histogram(self, values: np.ndarray, valid: np.ndarray):
+        if self.origin is None:
+            low, high = np.nan_to_num(self.low), np.nan_to_num(self.high)
+            span = np.where(np.isfinite(self.high) & (self.high > self.low), high - low, 1.0)
+            self.origin = np.where(np.isfinite(self.low), low, 0.0)
+            self.width = span * (1 + 1e-9) / self.fine_bins
+        for j in np.flatnonzero(np.isfinite(self.low)):
+            self._cover(j, self.low[j], self.high[j])
+        p, bins = len(self.numeric), self.fine_bins
+        filled = np.where(valid, values, self.origin)
+        idx = np.clip(((filled - self.origin) / self.width).astype(np.int64), 0, bins - 1)
+        flat = (idx + np.arange(p) * bins)[valid]
+        self.hist += np.bincount(flat, minlength=p * bins).reshape(p, bins)
+
+    def _cover(self, j: int, low: float, high: float):
+        """Double the bin width of column ``j`` (merging bin pairs) until [low, high] fits."""
+        bins = self.fine_bins
+        while low < self.origin[j] or high >= self.origin[j] + bins * self.width[j]:
+            merged = self.hist[j].reshape(bins // 2, 2).sum(axis=1)
+            self.hist[j] = 0
+            if low < self.origin[j]:
+                # grow to the left: the old range becomes the upper half
+                self.origin[j] -= bins * self.width[j]
+                self.hist[j, bins // 2:] = merged
+            else:
+                self.hist[j, :bins // 2] = merged
+            self.width[j] *= 2
+
+    def quantiles(self, qs) -> np.ndarray:
+        """(len(qs), p) quantiles interpolated within the fine bins."""
+        out = np.full((len(qs), len(self.numeric)), np.nan)
+        for j in range(len(self.numeric)):
+            cum = np.cumsum(self.hist[j])
+            if not cum[-1]:
+                continue
+            edges = self.origin[j] + self.width[j] * np.arange(self.fine_bins + 1)
+            positions = np.concatenate([[0], cum]) / cum[-1]
+            out[:, j] = np.clip(np.interp(qs, positions, edges), self.low[j], self.high[j])
+        return out
 
+    def plot_bins(self, j: int, target: int = PLOT_BINS):
+        """Edges and counts of column ``j`` merged into about ``target`` bars over the observed range."""
+        nonzero = np.flatnonzero(self.hist[j])
+        if not len(nonzero):
+            return [], []
+        first, last = nonzero[0], nonzero[-1] + 1
+        group = max(1, int(np.ceil((last - first) / target)))
+        last = first + group * int(np.ceil((last - first) / group))
+        counts = np.zeros(last - first, dtype=np.int64)
+        available = self.hist[j, first:min(last, self.fine_bins)]
+        counts[:len(available)] = available
+        counts = counts.reshape(-1, group).sum(axis=1)
+        edges = self.origin[j] + self.width[j] * np.arange(first, last + 1, group)
+        return edges.tolist(), counts.tolist()
 
-def summarize(df: pd.DataFrame) -> dict:
-    summary = {}
-    summary['shape'] = df.shape
-    summary['columns'] = list(df.columns)
-    summary['dtypes'] = {c: str(df[c].dtype) for c in df.columns}
-    summary['missing'] = {c: int(df[c].isna().sum()) for c in df.columns}
-    numeric = df.select_dtypes(include=['number']).columns.tolist()
-    summary['numeric_columns'] = numeric
-    if numeric:
-        desc = df[numeric].describe().to_dict()
-        summary['numeric_describe'] = desc
-        # correlations
-        summary['correlation'] = df[numeric].corr().to_dict()
-    return summary
-
-
-def save_histograms(df: pd.DataFrame, numeric_cols):
-    for col in numeric_cols:
-        plt.figure(figsize=(6,4))
+    def summary(self) -> dict:
+        summary = {
+            'shape': [int(self.rows), len(self.columns)],
+            'columns': self.columns,
+            'dtypes': self.dtypes,
+            'missing': {c: int(n) for c, n in zip(self.columns, self.missing)},
+            'numeric_columns': self.numeric,
+        }
+        if not self.numeric:
+            return summary
+        n = self.pair_n.diagonal()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a = self.powers[0] / n
+            m2 = self.powers[1] / n - a ** 2
+            m3 = self.powers[2] / n - 3 * a * self.powers[1] / n + 2 * a ** 3
+            m4 = self.powers[3] / n - 4 * a * self.powers[2] / n + 6 * a ** 2 * self.powers[1] / n - 3 * a ** 4
+            std = np.sqrt(m2 * n / (n - 1))
+            skew, kurt = m3 / m2 ** 1.5, m4 / m2 ** 2 - 3
+            cov = self.pair_n * self.cross - self.pair_sum * self.pair_sum.T
+            var = self.pair_n * self.pair_sq - self.pair_sum ** 2
+            corr = cov / np.sqrt(var * var.T)
+        quartiles = self.quantiles([0.25, 0.5, 0.75])
+
+        def clean(x):
+            return None if not np.isfinite(x) else float(x)
+
+        summary['numeric_describe'] = {
+            col: {'count': float(n[j]), 'mean': clean(self.shift[j] + a[j]), 'std': clean(std[j]),
+                  'min': clean(self.low[j]), '25%': clean(quartiles[0, j]), '50%': clean(quartiles[1, j]),
+                  '75%': clean(quartiles[2, j]), 'max': clean(self.high[j])}
+            for j, col in enumerate(self.numeric)}
+        summary['moments'] = {col: {'skewness': clean(skew[j]), 'excess_kurtosis': clean(kurt[j])}
+                              for j, col in enumerate(self.numeric)}
+        summary['correlation'] = {col: {other: clean(corr[i, j]) for j, other in enumerate(self.numeric)}
+                                  for i, col in enumerate(self.numeric)}
+        summary['histograms'] = {}
+        for j, col in enumerate(self.numeric):
+            edges, counts = self.plot_bins(j)
+            summary['histograms'][col] = {'edges': edges, 'counts': counts}
+        return summary
+
+
+def summarize(df: pd.DataFrame, chunk_size: int = None) -> dict:
+    acc = EdaAccumulator()
+    step = chunk_size or max(len(df), 1)
+    for start in range(0, max(len(df), 1), step):
+        acc.update(df.iloc[start:start + step])
+    return acc.summary()
+
+
+def _render(jobs) -> list:
+    # runs in a worker process; the Agg backend needs no display
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    saved = []
+    for col, edges, counts, out in jobs:
+        fig, ax = plt.subplots(figsize=(6, 4))
         try:
-            df[col].dropna().hist(bins=50)
-            plt.title(col)
-            out = OUT_DIR / f"hist_{col}.png"
-            plt.savefig(out)
+            ax.stairs(counts, edges, fill=True)
+            ax.set_title(col)
+            fig.savefig(out)
+            saved.append(out)
         except Exception as e:
             print(f"Could not plot {col}: {e}")
         finally:
-            plt.close()
+            plt.close(fig)
+    return saved
+
+
+def render_histograms(histograms: dict, out_dir: Path = None, n_jobs: int = -1) -> list:
+    """Draw one PNG per column from precomputed ``{col: {'edges', 'counts'}}``."""
+    out_dir = Path(out_dir or OUT_DIR)
+    jobs = [(col, h['edges'], h['counts'], str(out_dir / f"hist_{col}.png"))
+            for col, h in histograms.items() if h['counts']]
+    workers = min(resolve_workers(n_jobs), len(jobs))
+    if workers <= 1:
+        return _render(jobs)
+    batches = [jobs[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [path for saved in pool.map(_render, batches) for path in saved]
+
+
+def save_histograms(df: pd.DataFrame, numeric_cols, n_jobs: int = -1):
+    acc = EdaAccumulator().update(df[list(numeric_cols)])
+    return render_histograms({col: dict(zip(('edges', 'counts'), acc.plot_bins(j)))
+                              for j, col in enumerate(acc.numeric)}, n_jobs=n_jobs)
 
 
-def run_eda():
-    if not DATA_PATH.exists():
-        print(f"Data not found at {DATA_PATH}. Run scripts/import_dataset.py to copy the CSV.")
-        return
-    df = pd.read_csv(DATA_PATH)
-    s = summarize(df)
-    # convert non-serializable items
-    s['shape'] = list(s['shape'])
+def run_eda(path: Path = None, chunk_size: int = CHUNK_SIZE, n_jobs: int = -1) -> dict:
+    path = Path(path or DATA_PATH)
+    if not path.exists():
+        print(f"Data not found at {path}. Run scripts/import_dataset.py to copy the CSV.")
+        return {}
+    acc = EdaAccumulator()
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        acc.update(chunk)
+    s = acc.summary()
     (OUT_DIR / 'eda_summary.json').write_text(json.dumps(s, indent=2))
     print(f"Saved summary to {(OUT_DIR / 'eda_summary.json')}")
     if s.get('numeric_columns'):
-        save_histograms(df, s['numeric_columns'])
+        render_histograms(s['histograms'], n_jobs=n_jobs)
         print(f"Saved histograms to {OUT_DIR}")
+    return s
 
 
 if __name__ == '__main__':
@@ -1,8 +1,16 @@
 """Evaluation utilities: compute and log evaluation metrics for models."""
 import json
+import pickle
+import time
 from pathlib import Path
 import numpy as np
-from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, mean_absolute_error, r2_score, silhouette_score
+from sklearn.metrics import (
+    accuracy_score, auc, f1_score, mean_squared_error, mean_absolute_error, r2_score,
+    silhouette_samples, calinski_harabasz_score,
+)
+
+# silhouette is quadratic in rows; estimate it on a stratified sample of this many points
+SILHOUETTE_SAMPLE = 5000
 
 
 def log_metrics(path, metrics: dict):
@@ -27,9 +35,126 @@ def regression_metrics(y_true, y_pred):
     }
 
 
-def clustering_metrics(X, labels):
+def stratified_sample(labels, size: int, random_state: int = 42):
+    """Row indices of a sample of ``size`` rows drawn from every cluster in proportion to its size."""
+    labels = np.asarray(labels)
+    if size >= len(labels):
+        return np.arange(len(labels))
+    rng = np.random.RandomState(random_state)
+    _, codes, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    # at least two points per cluster so every sampled point has a neighbour in its own cluster
+    quota = np.maximum(np.minimum(counts, 2), np.round(counts * size / len(labels)).astype(int))
+    by_cluster = np.argsort(codes, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    picks = [rng.choice(by_cluster[s:s + c], q, replace=False) for s, c, q in zip(starts, counts, quota)]
+    return np.sort(np.concatenate(picks))
+
+
+def sampled_silhouette(X, labels, sample_size: int = SILHOUETTE_SAMPLE, random_state: int = 42) -> dict:
+    """Mean silhouette on a stratified sample with an approximate 95% confidence interval."""
+    labels = np.asarray(labels)
+    if len(np.unique(labels)) < 2:
+        return {'silhouette': None, 'silhouette_ci': None, 'silhouette_sample': 0}
+    rows = stratified_sample(labels, sample_size, random_state)
+    values = silhouette_samples(X[rows], labels[rows])
+    mean = float(values.mean())
+    half_width = float(1.96 * values.std(ddof=1) / np.sqrt(len(values))) if len(values) > 1 else 0.0
+    return {'silhouette': mean, 'silhouette_ci': [mean - half_width, mean + half_width],
+            'silhouette_sample': int(len(rows))}
+
+
+def clustering_metrics(X, labels, inertia: float = None, sample_size: int = SILHOUETTE_SAMPLE):
+    """Sampled silhouette plus Calinski-Harabasz (linear in rows) and, when given, the model's inertia."""
+    labels = np.asarray(labels)
     try:
-        s = float(silhouette_score(X, labels))
+        metrics = sampled_silhouette(X, labels, sample_size)
     except Exception:
-        s = None
-    return {'silhouette': s}
+        metrics = {'silhouette': None, 'silhouette_ci': None, 'silhouette_sample': 0}
+    metrics['calinski_harabasz'] = (float(calinski_harabasz_score(X, labels))
+                                    if 1 < len(np.unique(labels)) < len(labels) else None)
+    if inertia is not None:
+        metrics['inertia'] = float(inertia)
+    return metrics
+
+
+def serving_cost(model, X, n_single: int = 200, batch_size: int = 1000, repeats: int = 3):
+    """Pickled size plus single-row (p50/p99) and batch predict latency of ``model`` on rows of ``X``."""
+    predict = model.predict_proba if hasattr(model, 'predict_proba') else model.predict
+    n_single = min(n_single, X.shape[0])
+    single = []
+    for i in range(n_single):
+        row = X[i:i + 1]
+        start = time.perf_counter()
+        predict(row)
+        single.append(time.perf_counter() - start)
+    batch = X[:batch_size]
+    batch_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(batch)
+        batch_times.append(time.perf_counter() - start)
+    batch_seconds = min(batch_times)
+    return {
+        'size_bytes': len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)),
+        'single_p50_ms': float(np.percentile(single, 50) * 1000) if single else None,
+        'single_p99_ms': float(np.percentile(single, 99) * 1000) if single else None,
+        'batch_rows': int(batch.shape[0]),
+        'batch_ms': float(batch_seconds * 1000),
+        'rows_per_sec': float(batch.shape[0] / batch_seconds) if batch_seconds > 0 else None,
+    }
+
+
+# relative cost of the two errors of an approval cutoff: approving a loan that defaults
+# versus declining one that would have been repaid
+DEFAULT_LOSS = {'false_approval': 5.0, 'false_decline': 1.0}
+
+
+def threshold_sweep(y_true, scores, positive, loss: dict = None, max_points: int = 200) -> dict:
+    """ROC, PR and expected-loss curves over every distinct threshold from one sort and cumulative sums.
+
+    ``scores`` estimate P(``positive``) (e.g. P(default)); a row is declined when its score is at or
+    above the threshold. The cost-optimal cutoff minimises expected loss per applicant under ``loss``
+    (``DEFAULT_LOSS`` keys). Curves are thinned to about ``max_points`` for storage; AUC, average
+    precision and the optimum come from the full curves.
+    """
+    cfg = {**DEFAULT_LOSS, **(loss or {})}
+    y = np.asarray(y_true) == positive
+    scores = np.asarray(scores, dtype=float)
+    order = np.argsort(-scores, kind='mergesort')
+    scores, y = scores[order], y[order]
+    # last row of each run of tied scores: everything up to it is declined at that threshold
+    cut = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.r_[0, np.cumsum(y)[cut]]
+    fp = np.r_[0, cut + 1 - tp[1:]]
+    thresholds = np.r_[np.inf, scores[cut]]
+    positives, negatives = int(y.sum()), int(len(y) - y.sum())
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tpr = tp / positives if positives else np.zeros_like(tp, dtype=float)
+        fpr = fp / negatives if negatives else np.zeros_like(fp, dtype=float)
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+    expected_loss = (cfg['false_approval'] * (positives - tp) + cfg['false_decline'] * fp) / max(len(y), 1)
+    best = int(np.argmin(expected_loss))
+
+    keep = np.unique(np.r_[np.linspace(0, len(thresholds) - 1, min(max_points, len(thresholds))).astype(int), best])
+    return {
+        'positive_label': str(positive),
+        'loss': cfg,
+        'roc_auc': float(auc(fpr, tpr)) if positives and negatives else None,
+        'average_precision': float(np.sum(np.diff(tpr) * precision[1:])) if positives else None,
+        'optimal': {
+            'threshold': float(thresholds[best]),
+            'expected_loss': float(expected_loss[best]),
+            'tpr': float(tpr[best]),
+            'fpr': float(fpr[best]),
+            'precision': float(precision[best]),
+            'approval_rate': float(1 - (tp[best] + fp[best]) / max(len(y), 1)),
+        },
+        # loss of the default argmax rule (decline when P(positive) >= 0.5) for comparison
+        'expected_loss_at_0_5': float(expected_loss[np.searchsorted(-thresholds, -0.5, side='right') - 1]),
+        'curves': {
+            'threshold': [None if np.isinf(t) else float(t) for t in thresholds[keep]],
+            'tpr': tpr[keep].tolist(), 'fpr': fpr[keep].tolist(), 'precision': precision[keep].tolist(),
+            'expected_loss': expected_loss[keep].tolist(),
+        },
+    }
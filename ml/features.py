@@ -1,12 +1,93 @@
+import re
 import pandas as pd
 import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
+from sklearn.utils import murmurhash3_32
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
 import joblib
 
+from .parallel import resolve_workers, row_shards
+
+# rows below which sharding costs more in process start-up and pickling than it saves
+MIN_SHARD_ROWS = 5000
+
+
+def map_unique(series: pd.Series, func) -> pd.Series:
+    """Apply ``func`` once per distinct value of ``series`` and broadcast the result back.
+
+    ``func`` receives the uniques as a Series and returns an array of the same length.
+    Missing values stay missing, so the cost depends on cardinality rather than row count.
+    """
+    codes, uniques = pd.factorize(series)
+    values = np.asarray(func(pd.Series(uniques, dtype=object)))
+    # code -1 marks missing values; route it to a trailing NaN slot
+    values = np.append(values, np.nan)
+    return pd.Series(values[codes], index=series.index, name=series.name)
+
+
+def _clean_labels(values: pd.Series) -> np.ndarray:
+    s = values.astype(str).str.strip()
+    return np.where(s == "", np.nan, s).astype(object)
+
+
+def _loan_status_labels(values: pd.Series) -> np.ndarray:
+    s = values.astype(str).str.strip().str.lower()
+    is_default = s.str.contains("default|charged|late")
+    is_approved = s.str.contains("appr|paid|fully")
+    return np.where(is_default, "default", np.where(is_approved, "approved", s)).astype(object)
+
+
+def _employment_years(values: pd.Series) -> np.ndarray:
+    # "10+ years" -> 10, "3 years" -> 3, "< 1 year" -> 0, "n/a" -> NaN
+    s = values.astype(str).str.lower()
+    years = pd.to_numeric(s.str.extract(r"(\d+)", expand=False), errors="coerce")
+    years[s.str.contains("<", regex=False)] = 0
+    return years.to_numpy(dtype=float)
+
+
+def _term_months(values: pd.Series) -> np.ndarray:
+    # "Short Term" -> 36, "Long Term" -> 60, "36 months" -> 36
+    s = values.astype(str).str.lower()
+    months = pd.to_numeric(s.str.extract(r"(\d+)", expand=False), errors="coerce")
+    months[s.str.contains("short", regex=False)] = 36
+    months[s.str.contains("long", regex=False)] = 60
+    return months.to_numpy(dtype=float)
+
+
+# raw string fields that are parsed into numeric features
+NUMERIC_PARSERS = {
+    "employment_length": _employment_years,
+    "term": _term_months,
+}
+
+
+def normalize_loan_status(series: pd.Series) -> pd.Series:
+    """Collapse raw loan status labels into 'default' / 'approved' where recognisable."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return map_unique(series, _loan_status_labels)
+
+
+def normalize_categoricals(df: pd.DataFrame, parse=None) -> pd.DataFrame:
+    """Clean categorical columns per unique value and parse known fields into numbers.
+
+    ``parse`` lists the columns from ``NUMERIC_PARSERS`` to convert (default: all of them).
+    """
+    df = df.copy()
+    parse = list(NUMERIC_PARSERS) if parse is None else list(parse)
+    for col in df.select_dtypes(include=[object, "category"]).columns:
+        df[col] = map_unique(df[col], _clean_labels)
+    for col in parse:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = map_unique(df[col], NUMERIC_PARSERS[col]).astype(float)
+    return df
+
 
 def add_derived_features(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -15,38 +96,139 @@ def add_derived_features(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def build_preprocessor(df: pd.DataFrame, saved_path: Path = None) -> Pipeline:
-    df = df.copy()
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    # exclude the targets if present
-    for t in ["loan_status", "loan_amount", "interest_rate"]:
-        if t in numeric_cols:
-            numeric_cols.remove(t)
-    categorical_cols = df.select_dtypes(include=[object, "category"]).columns.tolist()
+# targets are never used as input features
+TARGET_COLS = ["loan_status", "loan_amount", "interest_rate"]
+# "Loan ID", "customer_id", "id", ...
+ID_NAME_PATTERN = re.compile(r"(^|[\s_])id$", re.IGNORECASE)
 
-    numeric_transformer = Pipeline(steps=[
-        ("imputer", SimpleImputer(strategy="median")),
-        ("scaler", StandardScaler())
-    ])
+DEFAULT_ENCODING = {
+    # categoricals with more distinct values than this use the capped strategy below
+    "high_cardinality": 50,
+    # ...and are treated as identifiers (dropped) once distinct values exceed this share of rows
+    "id_unique_ratio": 0.5,
+    # 'frequency' (one-hot of frequent values + an infrequent bucket) or 'hashing'
+    "strategy": "frequency",
+    "min_frequency": 10,
+    "max_categories": 50,
+    "n_hash_features": 64,
+}
+
+
+def profile_columns(df: pd.DataFrame, encoding: dict = None) -> dict:
+    """Split columns into numeric / categorical / high-cardinality / identifier groups by cardinality.
+
+    The returned dict is stored in ``preprocessor_config.joblib`` so the chosen encodings are on record.
+    """
+    cfg = {**DEFAULT_ENCODING, **(encoding or {})}
+    numeric_cols = [c for c in df.select_dtypes(include=[np.number]).columns if c not in TARGET_COLS]
+    # numeric identifiers are recognised by name only (their cardinality says nothing)
+    numeric_ids = [c for c in numeric_cols if ID_NAME_PATTERN.search(str(c).strip())]
+    numeric_cols = [c for c in numeric_cols if c not in numeric_ids]
+    candidates = [c for c in df.select_dtypes(include=[object, "category"]).columns if c not in TARGET_COLS]
+    n_rows = max(len(df), 1)
+    cardinality = {c: int(df[c].nunique()) for c in candidates}
+
+    categorical_cols, high_card_cols, id_cols = [], [], list(numeric_ids)
+    for col in candidates:
+        n_unique = cardinality[col]
+        if ID_NAME_PATTERN.search(str(col).strip()) or (
+                n_unique > cfg["high_cardinality"] and n_unique / n_rows > cfg["id_unique_ratio"]):
+            id_cols.append(col)
+        elif n_unique > cfg["high_cardinality"]:
+            high_card_cols.append(col)
+        else:
+            categorical_cols.append(col)
 
+    return {
+        "numeric_cols": numeric_cols,
+        "categorical_cols": categorical_cols,
+        "high_cardinality_cols": high_card_cols,
+        "id_cols": id_cols,
+        "cardinality": cardinality,
+        "strategy": cfg["strategy"],
+        "encoding": cfg,
+    }
+
+
+def _one_hot(**kwargs) -> OneHotEncoder:
     # Use sparse_output where available (scikit-learn >=1.2), fall back to sparse for older versions
     # prefer sparse output to avoid exploding memory with high-cardinality categories
     try:
-        ohe = OneHotEncoder(handle_unknown="ignore", sparse_output=True)
+        return OneHotEncoder(sparse_output=True, **kwargs)
     except TypeError:
-        ohe = OneHotEncoder(handle_unknown="ignore", sparse=True)
+        return OneHotEncoder(sparse=True, **kwargs)
+
+
+class HashingEncoder(BaseEstimator, TransformerMixin):
+    """Hash ``column=value`` tokens into a fixed number of signed sparse features.
+
+    Each column is hashed once per distinct value, so the cost follows cardinality, not row count.
+    """
+
+    def __init__(self, n_features: int = 64):
+        self.n_features = n_features
+
+    def fit(self, X, y=None):
+        self.n_features_in_ = np.asarray(X).shape[1]
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=object)
+        n_rows, n_cols = X.shape
+        indices = np.empty((n_rows, n_cols), dtype=np.int64)
+        signs = np.empty((n_rows, n_cols), dtype=float)
+        for j in range(n_cols):
+            codes, uniques = pd.factorize(X[:, j])
+            hashes = np.array([murmurhash3_32(f"{j}={u}", seed=0) for u in uniques] + [0], dtype=np.int64)
+            indices[:, j] = np.abs(hashes[codes]) % self.n_features
+            signs[:, j] = np.where(hashes[codes] >= 0, 1.0, -1.0)
+        out = sparse.csr_matrix((signs.ravel(), indices.ravel(), np.arange(0, n_rows * n_cols + 1, n_cols)),
+                                shape=(n_rows, self.n_features))
+        out.sum_duplicates()
+        return out
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f"hash_{i}" for i in range(self.n_features)], dtype=object)
+
+
+def build_preprocessor(df: pd.DataFrame, saved_path: Path = None, n_jobs: int = None,
+                       profile: dict = None) -> Pipeline:
+    # identifier columns are dropped and wide categoricals get a bounded encoding (see profile_columns)
+    profile = profile or profile_columns(df)
+
+    numeric_transformer = Pipeline(steps=[
+        ("imputer", SimpleImputer(strategy="median")),
+        ("scaler", StandardScaler())
+    ])
 
     categorical_transformer = Pipeline(steps=[
         ("imputer", SimpleImputer(strategy="constant", fill_value="missing")),
-        ("onehot", ohe)
+        ("onehot", _one_hot(handle_unknown="ignore"))
     ])
 
+    transformers = [
+        ("num", numeric_transformer, profile["numeric_cols"]),
+        ("cat", categorical_transformer, profile["categorical_cols"]),
+    ]
+    if profile["high_cardinality_cols"]:
+        cfg = profile["encoding"]
+        if profile["strategy"] == "hashing":
+            encoder = ("hash", HashingEncoder(n_features=cfg["n_hash_features"]))
+        elif profile["strategy"] == "frequency":
+            encoder = ("onehot", _one_hot(handle_unknown="infrequent_if_exist", min_frequency=cfg["min_frequency"],
+                                          max_categories=cfg["max_categories"]))
+        else:
+            raise ValueError(f"Unknown encoding strategy: {profile['strategy']}")
+        transformers.append(("cat_high", Pipeline(steps=[
+            ("imputer", SimpleImputer(strategy="constant", fill_value="missing")),
+            encoder,
+        ]), profile["high_cardinality_cols"]))
+
     preprocessor = ColumnTransformer(
-        transformers=[
-            ("num", numeric_transformer, numeric_cols),
-            ("cat", categorical_transformer, categorical_cols),
-        ],
+        transformers=transformers,
         remainder="drop",
+        # fit/transform the numeric and categorical branches in parallel
+        n_jobs=n_jobs,
     )
 
     if saved_path:
@@ -56,24 +238,87 @@ def build_preprocessor(df: pd.DataFrame, saved_path: Path = None) -> Pipeline:
     return preprocessor
 
 
-def apply_preprocessor(preprocessor: Pipeline, df: pd.DataFrame):
+_worker_preprocessor = None
+
+
+def _init_transform_worker(preprocessor):
+    # runs once per worker process, so the fitted preprocessor is unpickled once, not per shard
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+    if hasattr(preprocessor, "n_jobs"):
+        # the pool already uses every allotted core; avoid nested joblib workers
+        preprocessor.n_jobs = None
+
+
+def _transform_shard(shard: pd.DataFrame):
+    return _worker_preprocessor.transform(shard)
+
+
+def transform_sharded(preprocessor, df: pd.DataFrame, n_jobs: int = None, shard_size: int = None):
+    """Transform ``df`` in row shards on a process pool and stack the (sparse or dense) results.
+
+    ``n_jobs`` caps the worker count (joblib semantics, -1 = all cores). Small frames are
+    transformed in-process.
+    """
+    workers = resolve_workers(n_jobs)
+    if shard_size is None:
+        shard_size = max(MIN_SHARD_ROWS, -(-len(df) // (workers * 2)))
+    shards = row_shards(len(df), shard_size)
+    if workers == 1 or len(shards) <= 1:
+        return preprocessor.transform(df)
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), initializer=_init_transform_worker,
+                             initargs=(preprocessor,)) as pool:
+        parts = list(pool.map(_transform_shard, (df.iloc[s] for s in shards)))
+    if sparse.issparse(parts[0]):
+        return sparse.vstack(parts, format="csr")
+    return np.vstack(parts)
+
+
+def apply_preprocessor(preprocessor: Pipeline, df: pd.DataFrame, n_jobs: int = None, shard_size: int = None):
     # returns transformed matrix (may be sparse) and feature names when safe to build
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    for t in ["loan_status", "loan_amount", "interest_rate"]:
-        if t in numeric_cols:
-            numeric_cols.remove(t)
-    categorical_cols = df.select_dtypes(include=[object, "category"]).columns.tolist()
-    X = preprocessor.transform(df)
-
-    # avoid building huge dense feature name lists for high-cardinality encoders
+    X = transform_sharded(preprocessor, df, n_jobs=n_jobs, shard_size=shard_size)
+
     feature_names = None
     try:
-        # only build feature names if encoder produces dense output or reasonably small
-        if hasattr(preprocessor.named_transformers_["cat"].named_steps["onehot"], "get_feature_names_out"):
-            ohe = preprocessor.named_transformers_["cat"].named_steps["onehot"]
-            cat_names = ohe.get_feature_names_out(categorical_cols).tolist()
-            feature_names = numeric_cols + cat_names
+        feature_names = preprocessor.get_feature_names_out().tolist()
     except Exception:
         feature_names = None
 
     return X, feature_names
+
+
+def count_unseen_categories(preprocessor, df: pd.DataFrame) -> dict:
+    """Count values in ``df`` that the fitted one-hot encoders never saw.
+
+    Returns ``{column: {'rows': n, 'values': [...], 'encoded_as': ...}}`` for affected columns. Unseen
+    values of an encoder with an infrequent bucket are ``'infrequent'`` (still encoded); the rest are
+    ``'zeros'``. Rows with at least one all-zeros value are counted under ``'_rows_with_unseen'``, rows
+    whose unseen values all went to an infrequent bucket under ``'_rows_mapped_to_infrequent'``.
+    """
+    report = {}
+    any_unseen = np.zeros(len(df), dtype=bool)
+    any_infrequent = np.zeros(len(df), dtype=bool)
+    for _, transformer, cols in getattr(preprocessor, "transformers_", []):
+        steps = getattr(transformer, "named_steps", {})
+        encoders = [step for step in steps.values() if isinstance(step, OneHotEncoder)]
+        if not encoders or not isinstance(cols, (list, tuple)):
+            continue
+        encoder = encoders[0]
+        infrequent = getattr(encoder, "infrequent_categories_", None) or [None] * len(cols)
+        for col, known, bucket in zip(cols, encoder.categories_, infrequent):
+            if col not in df.columns:
+                continue
+            values = df[col].astype(object).where(df[col].notna(), "missing")
+            mask = ~values.isin(known).to_numpy()
+            if mask.any():
+                # handle_unknown="infrequent_if_exist" sends unknowns to the column's infrequent bucket
+                to_bucket = encoder.handle_unknown == "infrequent_if_exist" and bucket is not None
+                if to_bucket:
+                    any_infrequent |= mask
+                else:
+                    any_unseen |= mask
+                report[col] = {"rows": int(mask.sum()), "values": sorted(map(str, pd.unique(values[mask])))[:20],
+                               "encoded_as": "infrequent" if to_bucket else "zeros"}
+    report["_rows_with_unseen"] = int(any_unseen.sum())
+    report["_rows_mapped_to_infrequent"] = int((any_infrequent & ~any_unseen).sum())
+    return report
@@ -0,0 +1,239 @@
+"""
+Vectorized feature/target leakage screen.
+
+Every association is computed from running sums, so a frame can be screened in one pass or chunk
+by chunk (``LeakageScreen.update`` per chunk, ``screen_leakage_csv`` for files):
+ - numeric feature, numeric target: Pearson r for all columns in one masked matrix operation
+ - numeric feature, categorical target: correlation ratio (eta) from per-class sums
+ - categorical feature, categorical target: Cramer's V and mutual information from a contingency
+   table built with ``bincount`` over integer codes
+ - categorical feature, numeric target: correlation ratio (eta) from per-category sums
+Missing feature values count as their own category; rows without a target are ignored.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_THRESHOLD = 0.95
+# categoricals with more distinct values than this share of rows are identifiers, not leaks
+ID_LIKE_RATIO = 0.5
+
+
+def _grow(arr: np.ndarray, shape: tuple) -> np.ndarray:
+    """Zero-pad ``arr`` up to ``shape`` (codes only ever get added)."""
+    if arr.shape == shape:
+        return arr
+    out = np.zeros(shape, dtype=arr.dtype)
+    out[tuple(slice(0, n) for n in arr.shape)] = arr
+    return out
+
+
+class _Codes:
+    """Stable integer codes for the values of one column across chunks (NaN is a value too)."""
+
+    def __init__(self):
+        self.mapping = {}
+
+    def encode(self, values) -> np.ndarray:
+        codes, uniques = pd.factorize(pd.Series(values, copy=False), use_na_sentinel=False)
+        lookup = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques):
+            key = '__missing__' if pd.isna(value) else value
+            lookup[i] = self.mapping.setdefault(key, len(self.mapping))
+        return lookup[codes]
+
+    def __len__(self):
+        return len(self.mapping)
+
+
+class LeakageScreen:
+    """Accumulates feature/target association statistics over one or more chunks."""
+
+    def __init__(self):
+        self.target_is_categorical = None
+        self.numeric_cols, self.categorical_cols, self.skipped = None, None, {}
+        self.n_rows = 0
+
+    def _init(self, X: pd.DataFrame, y: pd.Series):
+        self.target_is_categorical = not (pd.api.types.is_numeric_dtype(y) and not pd.api.types.is_bool_dtype(y))
+        self.numeric_cols, self.categorical_cols = [], []
+        for col in X.columns:
+            dtype = X[col].dtype
+            if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+                self.numeric_cols.append(col)
+            elif pd.api.types.is_datetime64_any_dtype(dtype) or pd.api.types.is_timedelta64_dtype(dtype):
+                self.skipped[col] = f'unsupported dtype {dtype}'
+            else:
+                self.categorical_cols.append(col)
+        p = len(self.numeric_cols)
+        # numeric columns are shifted by their first-chunk means to keep the running sums well conditioned
+        self.shift = np.nan_to_num(np.nanmean(X[self.numeric_cols].to_numpy(dtype=float), axis=0)) if p else np.zeros(0)
+        self.y_codes = _Codes() if self.target_is_categorical else None
+        if self.target_is_categorical:
+            self.class_count = np.zeros((0, p))
+            self.class_sum = np.zeros((0, p))
+        else:
+            self.y_shift = float(np.nanmean(y.to_numpy(dtype=float))) if len(y) else 0.0
+            self.num = {k: np.zeros(p) for k in ('n', 'sx', 'sy', 'sxx', 'syy', 'sxy')}
+        self.total_sq = np.zeros(p)
+        self.cat_codes = {col: _Codes() for col in self.categorical_cols}
+        # categorical target: contingency table per column; numeric target: per-category n, sum, sum of squares
+        self.cat_stats = {col: None for col in self.categorical_cols}
+
+    def update(self, X: pd.DataFrame, y):
+        """Add one chunk of features ``X`` and the aligned target ``y``."""
+        y = pd.Series(y, index=X.index) if not isinstance(y, pd.Series) else y
+        if self.target_is_categorical is None:
+            self._init(X, y)
+        keep = y.notna().to_numpy()
+        X, y = X[keep], y[keep]
+        self.n_rows += len(y)
+        if self.target_is_categorical:
+            yc = self.y_codes.encode(y.to_numpy())
+            self._update_numeric_classes(X, yc)
+            self._update_categorical(X, yc, len(self.y_codes))
+        else:
+            yv = y.to_numpy(dtype=float)
+            self._update_numeric_pearson(X, yv)
+            self._update_categorical(X, yv, None)
+        return self
+
+    def _numeric_block(self, X: pd.DataFrame):
+        values = X[self.numeric_cols].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        return np.where(valid, values - self.shift, 0.0), valid
+
+    def _update_numeric_pearson(self, X, y):
+        if not self.numeric_cols:
+            return
+        xc, valid = self._numeric_block(X)
+        yc = np.where(valid, (y - self.y_shift)[:, None], 0.0)
+        s = self.num
+        s['n'] += valid.sum(axis=0)
+        s['sx'] += xc.sum(axis=0)
+        s['sy'] += yc.sum(axis=0)
+        s['sxx'] += np.einsum('ij,ij->j', xc, xc)
+        s['syy'] += np.einsum('ij,ij->j', yc, yc)
+        s['sxy'] += np.einsum('ij,ij->j', xc, yc)
+
+    def _update_numeric_classes(self, X, yc):
+        if not self.numeric_cols:
+            return
+        xc, valid = self._numeric_block(X)
+        k = len(self.y_codes)
+        onehot = np.zeros((len(yc), k))
+        onehot[np.arange(len(yc)), yc] = 1.0
+        self.class_count = _grow(self.class_count, (k, xc.shape[1])) + onehot.T @ valid
+        self.class_sum = _grow(self.class_sum, (k, xc.shape[1])) + onehot.T @ xc
+        self.total_sq += np.einsum('ij,ij->j', xc, xc)
+
+    def _update_categorical(self, X, y, n_classes):
+        for col in self.categorical_cols:
+            codes = self.cat_codes[col].encode(X[col].to_numpy())
+            k = len(self.cat_codes[col])
+            stats = self.cat_stats[col]
+            if n_classes is not None:
+                table = np.bincount(codes * n_classes + y, minlength=k * n_classes).reshape(k, n_classes)
+                self.cat_stats[col] = table if stats is None else _grow(stats, (k, n_classes)) + table
+            else:
+                yc = y - self.y_shift
+                chunk = np.stack([np.bincount(codes, minlength=k),
+                                  np.bincount(codes, weights=yc, minlength=k),
+                                  np.bincount(codes, weights=yc * yc, minlength=k)])
+                self.cat_stats[col] = chunk if stats is None else _grow(stats, (3, k)) + chunk
+
+    def result(self, threshold: float = DEFAULT_THRESHOLD) -> dict:
+        associations = {}
+        if self.numeric_cols:
+            values = self._eta_numeric() if self.target_is_categorical else self._pearson()
+            measure = 'correlation_ratio' if self.target_is_categorical else 'pearson'
+            for col, value in zip(self.numeric_cols, values):
+                associations[col] = {'measure': measure, 'value': None if np.isnan(value) else float(value)}
+        for col in self.categorical_cols:
+            stats = self.cat_stats[col]
+            n_categories = len(self.cat_codes[col])
+            if stats is None:
+                continue
+            entry = self._cramers_v(stats) if self.target_is_categorical else self._eta_categorical(stats)
+            entry['n_categories'] = n_categories
+            entry['id_like'] = n_categories > ID_LIKE_RATIO * max(self.n_rows, 1)
+            associations[col] = entry
+
+        flagged = [
+            {'column': col, 'measure': a['measure'], 'correlation': a['value'],
+             'risk': 'HIGH - Possible label leakage'}
+            for col, a in associations.items()
+            if a['value'] is not None and abs(a['value']) > threshold and not a.get('id_like')
+        ]
+        return {
+            'target_type': 'categorical' if self.target_is_categorical else 'numeric',
+            'rows': int(self.n_rows),
+            'threshold': threshold,
+            'feature_target_correlation': {col: a['value'] for col, a in associations.items()},
+            'associations': associations,
+            'high_correlation_features': sorted(flagged, key=lambda f: -abs(f['correlation'])),
+            'skipped': self.skipped,
+        }
+
+    def _pearson(self) -> np.ndarray:
+        s = self.num
+        n = s['n']
+        cov = n * s['sxy'] - s['sx'] * s['sy']
+        var = (n * s['sxx'] - s['sx'] ** 2) * (n * s['syy'] - s['sy'] ** 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(var > 0, cov / np.sqrt(np.where(var > 0, var, 1.0)), np.nan)
+
+    def _eta_numeric(self) -> np.ndarray:
+        n = self.class_count.sum(axis=0)
+        total = self.class_sum.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            between = np.nansum(np.where(self.class_count > 0, self.class_sum ** 2 / self.class_count, 0.0), axis=0)
+            between -= total ** 2 / n
+            ss_total = self.total_sq - total ** 2 / n
+            return np.where(ss_total > 0, np.sqrt(np.clip(between / ss_total, 0, 1)), np.nan)
+
+    def _eta_categorical(self, stats) -> dict:
+        count, total, sq = stats
+        n = count.sum()
+        seen = count > 0
+        ss_total = sq.sum() - total.sum() ** 2 / n if n else 0.0
+        between = (total[seen] ** 2 / count[seen]).sum() - total.sum() ** 2 / n if n else 0.0
+        value = float(np.sqrt(np.clip(between / ss_total, 0, 1))) if ss_total > 0 else None
+        return {'measure': 'correlation_ratio', 'value': value}
+
+    @staticmethod
+    def _cramers_v(table) -> dict:
+        table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0].astype(float)
+        n = table.sum()
+        if n == 0 or min(table.shape) < 2:
+            return {'measure': 'cramers_v', 'value': None, 'mutual_information': 0.0}
+        rows, cols = table.sum(axis=1), table.sum(axis=0)
+        expected = np.outer(rows, cols) / n
+        chi2 = ((table - expected) ** 2 / expected).sum()
+        v = np.sqrt(chi2 / (n * (min(table.shape) - 1)))
+        joint = table / n
+        nz = joint > 0
+        mi = (joint[nz] * np.log(joint[nz] / expected[nz] * n)).sum()
+        p_y = cols / n
+        h_y = -(p_y * np.log(p_y)).sum()
+        return {'measure': 'cramers_v', 'value': float(min(v, 1.0)), 'mutual_information': float(mi),
+                # share of the target's entropy explained by the feature
+                'uncertainty_coefficient': float(mi / h_y) if h_y > 0 else None}
+
+
+def screen_leakage(X: pd.DataFrame, y, threshold: float = DEFAULT_THRESHOLD, chunk_size: int = None) -> dict:
+    """Screen every column of ``X`` against ``y``, optionally ``chunk_size`` rows at a time."""
+    screen = LeakageScreen()
+    y = pd.Series(y, index=X.index) if not isinstance(y, pd.Series) else y
+    step = chunk_size or max(len(X), 1)
+    for start in range(0, max(len(X), 1), step):
+        screen.update(X.iloc[start:start + step], y.iloc[start:start + step])
+    return screen.result(threshold)
+
+
+def screen_leakage_csv(path, target: str, threshold: float = DEFAULT_THRESHOLD, chunk_size: int = 100_000,
+                       exclude=()) -> dict:
+    """Stream a CSV in chunks and screen every other column against ``target``."""
+    screen = LeakageScreen()
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        screen.update(chunk.drop(columns=[target, *[c for c in exclude if c in chunk.columns]]), chunk[target])
+    return screen.result(threshold)
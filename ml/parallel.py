@@ -0,0 +1,35 @@
+"""Process-pool helpers shared by data preparation and training."""
+import os
+
+import numpy as np
+
+
+def resolve_workers(n_jobs: int = None, cap: int = None) -> int:
+    """Translate a joblib-style ``n_jobs`` into a worker count.
+
+    ``None`` or 1 means in-process, -1 all cores, -2 all but one, and so on.
+    ``cap`` bounds the result (e.g. to share a machine with other jobs).
+    """
+    cpus = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        workers = 1
+    elif n_jobs < 0:
+        workers = cpus + 1 + n_jobs
+    else:
+        workers = n_jobs
+    if cap:
+        workers = min(workers, cap)
+    return max(1, workers)
+
+
+def row_shards(n_rows: int, shard_size: int) -> list:
+    """Split ``range(n_rows)`` into contiguous slices of at most ``shard_size`` rows."""
+    bounds = np.arange(0, n_rows, max(1, shard_size)).tolist() + [n_rows]
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def limit_threads(estimator, threads: int):
+    """Give every thread pool the estimator already runs (forests, wrapped XGBoost) ``threads`` workers."""
+    for key, value in estimator.get_params().items():
+        if key.split('__')[-1] == 'n_jobs' and value is not None:
+            estimator.set_params(**{key: threads})
@@ -0,0 +1,142 @@
+"""
+Offline check that the serving path scores raw loans exactly like the training path.
+
+Holdout rows of the raw CSV (the test split used by ``ml.train``) are scored three ways:
+ - training: ``clean_dataset`` -> ``apply_preprocessor`` -> reducer, the matrix ``ml.train`` fits on
+ - serving, batch: ``app.predict.score_batch`` on the renamed raw rows
+ - serving, single: ``app.predict._prepare_features`` one request at a time, as the API does
+Feature matrices and model outputs must agree within ``atol``; rows per second is reported for
+each path. Saves data/processed/serving_parity.json and exits non-zero on a mismatch.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .features import apply_preprocessor
+from .prepare_data import DATA_PATH, OUT_DIR, clean_dataset, standardize_columns
+
+REPORT_PATH = OUT_DIR / 'serving_parity.json'
+TASKS = ('classification', 'regression', 'clustering')
+DEFAULT_ATOL = 1e-6
+
+
+def holdout_rows(path: Path = None, n_rows: int = 2000, test_size: float = 0.2, random_state: int = 42):
+    """Up to ``n_rows`` raw rows from the test split of ``ml.train.TrainingData`` (same permutation)."""
+    raw = pd.read_csv(path or DATA_PATH)
+    order = np.random.RandomState(random_state).permutation(len(raw))
+    test = order[len(raw) - int(np.ceil(test_size * len(raw))):]
+    return raw.iloc[np.sort(test[:n_rows])].reset_index(drop=True)
+
+
+def training_features(raw: pd.DataFrame, preprocessor, svd=None) -> np.ndarray:
+    """Features of raw rows as ``ml.prepare_data`` writes them and ``ml.train`` reads them back."""
+    X, _ = apply_preprocessor(preprocessor, clean_dataset(raw), n_jobs=1)
+    if svd is not None:
+        X = svd.transform(X)
+    elif sparse.issparse(X):
+        X = X.toarray()
+    return np.nan_to_num(np.asarray(X, dtype=np.float64))
+
+
+def _output(model, X, task: str) -> np.ndarray:
+    if task == 'classification' and hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)
+    return np.asarray(model.predict(X))
+
+
+def _difference(a: np.ndarray, b: np.ndarray) -> float:
+    if a.dtype.kind in 'fc' or b.dtype.kind in 'fc':
+        return float(np.max(np.abs(a.astype(float) - b.astype(float)), initial=0.0))
+    # class labels and cluster ids: share of rows that differ
+    return float(np.mean(a != b)) if len(a) else 0.0
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def check_parity(raw: pd.DataFrame, atol: float = DEFAULT_ATOL, n_single: int = 200, load: bool = True) -> dict:
+    """Score ``raw`` loans through the training and serving paths and compare features and outputs."""
+    from app import predict as serving
+
+    if load:
+        serving.load_models()
+    if serving.preprocessor is None:
+        raise RuntimeError('Preprocessor not loaded; run ml.prepare_data first')
+    requests = standardize_columns(raw)
+    records = requests.to_dict(orient='records')
+    single = records[:n_single]
+
+    X_train, t_train = _timed(lambda: training_features(raw, serving.preprocessor, serving.svd))
+    X_batch, t_batch = _timed(lambda: serving._prepare_batch(requests))
+    X_single, t_single = _timed(lambda: np.vstack([serving._prepare_features(r) for r in single]))
+    report = {
+        'rows': len(raw),
+        'single_rows': len(single),
+        'atol': atol,
+        'features': {
+            'columns': int(X_train.shape[1]),
+            'batch_max_abs_diff': _difference(X_train, X_batch),
+            'single_max_abs_diff': _difference(X_train[:len(single)], X_single),
+        },
+        'tasks': {},
+    }
+    failures = [f'features ({path})' for path in ('batch', 'single')
+                if not report['features'][f'{path}_max_abs_diff'] <= atol]
+
+    for task in TASKS:
+        model = getattr(serving, f'{task}_model')
+        if model is None:
+            continue
+        expected, t_model = _timed(lambda: _output(model, X_train, task))
+        batch, t_batch_total = _timed(lambda: serving.score_batch(requests, task))
+        singles, t_single_total = _timed(
+            lambda: np.concatenate([_output(model, serving._prepare_features(r), task) for r in single]))
+        entry = {
+            'batch_max_diff': _difference(expected, batch),
+            'single_max_diff': _difference(expected[:len(single)], singles),
+            'rows_per_sec': {
+                'training': len(raw) / (t_train + t_model),
+                'serving_batch': len(raw) / t_batch_total,
+                'serving_single': len(single) / t_single_total if single else None,
+            },
+        }
+        report['tasks'][task] = entry
+        failures += [f'{task} ({path})' for path in ('batch', 'single') if not entry[f'{path}_max_diff'] <= atol]
+
+    report['feature_rows_per_sec'] = {'training': len(raw) / t_train, 'serving_batch': len(raw) / t_batch,
+                                      'serving_single': len(single) / t_single if single else None}
+    report['failures'] = failures
+    report['passed'] = not failures
+    return report
+
+
+def run_parity(path: Path = None, n_rows: int = 2000, atol: float = DEFAULT_ATOL, n_single: int = 200) -> dict:
+    report = check_parity(holdout_rows(path, n_rows), atol=atol, n_single=n_single)
+    REPORT_PATH.write_text(json.dumps(report, indent=2))
+    for task, entry in report['tasks'].items():
+        speed = entry['rows_per_sec']
+        print(f"{task}: batch diff {entry['batch_max_diff']:.2e}, single diff {entry['single_max_diff']:.2e}; "
+              f"rows/s training {speed['training']:.0f}, serving batch {speed['serving_batch']:.0f}, "
+              f"serving single {speed['serving_single']:.0f}")
+    print(f"Parity {'passed' if report['passed'] else 'FAILED: ' + ', '.join(report['failures'])}. "
+          f"Saved report to {REPORT_PATH}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=Path, help='Raw loans CSV (default data/bank_loan.csv)')
+    parser.add_argument('--rows', type=int, default=2000, help='Holdout rows to score')
+    parser.add_argument('--single', type=int, default=200, help='Rows also scored one request at a time')
+    parser.add_argument('--atol', type=float, default=DEFAULT_ATOL, help='Largest allowed difference')
+    args = parser.parse_args()
+    sys.exit(0 if run_parity(args.data, args.rows, args.atol, args.single)['passed'] else 1)
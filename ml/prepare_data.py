@@ -3,46 +3,105 @@ Prepare data for ML tasks: cleaning, feature engineering, preprocessing and save
 Saves:
  - data/processed/for_classification.csv
  - data/processed/for_regression.csv
+ - data/processed/prepare_state.json (rows already processed, used by append mode)
+ - data/processed/pipeline_profile.json (per-stage timings and memory, with --profile)
+ - data/processed/checkpoints/ (per-stage completion markers and intermediate results, see --resume)
  - models/preprocessor.joblib
+ - models/svd_transformer.joblib (when the encoded matrix is sparse or wide)
+ - models/reference_profile.json (binned training distributions for drift checks, see ml.drift)
+ - data/processed/cleaned.joblib (cleaned frame, only when written with save_cleaned)
 """
+import argparse
+import json
+from contextlib import nullcontext
 from pathlib import Path
 import pandas as pd
-import numpy as np
-from .features import add_derived_features, build_preprocessor, apply_preprocessor
+from .features import (
+    add_derived_features, build_preprocessor, apply_preprocessor,
+    normalize_categoricals, normalize_loan_status, count_unseen_categories, profile_columns,
+    NUMERIC_PARSERS,
+)
 import joblib
 from scipy import sparse
-from sklearn.decomposition import TruncatedSVD
+from .reduction import fit_reducer, describe_reducer
+from .profiling import PROFILE_PATH, profiled, stage
+from .checkpoints import Checkpoints, atomic_write, source_key
+from .drift import (
+    REFERENCE_PROFILE_PATH, build_reference_profile, detect_drift_chunks, load_reference_profile,
+    save_reference_profile,
+)
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA_PATH = ROOT / 'data' / 'bank_loan.csv'
 OUT_DIR = ROOT / 'data' / 'processed'
 MODELS_DIR = ROOT / 'models'
+STATE_PATH = OUT_DIR / 'prepare_state.json'
+KEYS_PATH = OUT_DIR / 'processed_keys.csv'
+# columns that identify a loan, used to detect rows that still need processing
+KEY_CANDIDATES = ['loan id', 'loan_id', 'id']
+DRIFT_REPORT_PATH = OUT_DIR / 'drift_report.json'
+CLEANED_PATH = OUT_DIR / 'cleaned.joblib'
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def prepare():
-    if not DATA_PATH.exists():
-        raise FileNotFoundError(f"Data not found: {DATA_PATH}")
-    df = pd.read_csv(DATA_PATH)
+def _find_col(columns, candidates):
     # Normalize common column names (case-insensitive) to expected keys
-    col_map = {c.lower().strip(): c for c in df.columns}
+    col_map = {c.lower().strip(): c for c in columns}
+    for cand in candidates:
+        key = cand.lower()
+        if key in col_map:
+            return col_map[key]
+    return None
 
-    def find_col(candidates):
-        for cand in candidates:
-            key = cand.lower()
-            if key in col_map:
-                return col_map[key]
-        return None
 
+def load_dataset(path: Path = None, skip_rows: int = 0) -> pd.DataFrame:
+    """Read the raw CSV (optionally skipping the first ``skip_rows`` records) and clean it."""
+    path = path or DATA_PATH
+    if not path.exists():
+        raise FileNotFoundError(f"Data not found: {path}")
+    df = pd.read_csv(path, skiprows=range(1, skip_rows + 1) if skip_rows else None)
+    return clean_dataset(df)
+
+
+def clean_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """Rename known columns, clean categoricals and add derived features (works on any chunk of rows)."""
+    df = standardize_columns(df)
+
+    # clean categoricals once per distinct value; employment length and term become numeric
+    df = normalize_categoricals(df)
+    df = add_derived_features(df)
+
+    # basic target handling: ensure loan_status exists for classification
+    # convert loan_status to binary (if multi-class, keep as-is)
+    if 'loan_status' in df.columns:
+        df['loan_status'] = normalize_loan_status(df['loan_status'])
+
+    return df
+
+
+def save_cleaned(df: pd.DataFrame, path: Path = None) -> Path:
+    """Dump a cleaned frame so later steps can memory-map it instead of re-reading the CSV."""
+    path = Path(path or CLEANED_PATH)
+    atomic_write(path, lambda tmp: joblib.dump(df, tmp))
+    return path
+
+
+def load_cleaned(path: Path = None) -> pd.DataFrame:
+    """Frame written by ``save_cleaned``; its numeric blocks are read-only memory maps."""
+    return joblib.load(path or CLEANED_PATH, mmap_mode='r')
+
+
+def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Rename the known raw columns to the names used by training and serving (values untouched)."""
     # common name candidates
-    loan_status_col = find_col(['loan_status', 'loan status', 'loanstatus', 'status'])
-    loan_amount_col = find_col(['loan_amount', 'current loan amount', 'loan amnt', 'loanamount', 'loan amount'])
-    interest_col = find_col(['interest_rate', 'int_rate', 'interest rate', 'int rate'])
-    income_col = find_col(['annual income', 'annual_income', 'income'])
-    employment_col = find_col(['years in current job', 'employment_length', 'emp_length', 'years_current_job'])
-    purpose_col = find_col(['purpose'])
-    term_col = find_col(['term'])
+    loan_status_col = _find_col(df.columns, ['loan_status', 'loan status', 'loanstatus', 'status'])
+    loan_amount_col = _find_col(df.columns, ['loan_amount', 'current loan amount', 'loan amnt', 'loanamount', 'loan amount'])
+    interest_col = _find_col(df.columns, ['interest_rate', 'int_rate', 'interest rate', 'int rate'])
+    income_col = _find_col(df.columns, ['annual income', 'annual_income', 'income'])
+    employment_col = _find_col(df.columns, ['years in current job', 'employment_length', 'emp_length', 'years_current_job'])
+    purpose_col = _find_col(df.columns, ['purpose'])
+    term_col = _find_col(df.columns, ['term'])
 
     rename_map = {}
     if loan_status_col:
@@ -62,69 +121,255 @@ def prepare():
 
     if rename_map:
         df = df.rename(columns=rename_map)
+    return df
 
-    df = add_derived_features(df)
 
-    # basic target handling: ensure loan_status exists for classification
-    # convert loan_status to binary (if multi-class, keep as-is)
-    if 'loan_status' in df.columns:
-        # try to normalize common labels
-        df['loan_status'] = df['loan_status'].astype(str).str.lower().map(
-            lambda x: 'default' if 'default' in x or 'charged' in x or 'late' in x else ('approved' if 'appr' in x or 'paid' in x or 'fully' in x else x)
-        )
-
-    preprocessor = build_preprocessor(df, saved_path=MODELS_DIR / 'preprocessor.joblib')
-    # fit preprocessor on whole data
-    preprocessor.fit(df)
-    joblib.dump(preprocessor, MODELS_DIR / 'preprocessor.joblib')
-    
+def prepare(reduction: dict = None, n_jobs: int = -1, encoding: dict = None, profile: bool = False,
+            resume: bool = False, cleaned: Path = None):
+    """Clean, encode and reduce the raw dataset.
+
+    ``reduction`` overrides options from ``ml.reduction.DEFAULT_REDUCTION``
+    (e.g. ``{'method': 'incremental', 'batch_size': 5000}`` or ``{'variance_target': 0.9}``).
+    ``n_jobs`` caps the processes used to fit column transformers and transform row shards.
+    ``encoding`` overrides ``ml.features.DEFAULT_ENCODING`` (e.g. ``{'strategy': 'hashing'}``).
+    ``profile=True`` records every step under 'prepare' in ``pipeline_profile.json`` (see ``ml.profiling``).
+    The encode, reduce and write stages each leave a checkpoint (``ml.checkpoints``); ``resume=True``
+    skips stages that already completed with the same inputs and intact artifacts.
+    ``cleaned`` is a frame written by ``save_cleaned``; it is memory-mapped in place of reading and
+    cleaning the raw CSV.
+    """
+    with profiled('prepare', PROFILE_PATH) if profile else nullcontext():
+        _prepare(reduction, n_jobs, encoding, Checkpoints('prepare', resume=resume, directory=OUT_DIR / 'checkpoints'),
+                 cleaned)
+
+
+def _read(cleaned: Path = None) -> pd.DataFrame:
+    return load_cleaned(cleaned) if cleaned else load_dataset()
+
+
+def _encode(n_jobs: int, encoding: dict, cleaned: Path = None):
+    with stage('read') as rec:
+        df = rec['output'] = _read(cleaned)
+
+    # drop identifier columns and bound the width of high-cardinality categoricals
+    with stage('profile_columns', inputs=df):
+        profile = profile_columns(df, encoding)
+    if profile['id_cols']:
+        print(f"Excluding identifier columns: {profile['id_cols']}")
+    with stage('fit_preprocessor', inputs=df):
+        preprocessor = build_preprocessor(df, saved_path=MODELS_DIR / 'preprocessor.joblib', n_jobs=n_jobs,
+                                          profile=profile)
+        # fit preprocessor on whole data
+        preprocessor.fit(df)
+
     # Save the column names and types for use in prediction
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    for t in ["loan_status", "loan_amount", "interest_rate"]:
-        if t in numeric_cols:
-            numeric_cols.remove(t)
-    categorical_cols = df.select_dtypes(include=[object, "category"]).columns.tolist()
-    
     config = {
-        'numeric_cols': numeric_cols,
-        'categorical_cols': categorical_cols,
-        'all_cols': df.columns.tolist()
+        'numeric_cols': profile['numeric_cols'],
+        'categorical_cols': profile['categorical_cols'] + profile['high_cardinality_cols'],
+        'all_cols': df.columns.tolist(),
+        # raw string fields parsed into numbers; serving applies the same parsers
+        'parsed_cols': [c for c in NUMERIC_PARSERS if c in df.columns],
+        'encoding': profile,
     }
-    joblib.dump(config, MODELS_DIR / 'preprocessor_config.joblib')
+
+    # binned training distributions of the raw features, the reference for later drift checks
+    with stage('reference_profile', inputs=df):
+        reference = build_reference_profile(df, profile['numeric_cols'], config['categorical_cols'])
+    save_reference_profile(reference, MODELS_DIR / REFERENCE_PROFILE_PATH.name)
 
     # transform and save features; handle sparse outputs safely
-    X, feature_names = apply_preprocessor(preprocessor, df)
+    with stage('transform', inputs=df) as rec:
+        X, feature_names = apply_preprocessor(preprocessor, df, n_jobs=n_jobs)
+        rec['output'] = X
+    # serving transforms one row at a time; a joblib pool per request would only add latency
+    preprocessor.set_params(n_jobs=None)
+    atomic_write(MODELS_DIR / 'preprocessor.joblib', lambda tmp: joblib.dump(preprocessor, tmp))
+    return df, X, feature_names, config
+
 
-    # If X is sparse or very wide, reduce dimensionality with TruncatedSVD
+def _reduce(X, feature_names, config: dict, reduction: dict):
+    # If X is sparse or very wide, reduce dimensionality with the configured engine
     if sparse.issparse(X) or (hasattr(X, 'shape') and X.shape[1] > 1000):
-        n_components = min(50, X.shape[1] if hasattr(X, 'shape') else 50)
-        svd = TruncatedSVD(n_components=n_components, random_state=42)
-        X_reduced = svd.fit_transform(X)
+        with stage('reduce', inputs=X) as rec:
+            svd, X_reduced = fit_reducer(X, reduction)
+            rec['output'] = X_reduced
         df_X = pd.DataFrame(X_reduced, columns=[f'svd_{i}' for i in range(X_reduced.shape[1])])
-        joblib.dump(svd, MODELS_DIR / 'svd_transformer.joblib')
+        atomic_write(MODELS_DIR / 'svd_transformer.joblib', lambda tmp: joblib.dump(svd, tmp))
+        config['reduction'] = describe_reducer(svd, reduction)
+        print(f"Reduced {X.shape[1]} features to {X_reduced.shape[1]} components ({config['reduction']['method']})")
     else:
-        # dense case
+        # dense case; drop any reducer left over from a previous run so serving does not apply it
         df_X = pd.DataFrame(X, columns=feature_names) if feature_names else pd.DataFrame(X)
+        (MODELS_DIR / 'svd_transformer.joblib').unlink(missing_ok=True)
+    return df_X, config
+
 
+def _prepare(reduction: dict, n_jobs: int, encoding: dict, checkpoints: Checkpoints, cleaned: Path = None):
+    # each stage's key includes the previous stage's fingerprint, so redoing a stage invalidates the rest
+    df = None
+    encode_key = {'source': source_key(cleaned or DATA_PATH), 'encoding': encoding}
+    if checkpoints.done('encode', encode_key):
+        X, feature_names, config = checkpoints.load('encoded')
+    else:
+        df, X, feature_names, config = _encode(n_jobs, encoding, cleaned)
+        checkpoints.save('encoded', (X, feature_names, config))
+        checkpoints.complete('encode', encode_key, [MODELS_DIR / 'preprocessor.joblib',
+                                                    MODELS_DIR / REFERENCE_PROFILE_PATH.name,
+                                                    checkpoints.path('encoded')])
+
+    reduce_key = {'encode': checkpoints.fingerprint('encode'), 'reduction': reduction}
+    if checkpoints.done('reduce', reduce_key):
+        df_X, config = checkpoints.load('reduced')
+    else:
+        df_X, config = _reduce(X, feature_names, config, reduction)
+        checkpoints.save('reduced', (df_X, config))
+        reducer = [MODELS_DIR / 'svd_transformer.joblib'] if 'reduction' in config else []
+        checkpoints.complete('reduce', reduce_key, [checkpoints.path('reduced')] + reducer)
+
+    write_key = {'reduce': checkpoints.fingerprint('reduce')}
+    outputs = [OUT_DIR / 'for_classification.csv', OUT_DIR / 'for_regression.csv',
+               MODELS_DIR / 'preprocessor_config.joblib', STATE_PATH]
+    if not checkpoints.done('write', write_key):
+        if df is None:
+            df = _read(cleaned)
+        atomic_write(MODELS_DIR / 'preprocessor_config.joblib', lambda tmp: joblib.dump(config, tmp))
+        with stage('write', inputs=df_X):
+            _write_processed(df, df_X)
+            _save_state(df)
+        checkpoints.complete('write', write_key, outputs)
+
+    print(f"Saved processed data to {OUT_DIR} and preprocessor to {MODELS_DIR / 'preprocessor.joblib'}")
+
+
+def _write_processed(df: pd.DataFrame, df_X: pd.DataFrame, append: bool = False):
     # attach targets if present and save for classification
     if 'loan_status' in df.columns:
         df_X['loan_status'] = df['loan_status'].values
-    df_X.to_csv(OUT_DIR / 'for_classification.csv', index=False)
+    _write_csv(df_X, OUT_DIR / 'for_classification.csv', append)
 
     # regression target: prefer loan_amount then interest_rate
     if 'loan_amount' in df.columns:
         df_X_reg = df_X.copy()
         df_X_reg['loan_amount'] = df['loan_amount'].values
-        df_X_reg.to_csv(OUT_DIR / 'for_regression.csv', index=False)
+        _write_csv(df_X_reg, OUT_DIR / 'for_regression.csv', append)
     elif 'interest_rate' in df.columns:
         df_X_reg = df_X.copy()
         df_X_reg['interest_rate'] = df['interest_rate'].values
-        df_X_reg.to_csv(OUT_DIR / 'for_regression.csv', index=False)
+        _write_csv(df_X_reg, OUT_DIR / 'for_regression.csv', append)
     else:
-        df_X.to_csv(OUT_DIR / 'for_regression.csv', index=False)
+        _write_csv(df_X, OUT_DIR / 'for_regression.csv', append)
+
+
+def _write_csv(frame: pd.DataFrame, path: Path, append: bool):
+    if not append:
+        frame.to_csv(path, index=False)
+        return
+    # keep the column order of the file we are appending to
+    header = pd.read_csv(path, nrows=0).columns
+    frame.reindex(columns=header).to_csv(path, mode='a', header=False, index=False)
+
+
+def _save_state(df: pd.DataFrame, previous: dict = None, raw_rows: int = None):
+    """Record which raw rows are already in the processed CSVs (by key column and row offset).
+
+    ``raw_rows`` is the number of raw CSV lines consumed so far; it only differs from the processed
+    row count when key-based appends skip rows with a missing or repeated key.
+    """
+    state = dict(previous or {})
+    state['raw_rows'] = (raw_rows if raw_rows is not None
+                         else state.get('raw_rows', state.get('rows_processed', 0)) + len(df))
+    state['rows_processed'] = state.get('rows_processed', 0) + len(df)
+    state['key_column'] = state.get('key_column', _find_col(df.columns, KEY_CANDIDATES))
+    key = state['key_column']
+    if key and key in df.columns:
+        keys = df[[key]].dropna()
+        keys.to_csv(KEYS_PATH, mode='a' if previous else 'w', header=not previous, index=False)
+    STATE_PATH.write_text(json.dumps(state, indent=2))
+    return state
 
-    print(f"Saved processed data to {OUT_DIR} and preprocessor to {MODELS_DIR / 'preprocessor.joblib'}")
+
+def append_new_rows(n_jobs: int = -1, refit_threshold: float = 0.05) -> dict:
+    """Transform loans that are not in the processed CSVs yet with the frozen preprocessor and append them.
+
+    New rows are detected by the key column recorded at the last full ``prepare()`` or, without one,
+    by row offset. The report counts values the frozen encoders have never seen; once they affect more
+    than ``refit_threshold`` of the new rows, a full ``prepare()`` is recommended.
+    """
+    if not STATE_PATH.exists() or not (MODELS_DIR / 'preprocessor.joblib').exists():
+        raise FileNotFoundError('No processed state found. Run prepare() once before appending.')
+    state = json.loads(STATE_PATH.read_text())
+    key = state.get('key_column')
+
+    raw_rows = None
+    if key:
+        df = load_dataset()
+        raw_rows = len(df)
+        seen = pd.read_csv(KEYS_PATH, dtype=str)[key] if KEYS_PATH.exists() else pd.Series([], dtype=str)
+        df = df[df[key].notna()]
+        df = df[~df[key].astype(str).isin(seen)].drop_duplicates(subset=[key])
+    else:
+        df = load_dataset(skip_rows=state['rows_processed'])
+
+    report = {'new_rows': int(len(df)), 'detected_by': 'key' if key else 'offset'}
+    if df.empty:
+        print('No new rows to append')
+        if raw_rows is not None:
+            # rows with a missing or repeated key are consumed without being processed
+            STATE_PATH.write_text(json.dumps({**state, 'raw_rows': raw_rows}, indent=2))
+        report.update({'unseen_categories': {}, 'unseen_row_fraction': 0.0, 'infrequent_row_fraction': 0.0,
+                       'refit_recommended': False})
+        (OUT_DIR / 'append_report.json').write_text(json.dumps(report, indent=2))
+        return report
+
+    preprocessor = joblib.load(MODELS_DIR / 'preprocessor.joblib')
+    unseen = count_unseen_categories(preprocessor, df)
+    unseen_rows = unseen.pop('_rows_with_unseen', 0)
+    infrequent_rows = unseen.pop('_rows_mapped_to_infrequent', 0)
+    report['unseen_categories'] = unseen
+    # only values encoded as all zeros are lost; those in an infrequent bucket do not call for a refit
+    report['unseen_row_fraction'] = round(unseen_rows / len(df), 4)
+    report['infrequent_row_fraction'] = round(infrequent_rows / len(df), 4)
+    report['refit_recommended'] = report['unseen_row_fraction'] > refit_threshold
+
+    X, feature_names = apply_preprocessor(preprocessor, df, n_jobs=n_jobs)
+    svd_path = MODELS_DIR / 'svd_transformer.joblib'
+    if svd_path.exists():
+        X_reduced = joblib.load(svd_path).transform(X)
+        df_X = pd.DataFrame(X_reduced, columns=[f'svd_{i}' for i in range(X_reduced.shape[1])])
+    else:
+        X = X.toarray() if sparse.issparse(X) else X
+        df_X = pd.DataFrame(X, columns=feature_names) if feature_names else pd.DataFrame(X)
+
+    _write_processed(df, df_X, append=True)
+    _save_state(df, previous=state, raw_rows=raw_rows)
+    (OUT_DIR / 'append_report.json').write_text(json.dumps(report, indent=2))
+    print(f"Appended {len(df)} rows; unseen categories in {report['unseen_row_fraction']:.1%} of them"
+          + (' - full refit recommended' if report['refit_recommended'] else ''))
+    return report
+
+
+def check_drift(path: Path, chunk_size: int = 100_000) -> dict:
+    """Stream a CSV of new loans through the cleaning steps and compare it with the reference profile."""
+    reference = load_reference_profile(MODELS_DIR / REFERENCE_PROFILE_PATH.name)
+    chunks = (clean_dataset(chunk) for chunk in pd.read_csv(path, chunksize=chunk_size))
+    report = detect_drift_chunks(chunks, reference)
+    report['source'] = str(path)
+    DRIFT_REPORT_PATH.write_text(json.dumps(report, indent=2))
+    drifted = ', '.join(f"{d['column']} ({d['status']}, PSI {d['psi']:.3f})" for d in report['columns_with_drift'])
+    print(f"Drift check of {report['rows']} rows: " + (drifted or 'no drift'))
+    return report
 
 
 if __name__ == '__main__':
-    prepare()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--append', action='store_true', help='Only transform rows not processed yet')
+    parser.add_argument('--profile', action='store_true', help='Record per-stage time and memory')
+    parser.add_argument('--resume', action='store_true', help='Skip stages completed by an interrupted run')
+    parser.add_argument('--drift', type=Path, metavar='CSV', help='Compare a CSV of new loans with the reference profile')
+    args = parser.parse_args()
+    if args.drift:
+        check_drift(args.drift)
+    elif args.append:
+        append_new_rows()
+    else:
+        prepare(profile=args.profile, resume=args.resume)
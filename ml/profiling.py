@@ -0,0 +1,117 @@
+"""
+Stage-level profiling for data preparation and training.
+
+Wrap a step in ``with stage('fit_preprocessor', inputs=df) as rec:`` and, inside a ``profiled()``
+block, it records wall time, CPU time, peak traced memory and input/output sizes. Outside a
+``profiled()`` block ``stage`` does nothing, so instrumented code costs nothing unless asked.
+Only this process is traced: work done in joblib/process-pool workers shows up as wall time of
+the stage that waits for it, not as its CPU time or memory.
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+PROFILE_PATH = Path(__file__).resolve().parents[1] / 'data' / 'processed' / 'pipeline_profile.json'
+
+_active = None
+
+
+def size_of(obj) -> dict:
+    """Rows, columns and bytes of an array, sparse matrix or DataFrame (empty for anything else)."""
+    if obj is None:
+        return {}
+    if isinstance(obj, pd.DataFrame):
+        return {'rows': int(obj.shape[0]), 'cols': int(obj.shape[1]), 'bytes': int(obj.memory_usage(deep=False).sum())}
+    if sparse.issparse(obj):
+        nbytes = sum(getattr(obj, part).nbytes for part in ('data', 'indices', 'indptr', 'row', 'col')
+                     if hasattr(obj, part))
+        return {'rows': int(obj.shape[0]), 'cols': int(obj.shape[1]), 'bytes': int(nbytes), 'nnz': int(obj.nnz)}
+    if isinstance(obj, (np.ndarray, pd.Series)):
+        shape = obj.shape
+        return {'rows': int(shape[0]), 'cols': int(shape[1]) if len(shape) > 1 else 1, 'bytes': int(obj.nbytes)}
+    return {}
+
+
+class StageProfiler:
+    """Collects one record per stage, in the order stages start; nested stages get dotted names."""
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name: str, inputs=None):
+        full_name = '.'.join([f['record']['stage'] for f in self._stack[-1:]] + [name])
+        record = {'stage': full_name, 'depth': len(self._stack), 'inputs': size_of(inputs)}
+        self.records.append(record)
+        frame = {'record': record, 'max_peak': 0}
+        if self.trace_memory:
+            frame['start_memory'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            self._stack.pop()
+            if self.trace_memory:
+                # a nested stage resets the peak counter, so carry its peak up to the parent
+                peak = max(frame['max_peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = round((peak - frame['start_memory']) / 2 ** 20, 2)
+                if self._stack:
+                    self._stack[-1]['max_peak'] = max(self._stack[-1]['max_peak'], peak)
+                tracemalloc.reset_peak()
+            record['outputs'] = size_of(record.pop('output', None))
+
+    def report(self) -> list:
+        return self.records
+
+
+@contextmanager
+def stage(name: str, inputs=None):
+    """Profile a step when a ``profiled()`` block is active; set ``rec['output']`` to record the output size."""
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, inputs) as record:
+        yield record
+
+
+@contextmanager
+def profiled(run: str, report_path=None, trace_memory: bool = True):
+    """Activate a profiler for the duration of the block and store its stages under ``run`` in ``report_path``.
+
+    The report is a JSON object keyed by run name (e.g. 'prepare', 'train'); other runs' entries are kept.
+    """
+    global _active
+    profiler = StageProfiler(trace_memory)
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    previous, _active = _active, profiler
+    try:
+        with profiler.stage(run):
+            yield profiler
+    finally:
+        _active = previous
+        if started:
+            tracemalloc.stop()
+        if report_path is not None:
+            write_report(report_path, run, profiler.report())
+
+
+def write_report(path, run: str, stages: list):
+    path = Path(path)
+    report = json.loads(path.read_text()) if path.exists() else {}
+    report[run] = {'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': stages}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
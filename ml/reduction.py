@@ -0,0 +1,162 @@
+"""
+Dimensionality reduction engines for the preprocessed feature matrix.
+
+Every engine returns a fitted transformer exposing ``transform``/``inverse_transform``,
+so it can be saved as `models/svd_transformer.joblib` and used by `app/predict.py` unchanged.
+Engines:
+ - randomized: TruncatedSVD with tunable oversampling and power iterations
+ - arpack: exact truncated SVD (slow, small matrices only)
+ - incremental: IncrementalPCA fitted batch by batch, densifying one batch at a time
+"""
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD, IncrementalPCA
+from sklearn.utils import gen_batches
+
+DEFAULT_REDUCTION = {
+    'method': 'randomized',
+    'n_components': 50,
+    # randomized SVD
+    'n_oversamples': 10,
+    'n_iter': 5,
+    # incremental fitting; each batch is densified, so keep batch_size * n_features in mind
+    'batch_size': 2000,
+    # keep the fewest components whose explained variance ratio reaches this (None keeps all)
+    'variance_target': None,
+    'random_state': 42,
+}
+
+
+def resolve_config(config: dict = None) -> dict:
+    cfg = dict(DEFAULT_REDUCTION)
+    if config:
+        unknown = set(config) - set(DEFAULT_REDUCTION)
+        if unknown:
+            raise ValueError(f"Unknown reduction options: {sorted(unknown)}")
+        cfg.update(config)
+    return cfg
+
+
+def build_reducer(config: dict, n_features: int):
+    cfg = resolve_config(config)
+    n_components = min(cfg['n_components'], n_features)
+    method = cfg['method']
+    if method == 'randomized':
+        # TruncatedSVD needs strictly fewer components than features
+        return TruncatedSVD(n_components=max(1, min(n_components, n_features - 1)), algorithm='randomized',
+                            n_oversamples=cfg['n_oversamples'], n_iter=cfg['n_iter'],
+                            random_state=cfg['random_state'])
+    if method == 'arpack':
+        return TruncatedSVD(n_components=max(1, min(n_components, n_features - 1)), algorithm='arpack',
+                            random_state=cfg['random_state'])
+    if method == 'incremental':
+        return IncrementalPCA(n_components=n_components, batch_size=cfg['batch_size'])
+    raise ValueError(f"Unknown reduction method: {method}")
+
+
+def _dense(X):
+    return X.toarray() if sparse.issparse(X) else np.asarray(X)
+
+
+def partial_fit_chunks(reducer: IncrementalPCA, chunks):
+    """Fit an IncrementalPCA over an iterable of row chunks (sparse chunks are densified one at a time)."""
+    pending = None
+    for chunk in chunks:
+        chunk = _dense(chunk)
+        # every partial_fit call needs at least n_components rows; carry short chunks forward
+        pending = chunk if pending is None else np.vstack([pending, chunk])
+        if pending.shape[0] >= reducer.n_components:
+            reducer.partial_fit(pending)
+            pending = None
+    # a short tail (< n_components rows) after a fitted model is skipped; it cannot be fitted alone
+    if pending is not None and not hasattr(reducer, 'components_'):
+        reducer.partial_fit(pending)
+    # only fit() sets batch_size_, but transform() reads it for sparse input
+    reducer.batch_size_ = reducer.batch_size or 5 * reducer.n_features_in_
+    return reducer
+
+
+def _row_batches(X, batch_size: int, min_batch_size: int = 0):
+    for batch in gen_batches(X.shape[0], batch_size, min_batch_size=min_batch_size):
+        yield X[batch]
+
+
+def truncate_components(reducer, variance_target: float) -> int:
+    """Drop trailing components once the cumulative explained variance ratio reaches the target."""
+    ratios = np.cumsum(reducer.explained_variance_ratio_)
+    k = int(np.searchsorted(ratios, variance_target) + 1)
+    k = min(k, len(ratios))
+    reducer.components_ = reducer.components_[:k]
+    for attr in ('explained_variance_', 'explained_variance_ratio_', 'singular_values_'):
+        if hasattr(reducer, attr):
+            setattr(reducer, attr, getattr(reducer, attr)[:k])
+    reducer.n_components = k
+    if hasattr(reducer, 'n_components_'):
+        reducer.n_components_ = k
+    return k
+
+
+def fit_reducer(X, config: dict = None):
+    """Fit the configured engine on ``X`` and return ``(reducer, X_reduced)``."""
+    cfg = resolve_config(config)
+    reducer = build_reducer(cfg, X.shape[1])
+    if cfg['method'] == 'incremental':
+        partial_fit_chunks(reducer, _row_batches(X, cfg['batch_size'], reducer.n_components))
+        X_reduced = None
+    else:
+        X_reduced = reducer.fit_transform(X)
+    if cfg['variance_target'] is not None:
+        k = truncate_components(reducer, cfg['variance_target'])
+        if X_reduced is not None:
+            X_reduced = X_reduced[:, :k]
+    if X_reduced is None:
+        X_reduced = transform_in_batches(reducer, X, cfg['batch_size'])
+    return reducer, X_reduced
+
+
+def transform_in_batches(reducer, X, batch_size: int = DEFAULT_REDUCTION['batch_size']) -> np.ndarray:
+    return np.vstack([reducer.transform(_dense(b)) for b in _row_batches(X, batch_size)])
+
+
+def reconstruction_error(reducer, X, batch_size: int = DEFAULT_REDUCTION['batch_size']) -> float:
+    """Relative Frobenius error ||X - X_hat|| / ||X||, computed batch by batch."""
+    err = total = 0.0
+    for batch in _row_batches(X, batch_size):
+        dense = _dense(batch)
+        approx = reducer.inverse_transform(reducer.transform(dense))
+        err += float(((dense - approx) ** 2).sum())
+        total += float((dense ** 2).sum())
+    return float(np.sqrt(err / total)) if total > 0 else 0.0
+
+
+def describe_reducer(reducer, config: dict) -> dict:
+    cfg = resolve_config(config)
+    ratio = getattr(reducer, 'explained_variance_ratio_', None)
+    return {
+        'method': cfg['method'],
+        'n_components': int(reducer.components_.shape[0]),
+        'explained_variance': float(np.sum(ratio)) if ratio is not None else None,
+        'config': cfg,
+    }
+
+
+def benchmark_reducers(X, configs: dict) -> dict:
+    """Fit every named config on ``X`` and compare fit time, peak traced memory and reconstruction quality."""
+    results = {}
+    for name, config in configs.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        reducer, _ = fit_reducer(X, config)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            **describe_reducer(reducer, config),
+            'fit_seconds': round(elapsed, 4),
+            'peak_memory_mb': round(peak / 2 ** 20, 2),
+            'reconstruction_error': reconstruction_error(reducer, X),
+        }
+    return results
@@ -0,0 +1,137 @@
+"""
+Cheap check of whether the models need a full retrain.
+
+Only the raw rows added since the models were last trained are read (``ml.train.run_all`` records the
+raw CSV offset in ``training_state.json``), streamed in chunks:
+ - volume: new rows as a share of the rows the models were trained on
+ - drift: PSI of the new rows against the saved reference profile (``ml.drift``)
+ - live performance: accuracy of the served classifier on new rows that already carry a loan status,
+   compared with its test accuracy from ``classification_metrics.json``
+Retraining is recommended when any of ``DEFAULT_TRIGGERS`` is crossed; the decision and the numbers
+behind it are saved to data/processed/retrain_check.json.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import prepare_data as prep
+from .drift import PSI_ALERT, REFERENCE_PROFILE_PATH, DriftAccumulator, load_reference_profile
+from .train import TRAINING_STATE_PATH
+
+DEFAULT_TRIGGERS = {
+    # retrain once new rows reach this share of the rows trained on
+    'new_row_fraction': 0.1,
+    # ... or any feature's PSI of the new rows reaches this
+    'max_psi': PSI_ALERT,
+    # ... or live accuracy falls this far below test accuracy
+    'max_accuracy_drop': 0.05,
+    # drift and accuracy on fewer new (labelled) rows than this are too noisy to act on
+    'min_rows': 500,
+}
+# labelled new rows scored for the live accuracy estimate
+MAX_EVAL_ROWS = 20_000
+
+
+def _baseline_accuracy():
+    """Test accuracy of the served classifier recorded by ``ml.train`` (None when unknown)."""
+    backends, metrics = prep.OUT_DIR / 'classification_backends.json', prep.OUT_DIR / 'classification_metrics.json'
+    if not backends.exists() or not metrics.exists():
+        return None
+    served = json.loads(backends.read_text())['served']
+    return json.loads(metrics.read_text()).get(f'metrics_{served}', {}).get('accuracy')
+
+
+def _live_accuracy(raw: pd.DataFrame):
+    """Accuracy of the served classifier on labelled raw rows, scored like ``ml.parity``'s training path."""
+    from .parity import training_features
+
+    model_path, preproc_path = prep.MODELS_DIR / 'classification_model.pkl', prep.MODELS_DIR / 'preprocessor.joblib'
+    if not model_path.exists() or not preproc_path.exists():
+        return None
+    svd_path = prep.MODELS_DIR / 'svd_transformer.joblib'
+    X = training_features(raw, joblib.load(preproc_path), joblib.load(svd_path) if svd_path.exists() else None)
+    y = prep.clean_dataset(raw)['loan_status'].astype(str).str.strip().to_numpy()
+    return float(np.mean(joblib.load(model_path).predict(X).astype(str) == y))
+
+
+def check_retraining(path: Path = None, triggers: dict = None, chunk_size: int = 100_000,
+                     max_eval_rows: int = MAX_EVAL_ROWS) -> dict:
+    """Stream the rows added since the last training run and decide whether to retrain."""
+    cfg = {**DEFAULT_TRIGGERS, **(triggers or {})}
+    path = Path(path or prep.DATA_PATH)
+    profile_path = prep.MODELS_DIR / REFERENCE_PROFILE_PATH.name
+    state_path = prep.OUT_DIR / TRAINING_STATE_PATH.name
+    start = time.perf_counter()
+    report = {'source': str(path), 'triggers': cfg, 'trained_rows': None, 'new_rows': 0, 'max_psi': None,
+              'drifted_columns': [], 'live_accuracy': None, 'test_accuracy': None, 'labelled_rows': 0,
+              'reasons': []}
+
+    if not state_path.exists() or not profile_path.exists():
+        report['reasons'].append('no previous training run')
+    else:
+        # appended rows that were prepared but not trained on yet still count as new
+        state = json.loads(state_path.read_text())
+        trained = state['rows_trained']
+        report['trained_rows'] = trained
+        # key-based appends drop rows, so the raw offset can run ahead of the processed row count
+        offset = state.get('raw_rows_trained', trained)
+        drift = DriftAccumulator(load_reference_profile(profile_path))
+        labelled = []
+        n_labelled = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_size, skiprows=range(1, offset + 1)):
+            report['new_rows'] += len(chunk)
+            cleaned = prep.clean_dataset(chunk)
+            drift.update(cleaned)
+            if n_labelled < max_eval_rows and 'loan_status' in cleaned.columns:
+                rows = chunk[cleaned['loan_status'].notna().to_numpy()].iloc[:max_eval_rows - n_labelled]
+                labelled.append(rows)
+                n_labelled += len(rows)
+        new = report['new_rows']
+
+        if trained and new / trained >= cfg['new_row_fraction']:
+            report['reasons'].append(f'{new} new rows ({new / trained:.1%} of {trained} trained on)')
+        if new >= cfg['min_rows']:
+            result = drift.result()
+            report['max_psi'] = result['max_psi']
+            report['drifted_columns'] = [d['column'] for d in result['columns_with_drift']
+                                         if d['psi'] >= cfg['max_psi']]
+            if report['drifted_columns']:
+                report['reasons'].append(f"PSI {result['max_psi']:.3f} >= {cfg['max_psi']} in "
+                                         f"{report['drifted_columns']}")
+        report['labelled_rows'] = n_labelled
+        report['test_accuracy'] = _baseline_accuracy()
+        if n_labelled >= cfg['min_rows'] and report['test_accuracy'] is not None:
+            report['live_accuracy'] = _live_accuracy(pd.concat(labelled, ignore_index=True))
+            drop = report['test_accuracy'] - (report['live_accuracy'] if report['live_accuracy'] is not None else np.nan)
+            if drop >= cfg['max_accuracy_drop']:
+                report['reasons'].append(f"live accuracy {report['live_accuracy']:.3f} is {drop:.3f} below "
+                                         f"test accuracy {report['test_accuracy']:.3f}")
+
+    report['retrain'] = bool(report['reasons'])
+    report['check_seconds'] = round(time.perf_counter() - start, 3)
+    (prep.OUT_DIR / 'retrain_check.json').write_text(json.dumps(report, indent=2))
+    return report
+
+
+def describe(report: dict) -> str:
+    """One line explaining the decision."""
+    if report['retrain']:
+        return 'Retraining: ' + '; '.join(report['reasons'])
+    psi = f"max PSI {report['max_psi']:.3f}" if report['max_psi'] is not None else 'drift not checked'
+    accuracy = (f"live accuracy {report['live_accuracy']:.3f}" if report['live_accuracy'] is not None
+                else 'no live accuracy')
+    return f"No retraining needed: {report['new_rows']} new rows, {psi}, {accuracy}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=Path, help='Raw loans CSV (default data/bank_loan.csv)')
+    for name, value in DEFAULT_TRIGGERS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    print(describe(check_retraining(args.data, {name: getattr(args, name) for name in DEFAULT_TRIGGERS})))
@@ -0,0 +1,103 @@
+"""
+Cost-aware model selection over the per-candidate reports built by ``ml.train``.
+
+Each candidate report carries its test metrics plus serving cost from ``ml.evaluate.serving_cost``
+(``single_p99_ms``, ``size_bytes``, ...). Strategies:
+ - metric: best test metric, cost ignored
+ - budget: best metric among candidates within ``max_p99_ms`` and ``max_size_mb``
+   (falls back to the fastest candidate when none fits)
+ - pareto: among candidates not dominated on (metric, p99 latency, size), the fastest one whose
+   metric is within ``tolerance`` (relative) of the best
+"""
+DEFAULT_POLICY = {
+    'strategy': 'metric',
+    # None uses the task default: macro F1 for classification, RMSE for regression
+    'metric': None,
+    'max_p99_ms': None,
+    'max_size_mb': None,
+    # pareto: accept this much relative metric loss (0.01 = 1%) for a faster model
+    'tolerance': 0.01,
+}
+
+TASK_METRICS = {'classification': 'f1', 'regression': 'rmse'}
+LOWER_IS_BETTER = {'rmse', 'mae'}
+
+
+def resolve_policy(policy: dict = None) -> dict:
+    cfg = dict(DEFAULT_POLICY)
+    if policy:
+        unknown = set(policy) - set(DEFAULT_POLICY)
+        if unknown:
+            raise ValueError(f"Unknown selection policy options: {sorted(unknown)}")
+        cfg.update(policy)
+    return cfg
+
+
+def _quality(report: dict, metric: str) -> float:
+    """Metric oriented so that higher is better."""
+    return -report[metric] if metric in LOWER_IS_BETTER else report[metric]
+
+
+def _over_budget(report: dict, cfg: dict) -> list:
+    reasons = []
+    if cfg['max_p99_ms'] is not None and report['single_p99_ms'] > cfg['max_p99_ms']:
+        reasons.append(f"p99 {report['single_p99_ms']:.2f} ms > {cfg['max_p99_ms']} ms")
+    if cfg['max_size_mb'] is not None and report['size_bytes'] / 2 ** 20 > cfg['max_size_mb']:
+        reasons.append(f"size {report['size_bytes'] / 2 ** 20:.2f} MB > {cfg['max_size_mb']} MB")
+    return reasons
+
+
+def pareto_front(reports: dict, metric: str) -> list:
+    """Candidates no other candidate beats on metric, p99 latency and size at once."""
+    def costs(r):
+        return (-_quality(r, metric), r['single_p99_ms'], r['size_bytes'])
+
+    front = []
+    for name, report in reports.items():
+        mine = costs(report)
+        dominated = any(all(o <= m for o, m in zip(costs(other), mine)) and costs(other) != mine
+                        for other_name, other in reports.items() if other_name != name)
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def select_model(reports: dict, task: str, policy: dict = None):
+    """Pick a candidate from ``{name: report}``; returns ``(name, analysis)`` for saving with the model."""
+    cfg = resolve_policy(policy)
+    metric = cfg['metric'] or TASK_METRICS[task]
+    rejected = {name: _over_budget(r, cfg) for name, r in reports.items()}
+    rejected = {name: reasons for name, reasons in rejected.items() if reasons}
+    front = pareto_front(reports, metric)
+    strategy = cfg['strategy']
+    if strategy == 'metric':
+        pool = list(reports)
+    elif strategy == 'budget':
+        pool = [name for name in reports if name not in rejected]
+    elif strategy == 'pareto':
+        pool = [name for name in front if name not in rejected]
+    else:
+        raise ValueError(f"Unknown selection strategy: {strategy}")
+
+    if not pool:
+        chosen = min(reports, key=lambda n: reports[n]['single_p99_ms'])
+        reason = 'no candidate within budget; kept the lowest-latency one'
+    elif strategy == 'pareto':
+        best = max(_quality(reports[n], metric) for n in pool)
+        close = [n for n in pool if _quality(reports[n], metric) >= best - cfg['tolerance'] * abs(best)]
+        chosen = min(close, key=lambda n: reports[n]['single_p99_ms'])
+        reason = f'fastest Pareto-optimal candidate within {cfg["tolerance"]:.0%} of the best {metric}'
+    else:
+        chosen = max(pool, key=lambda n: _quality(reports[n], metric))
+        reason = f'best {metric}' + (' within budget' if strategy == 'budget' else '')
+    return chosen, {
+        'task': task,
+        'policy': {**cfg, 'metric': metric},
+        'chosen': chosen,
+        'reason': reason,
+        'pareto_front': front,
+        'over_budget': rejected,
+        'candidates': {name: {k: r.get(k) for k in (metric, 'single_p50_ms', 'single_p99_ms', 'batch_ms',
+                                                   'rows_per_sec', 'size_bytes', 'fit_seconds')}
+                       for name, r in reports.items()},
+    }
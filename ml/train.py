@@ -1,153 +1,604 @@
 """Training script to train classification, regression, PCA and clustering models."""
+import argparse
+import json
+import time
+from contextlib import nullcontext
 from pathlib import Path
 import pandas as pd
 import joblib
 import numpy as np
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
 
-from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression, LinearRegression
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sklearn.metrics import f1_score
+from sklearn.model_selection import KFold, StratifiedKFold
 
-from .evaluate import classification_metrics, regression_metrics, clustering_metrics
+from .backends import BACKENDS, DEFAULT_GROWTH, grow_forest, make_estimator
+from .clustering import fit_clusterer
+from .checkpoints import Checkpoints, atomic_write
+from .cv import cross_validate
+from .evaluate import (
+    DEFAULT_LOSS, classification_metrics, regression_metrics, log_metrics, serving_cost, threshold_sweep,
+)
+from .parallel import limit_threads, resolve_workers
+from .profiling import PROFILE_PATH, profiled, stage
+from .selection import DEFAULT_POLICY, select_model
+from .tuning import tune_all
 
 ROOT = Path(__file__).resolve().parents[1]
 OUT_DIR = ROOT / 'data' / 'processed'
 MODELS_DIR = ROOT / 'models'
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
+SELECTION_PATH = MODELS_DIR / 'model_selection.json'
+# cost-optimal approval cutoff of the served classifier, read by app/predict.py
+THRESHOLD_PATH = MODELS_DIR / 'decision_threshold.json'
+# the class whose probability the cutoff applies to
+POSITIVE_LABEL = 'default'
+TUNED_PARAMS_PATH = OUT_DIR / 'tuned_params.json'
+# processed rows and raw CSV lines the current models were trained on, read by ml.retraining
+TRAINING_STATE_PATH = OUT_DIR / 'training_state.json'
+# written by ml.prepare_data; its raw_rows is the raw CSV offset behind the processed data
+PREPARE_STATE_PATH = OUT_DIR / 'prepare_state.json'
+# files each training stage leaves behind; a checkpoint is only trusted while they are unchanged
+STAGE_ARTIFACTS = {
+    'classification': [MODELS_DIR / 'classification_model.pkl', OUT_DIR / 'classification_metrics.json',
+                       OUT_DIR / 'classification_backends.json', OUT_DIR / 'classification_thresholds.json',
+                       THRESHOLD_PATH],
+    'regression': [MODELS_DIR / 'regression_model.pkl', OUT_DIR / 'regression_metrics.json',
+                   OUT_DIR / 'regression_backends.json'],
+    'segmentation': [MODELS_DIR / 'pca_model.pkl', MODELS_DIR / 'clustering_model.pkl',
+                     OUT_DIR / 'pca_clusters.csv', OUT_DIR / 'clustering_metrics.json'],
+}
+TARGET_COLS = ['loan_status', 'loan_amount', 'interest_rate']
 
 
-def train_classification():
-    path = OUT_DIR / 'for_classification.csv'
-    if not path.exists():
-        print('Processed classification data not found. Run ml.prepare_data')
+class TrainingData:
+    """Processed features loaded once and shared, read-only, by every trainer in ``run_all``.
+
+    The feature matrix is parsed from the processed CSVs on first use and cached as
+    ``training_features.npy`` in train/test split order, so later runs memory-map it and
+    each task's train/test split is a contiguous view instead of a copy.
+    """
+
+    def __init__(self, X, y_class, y_reg, reg_target, n_train, feature_names, order, cache_key: str = None):
+        self.X = X
+        self.y_class = y_class
+        self.y_reg = y_reg
+        self.reg_target = reg_target
+        self.n_train = n_train
+        self.feature_names = feature_names
+        self.order = order
+        # identifies the processed data this matrix was built from (used to key cached CV results)
+        self.cache_key = cache_key
+        self._splits = {}
+        self._folds = {}
+
+    @classmethod
+    def load(cls, out_dir: Path = None, test_size: float = 0.2, random_state: int = 42):
+        out_dir = out_dir or OUT_DIR
+        cls_path = out_dir / 'for_classification.csv'
+        reg_path = out_dir / 'for_regression.csv'
+        if not cls_path.exists():
+            return None
+        features_path = out_dir / 'training_features.npy'
+        meta_path = out_dir / 'training_cache.joblib'
+        key = {
+            'sources': {p.name: [p.stat().st_mtime_ns, p.stat().st_size] for p in (cls_path, reg_path) if p.exists()},
+            'test_size': test_size,
+            'random_state': random_state,
+        }
+        if features_path.exists() and meta_path.exists():
+            meta = joblib.load(meta_path)
+            if meta['key'] == key:
+                return cls(np.load(features_path, mmap_mode='r'), **meta['fields'], cache_key=joblib.hash(key))
+
+        df = pd.read_csv(cls_path)
+        n = df.shape[0]
+        # one shuffled order shared by all tasks; rows [:n_train] train, the rest test
+        order = np.random.RandomState(random_state).permutation(n)
+        n_train = n - int(np.ceil(test_size * n))
+
+        y_class = None
+        if 'loan_status' in df.columns:
+            labels = df['loan_status']
+            # normalize labels
+            y_class = labels.astype(str).str.strip().where(labels.notna()).to_numpy(dtype=object)[order]
+        reg_target, y_reg = None, None
+        if reg_path.exists():
+            header = pd.read_csv(reg_path, nrows=0).columns
+            reg_target = next((t for t in ['loan_amount', 'interest_rate'] if t in header), None)
+            if reg_target:
+                y_reg = pd.read_csv(reg_path, usecols=[reg_target])[reg_target].to_numpy(dtype=float)[order]
+
+        features = df.drop(columns=[c for c in TARGET_COLS if c in df.columns]).select_dtypes(include=[np.number])
+        X = np.nan_to_num(features.to_numpy(dtype=np.float64)[order])
+        np.save(features_path, X)
+        fields = {'y_class': y_class, 'y_reg': y_reg, 'reg_target': reg_target, 'n_train': n_train,
+                  'feature_names': features.columns.tolist(), 'order': order}
+        joblib.dump({'key': key, 'fields': fields}, meta_path)
+        return cls(np.load(features_path, mmap_mode='r'), **fields, cache_key=joblib.hash(key))
+
+    def split(self, name: str):
+        """Return ``X_train, X_test, y_train, y_test`` for rows where target ``name`` is present.
+
+        Computed once per target; feature blocks are views of the shared matrix when no rows are dropped.
+        """
+        if name not in self._splits:
+            y = self.target(name)
+            valid = pd.notna(y)
+            n = self.n_train
+            train, test = valid[:n], valid[n:]
+            X_train = self.X[:n] if train.all() else self.X[:n][train]
+            X_test = self.X[n:] if test.all() else self.X[n:][test]
+            self._splits[name] = (X_train, X_test, y[:n][train], y[n:][test])
+        return self._splits[name]
+
+    def target(self, name: str) -> np.ndarray:
+        return self.y_class if name == 'loan_status' else self.y_reg
+
+    def folds(self, name: str, n_folds: int = 5, random_state: int = 42) -> list:
+        """``(train_rows, test_rows)`` index pairs into ``X`` over every row where target ``name`` is present.
+
+        Built once per target and fold count; classification folds are stratified.
+        """
+        key = (name, n_folds, random_state)
+        if key not in self._folds:
+            y = self.target(name)
+            rows = np.flatnonzero(pd.notna(y))
+            if name == 'loan_status':
+                splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+            else:
+                splitter = KFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+            self._folds[key] = [(rows[train], rows[test]) for train, test in splitter.split(rows, y[rows])]
+        return self._folds[key]
+
+    def in_file_order(self, rows: np.ndarray) -> np.ndarray:
+        """Undo the split shuffle for per-row outputs aligned with ``X``."""
+        out = np.empty_like(rows)
+        out[self.order] = rows
+        return out
+
+
+def _load_data(data):
+    if data is None:
+        data = TrainingData.load()
+    if data is None:
+        print('Processed data not found. Run ml.prepare_data')
+    return data
+
+
+# hyperparameters used unless a tuning run (ml.tuning) supplies better ones
+DEFAULT_PARAMS = {
+    'rf_classifier': {'n_estimators': 50, 'max_depth': 15},
+    'rf_regressor': {'n_estimators': 20, 'max_depth': 10},
+    'hgb_classifier': {'max_iter': 200},
+    'hgb_regressor': {'max_iter': 200},
+    'xgb_classifier': {'n_estimators': 200, 'max_depth': 6, 'learning_rate': 0.1},
+    'xgb_regressor': {'n_estimators': 200, 'max_depth': 6, 'learning_rate': 0.1},
+    'kmeans': {'n_clusters': 5, 'n_init': 5},
+}
+
+
+def _params(family: str, params: dict = None) -> dict:
+    return {**DEFAULT_PARAMS[family], **((params or {}).get(family) or {})}
+
+
+def classification_candidates(n_jobs: int = -1, params: dict = None, backends=('rf',)) -> dict:
+    # Use RandomForest for better confidence scores
+    candidates = {'rf': make_estimator('classifier', 'rf', _params('rf_classifier', params), n_jobs)}
+    # Also try LogisticRegression for comparison
+    candidates['lr'] = LogisticRegression(max_iter=1000)
+    for backend in backends:
+        if backend != 'rf':
+            candidates[backend] = make_estimator('classifier', backend, _params(f'{backend}_classifier', params), n_jobs)
+    return candidates
+
+
+def regression_candidates(n_jobs: int = -1, params: dict = None, backends=('rf',)) -> dict:
+    candidates = {'lr': LinearRegression()}
+    for backend in dict.fromkeys(('rf',) + tuple(backends)):
+        # Faster RandomForest with fewer estimators and parallel jobs, plus any boosting backends
+        candidates[backend] = make_estimator('regressor', backend, _params(f'{backend}_regressor', params), n_jobs)
+    return candidates
+
+
+def _fit(estimator, X, y=None, threads: int = None, growth: dict = None):
+    # cap BLAS/OpenMP threads to this task's share of the core budget
+    start = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        if growth is not None and 'oob_score' in estimator.get_params():
+            # bagged forests grow until the OOB score levels off instead of to a fixed size
+            grow_forest(estimator, X, y, growth)
+        else:
+            estimator.fit(X, y)
+    estimator.fit_seconds_ = time.perf_counter() - start
+    return estimator
+
+
+def _fit_candidates(candidates: dict, X, y, growth: dict = None) -> dict:
+    models = {}
+    for name, est in candidates.items():
+        with stage(f'fit_{name}', inputs=X):
+            models[name] = _fit(est, X, y, growth=growth)
+    return models
+
+
+def _metrics_artifact(models: dict, metrics: dict, cv: dict = None) -> dict:
+    """Test metrics per candidate plus the tree count and OOB curve of any forest grown by ``grow_forest``
+    and, when cross-validated, the mean/std over folds."""
+    out = {f'metrics_{name}': m for name, m in metrics.items()}
+    out.update({f'growth_{name}': model.growth_ for name, model in models.items() if hasattr(model, 'growth_')})
+    out.update({f'cv_{name}': {'n_folds': len(r['folds']), 'mean': r['mean'], 'std': r['std'],
+                               'cached_folds': r['cached_folds']}
+                for name, r in (cv or {}).items()})
+    return out
+
+
+def _backend_report(models: dict, metrics: dict, X_test) -> dict:
+    """Fit time, artifact size, predict latency and test metrics for every fitted candidate."""
+    return {name: {'model': type(model).__name__, 'fit_seconds': getattr(model, 'fit_seconds_', None),
+                   **metrics[name], **serving_cost(model, X_test)}
+            for name, model in models.items()}
+
+
+def _sweep(model, X_test, y_test, loss: dict = None):
+    """Threshold sweep of a binary classifier's P(default) on the test set (None when not applicable)."""
+    classes = list(getattr(model, 'classes_', []))
+    if POSITIVE_LABEL not in classes or len(classes) != 2 or not hasattr(model, 'predict_proba'):
+        return None
+    scores = model.predict_proba(X_test)[:, classes.index(POSITIVE_LABEL)]
+    return threshold_sweep(y_test, scores, POSITIVE_LABEL, loss)
+
+
+def _save_model(model, path: Path):
+    # write-then-rename so a crash never leaves a truncated pickle for serving to load
+    atomic_write(path, lambda tmp: joblib.dump(model, tmp))
+
+
+def _record_selection(task: str, analysis: dict):
+    """Keep the selection analysis of each task next to the saved models."""
+    selections = json.loads(SELECTION_PATH.read_text()) if SELECTION_PATH.exists() else {}
+    selections[task] = analysis
+    log_metrics(SELECTION_PATH, selections)
+
+
+def _fit_segmentation(X, n_components: int, n_clusters: int, threads: int = None, params: dict = None,
+                      clustering: dict = None, n_jobs: int = None):
+    """Fit PCA then the clustering engine (``ml.clustering``); returns ``(pca, kmeans, selection)``."""
+    config = {**_params('kmeans', params), **(clustering or {})}
+    if not (params or {}).get('kmeans') and 'n_clusters' not in (clustering or {}):
+        config['n_clusters'] = n_clusters
+    with threadpool_limits(limits=threads):
+        # Use 50 components to match SVD from prepare_data (matches what _prepare_features returns)
+        pca = PCA(n_components=min(n_components, X.shape[1], X.shape[0]), random_state=42)
+        X_p = pca.fit_transform(X)
+        kmeans, selection = fit_clusterer(X_p, config, n_jobs=n_jobs)
+    return pca, kmeans, selection
+
+
+def _check_serve(serve: str, backends, policy: dict = None):
+    """Fail before any fit when the pinned ``serve`` backend would not be trained."""
+    if policy is None and serve != 'rf' and serve not in backends:
+        raise ValueError(f"serve={serve!r} is not trained: it must be 'rf' or one of backends={tuple(backends)}")
+
+
+def train_classification(data: TrainingData = None, fitted: dict = None, params: dict = None,
+                         backends=('rf',), serve: str = 'rf', growth: dict = None, policy: dict = None,
+                         cv_folds: int = None, n_jobs: int = -1, loss: dict = None):
+    """Fit the classification candidates and save the ``serve`` backend (RandomForest by default).
+
+    ``backends`` adds gradient-boosting candidates ('hgb', 'xgb'; see ``ml.backends``); each one's cost
+    and accuracy go to ``classification_backends.json``. With ``growth`` set (``{}`` for the
+    ``DEFAULT_GROWTH`` settings) the forest is grown with OOB early stopping. A selection ``policy``
+    (``ml.selection``) picks the saved model from accuracy, latency and size instead of ``serve``.
+    ``cv_folds`` adds parallel k-fold mean/std metrics (``ml.cv``) for every candidate.
+    Every candidate also gets ROC/PR metrics from a threshold sweep; the served model's sweep picks the
+    approval cutoff that minimises expected loss under ``loss`` (``ml.evaluate.DEFAULT_LOSS``), saved to
+    ``decision_threshold.json`` for serving.
+    """
+    _check_serve(serve, backends, policy)
+    data = _load_data(data)
+    if data is None:
         return None
-    df = pd.read_csv(path)
-    if 'loan_status' not in df.columns:
+    if data.y_class is None:
         print('No loan_status column found for classification')
         return None
-    # drop rows with missing target
-    df = df[df['loan_status'].notna()].copy()
-    if df.shape[0] == 0:
+    X_train, X_test, y_train, y_test = data.split('loan_status')
+    if len(y_train) == 0:
         print('No valid rows with loan_status for classification')
         return None
-    # normalize labels
-    df['loan_status'] = df['loan_status'].astype(str).str.strip()
-    y = df['loan_status']
-    X = df.drop(columns=['loan_status'])
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-    # Use RandomForest for better confidence scores
-    rf = RandomForestClassifier(n_estimators=50, max_depth=15, n_jobs=-1, random_state=42)
-    rf.fit(X_train, y_train)
-    y_pred_rf = rf.predict(X_test)
-    metrics_rf = classification_metrics(y_test, y_pred_rf)
+    candidates = classification_candidates(params=params, backends=backends)
+    models = fitted or _fit_candidates(candidates, X_train, y_train, growth)
+    with stage('metrics', inputs=X_test):
+        metrics = {name: classification_metrics(y_test, model.predict(X_test)) for name, model in models.items()}
+        sweeps = {name: _sweep(model, X_test, y_test, loss) for name, model in models.items()}
+        for name, sweep in sweeps.items():
+            if sweep is not None:
+                metrics[name].update(roc_auc=sweep['roc_auc'], average_precision=sweep['average_precision'],
+                                     min_expected_loss=sweep['optimal']['expected_loss'])
+    with stage('cost_report', inputs=X_test):
+        report = _backend_report(models, metrics, X_test)
+    cv = None
+    if cv_folds:
+        with stage('cross_validate', inputs=data.X):
+            cv = cross_validate(data, 'loan_status', classification_candidates(params=params, backends=backends),
+                                cv_folds, n_jobs=n_jobs)
 
-    # Also try LogisticRegression for comparison
-    lr = LogisticRegression(max_iter=1000)
-    lr.fit(X_train, y_train)
-    y_pred = lr.predict(X_test)
-    metrics_lr = classification_metrics(y_test, y_pred)
-
-    # Use RandomForest as it gives better confidence scores
-    best = ('rf', rf, metrics_rf)
-    joblib.dump(best[1], MODELS_DIR / 'classification_model.pkl')
-    joblib.dump({'metrics_rf': metrics_rf, 'metrics_lr': metrics_lr}, OUT_DIR / 'classification_metrics.json')
-    print('Saved classification model and metrics')
+    if policy is None:
+        # Use RandomForest (unless another backend is requested) as it gives better confidence scores
+        _, analysis = select_model(report, 'classification')
+        analysis.update(chosen=serve, reason='pinned by serve', policy=None)
+    else:
+        serve, analysis = select_model(report, 'classification', policy)
+    best = (serve, models[serve], metrics[serve])
+    sweep = sweeps[serve]
+    with stage('save'):
+        _record_selection('classification', analysis)
+        _save_model(best[1], MODELS_DIR / 'classification_model.pkl')
+        log_metrics(OUT_DIR / 'classification_metrics.json', _metrics_artifact(models, metrics, cv))
+        log_metrics(OUT_DIR / 'classification_backends.json', {'served': serve, 'backends': report})
+        log_metrics(OUT_DIR / 'classification_thresholds.json', {'served': serve, **(sweep or {})})
+        if sweep is not None:
+            cutoff = {'model': serve, 'positive_label': sweep['positive_label'], 'loss': sweep['loss'],
+                      **sweep['optimal']}
+            atomic_write(THRESHOLD_PATH, lambda tmp: Path(tmp).write_text(json.dumps(cutoff, indent=2)))
+            print(f"Cost-optimal cutoff P({POSITIVE_LABEL}) >= {cutoff['threshold']:.3f}: expected loss "
+                  f"{cutoff['expected_loss']:.4f} vs {sweep['expected_loss_at_0_5']:.4f} at 0.5")
+        else:
+            THRESHOLD_PATH.unlink(missing_ok=True)
+    print(f'Saved classification model ({serve}) and metrics')
     return best
 
 
-def train_regression():
-    path = OUT_DIR / 'for_regression.csv'
-    if not path.exists():
-        print('Processed regression data not found. Run ml.prepare_data')
+def train_regression(data: TrainingData = None, fitted: dict = None, params: dict = None, backends=('rf',),
+                     growth: dict = None, policy: dict = None, cv_folds: int = None, n_jobs: int = -1):
+    """Fit the regression candidates and save the one chosen by ``policy`` (lowest test RMSE by default).
+
+    Per-candidate cost and accuracy go to ``regression_backends.json``; ``growth``, ``policy`` and
+    ``cv_folds`` as in ``train_classification``.
+    """
+    data = _load_data(data)
+    if data is None:
         return None
-    df = pd.read_csv(path)
-    target = None
-    for t in ['loan_amount', 'interest_rate']:
-        if t in df.columns:
-            target = t
-            break
-    if not target:
+    if not data.reg_target:
         print('No regression target found')
         return None
+    if data.X.shape[1] == 0:
+        print('No numeric features available for regression after preprocessing')
+        return None
     # drop rows with missing regression target
-    df = df[df[target].notna()].copy()
-    if df.shape[0] == 0:
+    X_train, X_test, y_train, y_test = data.split(data.reg_target)
+    if len(y_train) == 0:
         print('No valid rows with regression target')
         return None
-    y = df[target]
-    X = df.drop(columns=[target])
-    # keep numeric features only for regression (simple approach)
-    X = X.select_dtypes(include=[np.number]).copy()
-    if X.shape[1] == 0:
-        print('No numeric features available for regression after preprocessing')
-        return None
-    X = X.fillna(0)
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    lr = LinearRegression()
-    lr.fit(X_train, y_train)
-    y_pred = lr.predict(X_test)
-    metrics_lr = regression_metrics(y_test, y_pred)
-
-    # Faster RandomForest with fewer estimators and parallel jobs
-    rf = RandomForestRegressor(n_estimators=20, max_depth=10, n_jobs=-1, random_state=42)
-    rf.fit(X_train, y_train)
-    y_pred_rf = rf.predict(X_test)
-    metrics_rf = regression_metrics(y_test, y_pred_rf)
-
-    best = ('lr', lr, metrics_lr) if metrics_lr['rmse'] <= metrics_rf['rmse'] else ('rf', rf, metrics_rf)
-    joblib.dump(best[1], MODELS_DIR / 'regression_model.pkl')
-    joblib.dump({'metrics_lr': metrics_lr, 'metrics_rf': metrics_rf}, OUT_DIR / 'regression_metrics.json')
-    print('Saved regression model and metrics')
+
+    candidates = regression_candidates(params=params, backends=backends)
+    models = fitted or _fit_candidates(candidates, X_train, y_train, growth)
+    with stage('metrics', inputs=X_test):
+        metrics = {name: regression_metrics(y_test, model.predict(X_test)) for name, model in models.items()}
+    with stage('cost_report', inputs=X_test):
+        report = _backend_report(models, metrics, X_test)
+    cv = None
+    if cv_folds:
+        with stage('cross_validate', inputs=data.X):
+            cv = cross_validate(data, data.reg_target, regression_candidates(params=params, backends=backends),
+                                cv_folds, n_jobs=n_jobs)
+
+    name, analysis = select_model(report, 'regression', policy or DEFAULT_POLICY)
+    best = (name, models[name], metrics[name])
+    with stage('save'):
+        _record_selection('regression', analysis)
+        _save_model(best[1], MODELS_DIR / 'regression_model.pkl')
+        log_metrics(OUT_DIR / 'regression_metrics.json', _metrics_artifact(models, metrics, cv))
+        log_metrics(OUT_DIR / 'regression_backends.json', {'served': name, 'backends': report})
+    print(f'Saved regression model ({name}) and metrics')
     return best
 
 
-def train_pca_and_clustering(n_components=50, n_clusters=5):
-    path = OUT_DIR / 'for_classification.csv'
-    if not path.exists():
-        print('Processed data not found for PCA/Clustering')
+def train_pca_and_clustering(n_components=50, n_clusters=5, data: TrainingData = None, fitted: tuple = None,
+                             params: dict = None, clustering: dict = None, n_jobs: int = -1):
+    """Fit PCA and segment customers; ``clustering`` overrides ``ml.clustering.DEFAULT_CLUSTERING``.
+
+    Pass ``clustering={'k_values': [3, 4, 5, 6, 8]}`` to fit those k in parallel and keep the best.
+    """
+    data = _load_data(data)
+    if data is None:
         return None
-    df = pd.read_csv(path)
-    # drop any target columns
-    for c in ['loan_status', 'loan_amount', 'interest_rate']:
-        if c in df.columns:
-            df = df.drop(columns=[c])
-    X = df.values
-
-    # Use 50 components to match SVD from prepare_data (matches what _prepare_features returns)
-    pca = PCA(n_components=min(n_components, X.shape[1], X.shape[0]), random_state=42)
-    X_p = pca.fit_transform(X)
-    joblib.dump(pca, MODELS_DIR / 'pca_model.pkl')
-    print('Saved PCA model')
-
-    # Use 5 clusters instead of 3 (matches n_components better)
-    kmeans = KMeans(n_clusters=min(n_clusters, X_p.shape[0]), random_state=42, n_init=5)
-    labels = kmeans.fit_predict(X_p)
-    joblib.dump(kmeans, MODELS_DIR / 'clustering_model.pkl')
-    # save cluster assignments
-    out = pd.DataFrame(X_p, columns=[f'pca_{i}' for i in range(X_p.shape[1])])
-    out['cluster'] = labels
-    out.to_csv(OUT_DIR / 'pca_clusters.csv', index=False)
-
-    cm = clustering_metrics(X_p, labels)
-    joblib.dump(cm, OUT_DIR / 'clustering_metrics.json')
-    print('Saved clustering model and metrics')
+    # targets are already split off; PCA/clustering uses every row
+    X = data.X
+
+    if fitted is None:
+        with stage('fit_segmentation', inputs=X):
+            fitted = _fit_segmentation(X, n_components, n_clusters, params=params, clustering=clustering,
+                                       n_jobs=n_jobs)
+    pca, kmeans, selection = fitted
+    with stage('pca_transform', inputs=X) as rec:
+        X_p = rec['output'] = pca.transform(X)
+    labels = kmeans.labels_
+    with stage('save', inputs=X_p):
+        _save_model(pca, MODELS_DIR / 'pca_model.pkl')
+        print('Saved PCA model')
+        _save_model(kmeans, MODELS_DIR / 'clustering_model.pkl')
+        # save cluster assignments
+        out = pd.DataFrame(data.in_file_order(X_p), columns=[f'pca_{i}' for i in range(X_p.shape[1])])
+        out['cluster'] = data.in_file_order(labels)
+        out.to_csv(OUT_DIR / 'pca_clusters.csv', index=False)
+
+    cm = next(c for c in selection['candidates'] if c['k'] == selection['chosen_k'])
+    cm = {**cm, 'k_selection': selection['candidates']}
+    log_metrics(OUT_DIR / 'clustering_metrics.json', cm)
+    print(f"Saved clustering model (k={selection['chosen_k']}, {cm['method']}) and metrics")
     return {'pca': pca, 'kmeans': kmeans, 'metrics': cm}
 
 
-def run_all():
-    print('Training classification...')
-    train_classification()
-    print('Training regression...')
-    train_regression()
-    print('PCA & clustering...')
-    train_pca_and_clustering()
+def fit_all_parallel(data: TrainingData, n_jobs: int = -1, n_components: int = 50, n_clusters: int = 5,
+                     params: dict = None, backends=('rf',), clustering: dict = None, growth: dict = None,
+                     families=('classification', 'regression', 'segmentation')) -> dict:
+    """Fit every candidate of every model family concurrently within a global core budget.
+
+    Returns ``{'classification': {...}, 'regression': {...}, 'segmentation': (pca, kmeans, selection)}`` for
+    the trainers' ``fitted`` argument. Workers receive the training matrices memory-mapped (joblib
+    passes memmap-backed views by reference and dumps other large arrays to shared memmaps), and each
+    task's forests and BLAS pools get ``budget // concurrent tasks`` threads so nothing oversubscribes.
+    Only the model ``families`` listed are fitted (a resumed run skips completed ones).
+    """
+    budget = resolve_workers(n_jobs)
+    tasks = []
+    if 'classification' in families and data.y_class is not None:
+        X_train, _, y_train, _ = data.split('loan_status')
+        if len(y_train):
+            tasks += [('classification', name, est, X_train, y_train)
+                      for name, est in classification_candidates(params=params, backends=backends).items()]
+    if 'regression' in families and data.reg_target:
+        X_train, _, y_train, _ = data.split(data.reg_target)
+        if len(y_train):
+            tasks += [('regression', name, est, X_train, y_train)
+                      for name, est in regression_candidates(params=params, backends=backends).items()]
+    segmentation = 'segmentation' in families
+    concurrent = max(1, min(budget, len(tasks) + segmentation))
+    threads = max(1, budget // concurrent)
+    for _, _, est, _, _ in tasks:
+        # only estimators that already run a thread pool (forests, XGBoost) get the per-task share
+        limit_threads(est, threads)
+
+    jobs = [delayed(_fit)(est, X, y, threads, growth) for _, _, est, X, y in tasks]
+    if segmentation:
+        jobs.append(delayed(_fit_segmentation)(data.X, n_components, n_clusters, threads, params, clustering))
+    results = Parallel(n_jobs=concurrent)(jobs)
+
+    fitted = {'classification': {}, 'regression': {}}
+    if segmentation:
+        fitted['segmentation'] = results.pop()
+    for (family, name, _, _, _), est in zip(tasks, results):
+        fitted[family][name] = est
+    return {family: models for family, models in fitted.items() if models}
+
+
+def run_all(n_jobs: int = -1, tune: bool = False, tune_budget: float = 300, backends=('rf',), serve: str = 'rf',
+            clustering: dict = None, growth: dict = None, policy: dict = None, cv_folds: int = None,
+            profile: bool = False, resume: bool = False, loss: dict = None):
+    """Train every model family; with more than one core the fits run concurrently (see ``fit_all_parallel``).
+
+    With ``tune=True`` a successive-halving search (``ml.tuning``) first picks the forest and KMeans
+    hyperparameters within ``tune_budget`` seconds; its trace goes to ``tuning_trace.json``.
+    ``backends`` adds HistGradientBoosting/XGBoost candidates and ``serve`` picks the saved classifier;
+    ``growth`` grows the forests with OOB early stopping (``ml.backends.grow_forest``) and ``policy``
+    selects the served models by accuracy, latency and size (``ml.selection``). ``cv_folds`` adds
+    cross-validated metrics for every candidate (``ml.cv``). ``loss`` weighs false approvals against
+    false declines when picking the served approval cutoff (``ml.evaluate.DEFAULT_LOSS``).
+    ``profile=True`` records every step under 'train' in ``pipeline_profile.json`` (see ``ml.profiling``).
+    Tuning and each model family leave a checkpoint (``ml.checkpoints``); ``resume=True`` skips the ones
+    that already completed on the same processed data and settings with intact artifacts.
+    """
+    _check_serve(serve, backends, policy)
+    with profiled('train', PROFILE_PATH) if profile else nullcontext():
+        _run_all(n_jobs, tune, tune_budget, backends, serve, clustering, growth, policy, cv_folds, loss,
+                 Checkpoints('train', resume=resume))
+
+
+def record_training(rows: int, raw_rows: int = None, path: Path = None) -> dict:
+    """Note that training finished on ``rows`` processed rows, built from the first ``raw_rows`` raw CSV lines.
+
+    The two differ once key-based appends drop rows with a missing or repeated key; without
+    ``raw_rows`` every raw line is assumed to have become one processed row.
+    """
+    state = {'rows_trained': int(rows), 'raw_rows_trained': int(rows if raw_rows is None else raw_rows),
+             'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    atomic_write(path or TRAINING_STATE_PATH, lambda tmp: Path(tmp).write_text(json.dumps(state, indent=2)))
+    return state
+
+
+def _run_all(n_jobs, tune, tune_budget, backends, serve, clustering, growth, policy, cv_folds, loss, checkpoints):
+    # parse the processed data once; every trainer gets read-only views of the same matrix
+    with stage('load') as rec:
+        data = TrainingData.load()
+        rec['output'] = None if data is None else data.X
+    if data is None:
+        print('Processed data not found. Run ml.prepare_data')
+        return
+    params = None
+    if tune:
+        tune_key = {'data': data.cache_key, 'budget': tune_budget}
+        if checkpoints.done('tune', tune_key):
+            params = json.loads(TUNED_PARAMS_PATH.read_text())
+        else:
+            print(f'Tuning hyperparameters (budget {tune_budget:.0f}s)...')
+            with stage('tune', inputs=data.X):
+                params = tune_all(data, time_budget=tune_budget, n_jobs=n_jobs,
+                                  trace_path=OUT_DIR / 'tuning_trace.json')
+            atomic_write(TUNED_PARAMS_PATH, lambda tmp: Path(tmp).write_text(json.dumps(params, indent=2)))
+            checkpoints.complete('tune', tune_key, [TUNED_PARAMS_PATH])
+
+    settings = {'data': data.cache_key, 'params': params, 'backends': list(backends), 'growth': growth,
+                'policy': policy, 'cv_folds': cv_folds}
+    keys = {
+        'classification': {**settings, 'serve': serve, 'loss': loss},
+        'regression': settings,
+        'segmentation': {'data': data.cache_key, 'params': params, 'clustering': clustering},
+    }
+    pending = [family for family, key in keys.items() if not checkpoints.done(family, key)]
+    fitted = {}
+    if pending and resolve_workers(n_jobs) > 1:
+        print(f'Fitting all models in parallel on {resolve_workers(n_jobs)} cores...')
+        with stage('fit_all_parallel', inputs=data.X):
+            fitted = fit_all_parallel(data, n_jobs, params=params, backends=backends, clustering=clustering,
+                                      growth=growth, families=pending)
+    trainers = {
+        'classification': ('Training classification...', 'train_classification', lambda: train_classification(
+            data, fitted=fitted.get('classification'), params=params, backends=backends, serve=serve,
+            growth=growth, policy=policy, cv_folds=cv_folds, n_jobs=n_jobs, loss=loss)),
+        'regression': ('Training regression...', 'train_regression', lambda: train_regression(
+            data, fitted=fitted.get('regression'), params=params, backends=backends, growth=growth,
+            policy=policy, cv_folds=cv_folds, n_jobs=n_jobs)),
+        'segmentation': ('PCA & clustering...', 'train_pca_and_clustering', lambda: train_pca_and_clustering(
+            data=data, fitted=fitted.get('segmentation'), params=params, clustering=clustering, n_jobs=n_jobs)),
+    }
+    for family in pending:
+        message, stage_name, train = trainers[family]
+        print(message)
+        with stage(stage_name):
+            result = train()
+        if result is not None:
+            checkpoints.complete(family, keys[family], STAGE_ARTIFACTS[family])
+    prepared = json.loads(PREPARE_STATE_PATH.read_text()) if PREPARE_STATE_PATH.exists() else {}
+    record_training(data.X.shape[0], prepared.get('raw_rows'))
     print('All tasks completed')
 
 
 if __name__ == '__main__':
-    run_all()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tune', action='store_true', help='Run a successive-halving search first')
+    parser.add_argument('--tune-budget', type=float, default=300, help='Tuning wall-clock budget in seconds')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--backends', nargs='+', default=['rf'], choices=BACKENDS,
+                        help='Tree-ensemble backends to train and compare')
+    parser.add_argument('--serve', default='rf', choices=BACKENDS, help='Classification backend to save')
+    parser.add_argument('--cluster-method', default='auto', choices=['auto', 'kmeans', 'minibatch'])
+    parser.add_argument('--k-values', nargs='+', type=int, default=None,
+                        help='Candidate cluster counts compared in parallel by sampled silhouette')
+    parser.add_argument('--grow', action='store_true', help='Grow forests until the OOB score levels off')
+    parser.add_argument('--grow-tol', type=float, default=DEFAULT_GROWTH['tol'])
+    parser.add_argument('--max-trees', type=int, default=DEFAULT_GROWTH['max_estimators'])
+    parser.add_argument('--profile', action='store_true', help='Record per-stage time and memory')
+    parser.add_argument('--policy', choices=['metric', 'budget', 'pareto'], default=None,
+                        help='Select served models by cost as well as accuracy (overrides --serve)')
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='Single-row p99 latency budget')
+    parser.add_argument('--max-size-mb', type=float, default=None, help='Serialized model size budget')
+    parser.add_argument('--cv', type=int, default=None, metavar='K', help='Also report K-fold CV metrics')
+    parser.add_argument('--resume', action='store_true', help='Skip stages completed by an interrupted run')
+    parser.add_argument('--loss-false-approval', type=float, default=DEFAULT_LOSS['false_approval'],
+                        help='Cost of approving a loan that defaults (relative to --loss-false-decline)')
+    parser.add_argument('--loss-false-decline', type=float, default=DEFAULT_LOSS['false_decline'],
+                        help='Cost of declining a loan that would have been repaid')
+    args = parser.parse_args()
+    if args.serve != 'rf' and args.serve not in args.backends:
+        parser.error('--serve must be rf or one of --backends')
+    run_all(n_jobs=args.n_jobs, tune=args.tune, tune_budget=args.tune_budget, backends=args.backends,
+            serve=args.serve, clustering={'method': args.cluster_method, 'k_values': args.k_values},
+            growth={'tol': args.grow_tol, 'max_estimators': args.max_trees} if args.grow else None,
+            policy={'strategy': args.policy, 'max_p99_ms': args.max_p99_ms, 'max_size_mb': args.max_size_mb}
+            if args.policy else None,
+            cv_folds=args.cv, profile=args.profile, resume=args.resume,
+            loss={'false_approval': args.loss_false_approval, 'false_decline': args.loss_false_decline})
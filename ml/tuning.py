@@ -0,0 +1,160 @@
+"""
+Time-budgeted hyperparameter search with successive halving.
+
+Candidates sampled from ``SEARCH_SPACES`` are first scored on a small slice of the training
+rows; each round keeps the best 1/eta and multiplies the sample size by eta, until one
+candidate is left, all rows are used or the wall-clock budget runs out. Candidates in a round
+are evaluated in parallel. The full trace is written to `data/processed/tuning_trace.json`.
+"""
+import json
+import math
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import silhouette_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+
+from .evaluate import SILHOUETTE_SAMPLE, classification_metrics, regression_metrics
+from .parallel import resolve_workers
+
+SEARCH_SPACES = {
+    'rf_classifier': {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [8, 12, 15, 20, None],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': ['sqrt', 0.5],
+    },
+    'rf_regressor': {
+        'n_estimators': [10, 20, 50, 100],
+        'max_depth': [6, 10, 15, None],
+        'min_samples_leaf': [1, 5, 10],
+        'max_features': [1.0, 'sqrt', 0.5],
+    },
+    'kmeans': {
+        'n_clusters': [3, 4, 5, 6, 8],
+        'n_init': [1, 3, 5],
+    },
+}
+
+ESTIMATORS = {
+    'rf_classifier': RandomForestClassifier,
+    'rf_regressor': RandomForestRegressor,
+    'kmeans': KMeans,
+}
+
+
+def _score(family: str, estimator, X_val, y_val) -> float:
+    """Higher is better: macro F1, negative RMSE or silhouette."""
+    if family == 'rf_classifier':
+        return classification_metrics(y_val, estimator.predict(X_val))['f1']
+    if family == 'rf_regressor':
+        return -regression_metrics(y_val, estimator.predict(X_val))['rmse']
+    labels = estimator.predict(X_val)
+    if len(set(labels)) < 2:
+        return -1.0
+    return float(silhouette_score(X_val, labels, sample_size=min(SILHOUETTE_SAMPLE, len(labels)), random_state=42))
+
+
+def _evaluate(family: str, params: dict, X, y, X_val, y_val) -> dict:
+    estimator = ESTIMATORS[family](**params, random_state=42)
+    if 'n_jobs' in estimator.get_params():
+        # candidates already run in parallel; keep each fit single-threaded
+        estimator.set_params(n_jobs=1)
+    start = time.perf_counter()
+    estimator.fit(X, y)
+    fit_seconds = time.perf_counter() - start
+    return {'params': params, 'score': _score(family, estimator, X_val, y_val), 'fit_seconds': round(fit_seconds, 4)}
+
+
+def successive_halving(family: str, X_train, y_train, X_val, y_val, time_budget: float = None,
+                       n_candidates: int = 16, eta: int = 3, min_samples: int = 500, n_jobs: int = -1,
+                       random_state: int = 42) -> dict:
+    """Search ``SEARCH_SPACES[family]`` with training-sample size as the resource.
+
+    Returns the best parameters plus a per-round trace. The search stops early once another round
+    would not fit in ``time_budget`` seconds (rounds cost roughly the same, so the last round's wall
+    time is the estimate).
+    """
+    start = time.perf_counter()
+    n = X_train.shape[0]
+    space = SEARCH_SPACES[family]
+    n_iter = min(n_candidates, len(ParameterGrid(space)))
+    candidates = list(ParameterSampler(space, n_iter=n_iter, random_state=random_state))
+    # rounds needed to narrow the candidates down to one
+    n_rounds, remaining = 1, len(candidates)
+    while remaining > 1:
+        remaining = math.ceil(remaining / eta)
+        n_rounds += 1
+    resource = max(min(min_samples, n), n // eta ** (n_rounds - 1))
+    # nested row subsets: every round sees the previous rows plus new ones
+    order = np.random.RandomState(random_state).permutation(n)
+    workers = resolve_workers(n_jobs)
+
+    trace, stopped_by_budget = [], False
+    for round_idx in range(n_rounds):
+        round_start = time.perf_counter()
+        rows = np.sort(order[:min(resource, n)])
+        X_r = X_train[rows]
+        y_r = None if y_train is None else y_train[rows]
+        results = Parallel(n_jobs=min(workers, len(candidates)))(
+            delayed(_evaluate)(family, params, X_r, y_r, X_val, y_val) for params in candidates)
+        results.sort(key=lambda r: r['score'], reverse=True)
+        round_seconds = time.perf_counter() - round_start
+        trace.append({'round': round_idx, 'n_samples': int(len(rows)), 'seconds': round(round_seconds, 4),
+                      'results': results})
+
+        if len(results) == 1 or len(rows) >= n:
+            break
+        elapsed = time.perf_counter() - start
+        if time_budget is not None and elapsed + round_seconds > time_budget:
+            stopped_by_budget = True
+            break
+        candidates = [r['params'] for r in results[:max(1, math.ceil(len(results) / eta))]]
+        resource *= eta
+
+    best = trace[-1]['results'][0]
+    return {
+        'family': family,
+        'best_params': best['params'],
+        'best_score': best['score'],
+        'elapsed_seconds': round(time.perf_counter() - start, 4),
+        'time_budget': time_budget,
+        'stopped_by_budget': stopped_by_budget,
+        'rounds': trace,
+    }
+
+
+def tune_all(data, time_budget: float = 300, n_jobs: int = -1, trace_path=None) -> dict:
+    """Tune the forests and KMeans on ``data`` (a ``ml.train.TrainingData``) within ``time_budget`` seconds.
+
+    The last 20% of each training split is held out for scoring, so the test split stays untouched.
+    Returns ``{family: best_params}`` and writes the full search trace to ``trace_path``.
+    """
+    start = time.perf_counter()
+    jobs = []
+    if data.y_class is not None:
+        jobs.append(('rf_classifier', data.split('loan_status')))
+    if data.reg_target:
+        jobs.append(('rf_regressor', data.split(data.reg_target)))
+    X_train = data.X[:data.n_train]
+    jobs.append(('kmeans', (X_train, None, None, None)))
+
+    searches = {}
+    for i, (family, (X, _, y, _)) in enumerate(jobs):
+        if len(X) < 10:
+            continue
+        # split the remaining budget evenly between the families still to tune
+        remaining = time_budget - (time.perf_counter() - start)
+        cut = int(len(X) * 0.8)
+        y_fit, y_val = (None, None) if y is None else (y[:cut], y[cut:])
+        searches[family] = successive_halving(family, X[:cut], y_fit, X[cut:], y_val,
+                                              time_budget=max(remaining, 0) / (len(jobs) - i), n_jobs=n_jobs)
+        print(f"Tuned {family}: {searches[family]['best_params']} (score {searches[family]['best_score']:.4f})")
+
+    if trace_path:
+        with open(trace_path, 'w') as f:
+            json.dump(searches, f, indent=2, default=str)
+    return {family: s['best_params'] for family, s in searches.items()}
@@ -1,156 +1,165 @@
 """
 Prefect workflow for Smart Credit Risk Platform ML Pipeline.
 Orchestrates data ingestion, preprocessing, training, and evaluation.
+
+Tasks exchange file references (path, size and modification time, see ``ml.checkpoints.source_key``)
+rather than DataFrames, so Prefect only ever persists a few bytes per result. Because a reference
+changes whenever its file does, each task is cached on a hash of its inputs: rerunning the flow on
+unchanged data skips work that already completed. Validation, EDA and feature engineering only
+depend on the ingested file and run concurrently.
 """
 
 from prefect import flow, task, get_run_logger
+from prefect.task_runners import ConcurrentTaskRunner
+from prefect.tasks import task_input_hash
 import sys
 import json
+from datetime import timedelta
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from ml.eda import summarise, save_histograms
-from ml.features import add_derived_features, build_preprocessor
-from ml.prepare_data import prepare_datasets
-from ml.train import train_classification, train_regression, train_pca_and_clustering, run_all
-from ml.evaluate import classification_metrics, regression_metrics, clustering_metrics
+from ml.checkpoints import source_key
+from ml.eda import run_eda
+from ml.integrity import scan_csv, write_report
+from ml.prepare_data import CLEANED_PATH, load_dataset, prepare, save_cleaned
+from ml.train import run_all
+from ml.profiling import PROFILE_PATH
+from ml.retraining import check_retraining, describe
 import pandas as pd
-import joblib
+
+# results of cached tasks are reused for a week unless their input files change
+CACHE_EXPIRATION = timedelta(days=7)
+INTEGRITY_REPORT_PATH = "data/processed/data_integrity_checks.json"
+PREPARED_PATHS = ["data/processed/for_classification.csv", "data/processed/for_regression.csv",
+                  "models/preprocessor.joblib"]
+MODEL_PATHS = ["models/classification_model.pkl", "models/regression_model.pkl", "models/clustering_model.pkl"]
+
+
+def _refs(paths) -> dict:
+    """File references for the outputs of a task; missing files are left out."""
+    return {Path(p).name: source_key(p) for p in paths if Path(p).exists()}
 
 
 @task(retries=2, retry_delay_seconds=5)
-def ingest_data(data_path: str = "data/bank_loan.csv"):
-    """Ingest dataset from CSV file."""
+def ingest_data(data_path: str = "data/bank_loan.csv") -> dict:
+    """Check the dataset is readable and return a reference to it (never cached, so edits are seen)."""
     logger = get_run_logger()
     logger.info(f"Ingesting data from {data_path}")
     
     try:
-        df = pd.read_csv(data_path)
-        logger.info(f"✓ Loaded {len(df)} rows, {len(df.columns)} columns")
-        return df
+        columns = pd.read_csv(data_path, nrows=0).columns
+        source = source_key(data_path)
+        logger.info(f"✓ Found {source['size'] / 1e6:.1f} MB, {len(columns)} columns")
+        return source
     except Exception as e:
         logger.error(f"Failed to ingest data: {e}")
         raise
 
 
-@task(retries=1, retry_delay_seconds=5)
-def validate_data(df: pd.DataFrame) -> bool:
-    """Validate data quality and integrity."""
+@task(retries=1, retry_delay_seconds=5, cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def validate_data(source: dict) -> dict:
+    """Validate data quality and integrity in one streaming pass over the CSV."""
     logger = get_run_logger()
     logger.info("Validating data quality...")
     
     try:
-        # Check for nulls
-        null_count = df.isnull().sum().sum()
-        logger.info(f"  - Total null values: {null_count}")
-        
-        # Check dtypes
-        logger.info(f"  - Data types: {df.dtypes.nunique()} unique types")
+        report = scan_csv(source["path"])
+        write_report(report, INTEGRITY_REPORT_PATH)
+        logger.info(f"  - Rows: {report['rows']}, columns: {report['columns']}")
+        logger.info(f"  - Total null values: {report['null_count']}")
+        logger.info(f"  - Duplicate rows: {report['duplicate_rows']}, duplicate keys: {report['duplicate_keys']}")
+        if report['dtype_violations']:
+            logger.warning(f"  - Values not matching the schema type: {report['dtype_violations']}")
+        if report['out_of_range']:
+            logger.warning(f"  - Values outside the schema range: {report['out_of_range']}")
         
-        # Check dimensions
-        if df.shape[0] == 0 or df.shape[1] == 0:
-            raise ValueError("DataFrame is empty")
+        if not report['passed']:
+            raise ValueError(f"Data validation failed: {report['errors']}")
         
         logger.info("✓ Data validation passed")
-        return True
+        return {"passed": True, "rows": report["rows"], "report": source_key(INTEGRITY_REPORT_PATH)}
     except Exception as e:
         logger.error(f"Data validation failed: {e}")
         raise
 
 
-@task
-def perform_eda(df: pd.DataFrame) -> dict:
-    """Perform exploratory data analysis."""
+@task(cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def perform_eda(source: dict) -> dict:
+    """Perform exploratory data analysis in one pass over the CSV and render histograms."""
     logger = get_run_logger()
     logger.info("Performing EDA...")
     
     try:
-        # Summarize
-        summary = summarise(df)
+        summary = run_eda(Path(source["path"]))
         logger.info(f"✓ EDA summary generated: {len(summary)} metrics")
-        
-        # Save histograms
-        save_histograms(df)
-        logger.info("✓ Histograms saved")
-        
-        return summary
+        logger.info(f"✓ Histograms saved for {len(summary.get('histograms', {}))} numeric columns")
+        return _refs(["data/processed/eda_summary.json"])
     except Exception as e:
         logger.error(f"EDA failed: {e}")
         raise
 
 
-@task
-def feature_engineering(df: pd.DataFrame) -> pd.DataFrame:
-    """Add derived features."""
+@task(cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def feature_engineering(source: dict) -> dict:
+    """Clean the raw data and add derived features; the frame is saved for memory-mapping by prepare."""
     logger = get_run_logger()
     logger.info("Performing feature engineering...")
     
     try:
-        df_engineered = add_derived_features(df.copy())
-        logger.info(f"✓ Added derived features: {df_engineered.shape[1]} total columns")
-        return df_engineered
+        df = load_dataset(Path(source["path"]))
+        path = save_cleaned(df, CLEANED_PATH)
+        logger.info(f"✓ Engineered {df.shape[1]} columns for {len(df)} rows")
+        return source_key(path)
     except Exception as e:
         logger.error(f"Feature engineering failed: {e}")
         raise
 
 
-@task
-def preprocess_and_prepare(df: pd.DataFrame):
-    """Build preprocessor and prepare datasets for training."""
+@task(cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def preprocess_and_prepare(cleaned: dict, validation: dict, resume: bool = False) -> dict:
+    """Build preprocessor and prepare datasets for training from the memory-mapped cleaned frame."""
     logger = get_run_logger()
     logger.info("Building preprocessor and preparing data...")
     
     try:
         # Prepare datasets (this handles normalization, encoding, etc.)
-        prepare_datasets(df)
+        prepare(profile=True, resume=resume, cleaned=Path(cleaned["path"]))
         logger.info("✓ Data preparation complete")
         
-        # Load prepared datasets
-        class_df = pd.read_csv("data/processed/for_classification.csv")
-        reg_df = pd.read_csv("data/processed/for_regression.csv")
-        
-        logger.info(f"  - Classification data: {class_df.shape}")
-        logger.info(f"  - Regression data: {reg_df.shape}")
-        
-        return {"classification": class_df, "regression": reg_df}
+        prepared = _refs(PREPARED_PATHS)
+        for name, ref in prepared.items():
+            logger.info(f"  - {name}: {ref['size'] / 1024:.1f} KB")
+        return prepared
     except Exception as e:
         logger.error(f"Preprocessing failed: {e}")
         raise
 
 
-@task
-def train_models():
-    """Train all ML models: classification, regression, clustering."""
+@task(cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def train_models(prepared: dict, resume: bool = False) -> dict:
+    """Train all ML models: classification, regression, clustering (``resume`` skips completed stages)."""
     logger = get_run_logger()
     logger.info("Training ML models...")
     
     try:
-        run_all()
+        run_all(profile=True, resume=resume)
         logger.info("✓ Model training complete")
         
-        # Load and log model info
-        models_dir = Path("models")
-        models = {
-            "classification": models_dir / "classification_model.pkl",
-            "regression": models_dir / "regression_model.pkl",
-            "clustering": models_dir / "clustering_model.pkl",
-            "pca": models_dir / "pca_model.pkl",
-        }
+        # Log model info
+        models = _refs(MODEL_PATHS)
+        for name, ref in models.items():
+            logger.info(f"  - {name}: {ref['size'] / 1024:.1f} KB")
         
-        for name, path in models.items():
-            if path.exists():
-                logger.info(f"  - {name}: {path.stat().st_size / 1024:.1f} KB")
-        
-        return True
+        return models
     except Exception as e:
         logger.error(f"Model training failed: {e}")
         raise
 
 
-@task
-def evaluate_models():
+@task(cache_key_fn=task_input_hash, cache_expiration=CACHE_EXPIRATION)
+def evaluate_models(models: dict):
     """Load and log model metrics."""
     logger = get_run_logger()
     logger.info("Evaluating models...")
@@ -176,6 +185,25 @@ def evaluate_models():
         raise
 
 
+@task
+def log_profile(models: dict = None):
+    """Log per-stage wall time, CPU time and peak memory recorded by the last prepare/train runs."""
+    logger = get_run_logger()
+    if not PROFILE_PATH.exists():
+        logger.info("No stage profile recorded")
+        return {}
+    
+    with open(PROFILE_PATH) as f:
+        report = json.load(f)
+    for run, entry in report.items():
+        logger.info(f"Stage profile '{run}' ({entry['recorded_at']}):")
+        for s in entry["stages"]:
+            rows = s["inputs"].get("rows")
+            logger.info(f"  {'  ' * s['depth']}{s['stage']}: wall {s['wall_s']:.2f}s, cpu {s['cpu_s']:.2f}s, "
+                        f"peak {s.get('peak_mb', 0):.1f} MB" + (f", {rows} rows in" if rows else ""))
+    return report
+
+
 @task
 def notify_completion(status: str):
     """Notify completion of pipeline."""
@@ -187,46 +215,50 @@ def notify_completion(status: str):
     return status
 
 
-@flow(name="smart-credit-risk-ml-pipeline", description="End-to-end ML pipeline for credit risk prediction")
-def ml_pipeline():
+@flow(name="smart-credit-risk-ml-pipeline", description="End-to-end ML pipeline for credit risk prediction",
+      task_runner=ConcurrentTaskRunner())
+def ml_pipeline(resume: bool = False, data_path: str = "data/bank_loan.csv", refresh: bool = False):
     """
     Main ML pipeline flow orchestrating all stages:
     1. Data Ingestion
-    2. Data Validation
-    3. EDA
-    4. Feature Engineering
-    5. Data Preprocessing
-    6. Model Training
-    7. Model Evaluation
-    8. Notification
+    2. Data Validation, EDA and Feature Engineering (concurrently)
+    3. Data Preprocessing (once validation and feature engineering are done)
+    4. Model Training
+    5. Model Evaluation
+    6. Notification
+    
+    With ``resume=True`` preparation and training pick up from the last completed stage of a failed run.
+    ``refresh=True`` reruns every task instead of reusing cached results for unchanged input files.
     """
     logger = get_run_logger()
     logger.info("Starting Smart Credit Risk ML Pipeline")
     logger.info("=" * 60)
+    validate, eda_task, engineer, prepare_task, train, evaluate = (
+        t.with_options(refresh_cache=True) if refresh else t
+        for t in (validate_data, perform_eda, feature_engineering, preprocess_and_prepare, train_models,
+                  evaluate_models))
     
     try:
         # Stage 1: Ingest Data
-        df = ingest_data()
-        
-        # Stage 2: Validate Data
-        validate_data(df)
+        source = ingest_data(data_path)
         
-        # Stage 3: EDA
-        perform_eda(df)
+        # Stage 2: Validate, explore and engineer features concurrently
+        validation = validate.submit(source)
+        eda = eda_task.submit(source)
+        cleaned = engineer.submit(source)
         
-        # Stage 4: Feature Engineering
-        df_engineered = feature_engineering(df)
+        # Stage 3: Preprocess & Prepare
+        prepared = prepare_task.submit(cleaned, validation, resume)
         
-        # Stage 5: Preprocess & Prepare
-        preprocess_and_prepare(df_engineered)
+        # Stage 4: Train Models
+        models = train.submit(prepared, resume)
         
-        # Stage 6: Train Models
-        train_models()
+        # Stage 5: Evaluate Models
+        metrics = evaluate.submit(models).result()
+        log_profile(models)
+        eda.result()
         
-        # Stage 7: Evaluate Models
-        metrics = evaluate_models()
-        
-        # Stage 8: Notify Completion
+        # Stage 6: Notify Completion
         notify_completion("SUCCESS ✓")
         
         return {"status": "success", "metrics": metrics}
@@ -237,12 +269,35 @@ def ml_pipeline():
         raise
 
 
+@task
+def check_retraining_needed(data_path: str = "data/bank_loan.csv", triggers: dict = None) -> dict:
+    """New-row count, drift and live accuracy of the loans added since the last run (see ``ml.retraining``)."""
+    logger = get_run_logger()
+    logger.info("Checking whether retraining is needed...")
+    
+    try:
+        report = check_retraining(Path(data_path), triggers)
+        logger.info(f"✓ {describe(report)} (checked in {report['check_seconds']:.1f}s)")
+        return report
+    except Exception as e:
+        logger.error(f"Retraining check failed: {e}")
+        raise
+
+
 @flow(name="daily-model-training", description="Scheduled daily model retraining")
-def daily_training_flow():
-    """Daily retraining flow for model updates."""
+def daily_training_flow(data_path: str = "data/bank_loan.csv", triggers: dict = None, force: bool = False):
+    """Daily retraining flow: runs the full pipeline only when a trigger in ``triggers`` is crossed.
+    
+    ``triggers`` overrides ``ml.retraining.DEFAULT_TRIGGERS``; ``force=True`` retrains regardless.
+    """
     logger = get_run_logger()
     logger.info("Starting daily model retraining...")
-    ml_pipeline()
+    decision = check_retraining_needed(data_path, triggers)
+    if not (decision["retrain"] or force):
+        logger.info("Skipping retraining; models are up to date")
+        return {"status": "skipped", "check": decision}
+    # the raw file may be unchanged (accuracy drop, force), so cached stages must not stand in for a retrain
+    return ml_pipeline(data_path=data_path, refresh=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+"""
+Compare dimensionality reduction engines on the encoded training matrix.
+Usage:
+  python scripts/benchmark_reduction.py --n-components 50 --rows 100000
+Reports fit time, peak traced memory, explained variance and reconstruction error per engine.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ml.features import build_preprocessor, profile_columns
+from ml.prepare_data import clean_dataset
+from ml.reduction import benchmark_reducers
+
+DATA_PATH = PROJECT_ROOT / "data" / "bank_loan.csv"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-components', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=None, help='Only read the first N rows')
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    # the same cleaning, column profile and encoder that prepare() uses, so targets and ids are excluded
+    df = clean_dataset(pd.read_csv(DATA_PATH, nrows=args.rows))
+    X = build_preprocessor(df, profile=profile_columns(df)).fit_transform(df)
+    print(f"Encoded matrix: {X.shape[0]} x {X.shape[1]}")
+
+    n = args.n_components
+    configs = {
+        'randomized': {'n_components': n},
+        'randomized_fast': {'n_components': n, 'n_oversamples': 5, 'n_iter': 2},
+        'randomized_accurate': {'n_components': n, 'n_oversamples': 20, 'n_iter': 7},
+        'incremental': {'method': 'incremental', 'n_components': n, 'batch_size': args.batch_size},
+        'variance_90': {'n_components': n, 'variance_target': 0.9},
+    }
+    results = benchmark_reducers(X, configs)
+    for r in results.values():
+        r.pop('config')
+    print(json.dumps(results, indent=2))
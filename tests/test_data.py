@@ -2,6 +2,7 @@
 Data validation and integrity tests.
 """
 
+import json
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -85,6 +86,495 @@ class TestFeatureEngineering:
             assert X.shape[1] > 0
         except Exception as e:
             pytest.skip(f"Preprocessing test skipped: {e}")
+    
+    def test_employment_length_and_term_parsing(self):
+        """Test raw employment length and term strings become numeric."""
+        from ml.features import normalize_categoricals
+        
+        df = pd.DataFrame({
+            'employment_length': ['10+ years', '< 1 year', '3 years', None, '3 years'],
+            'term': ['Short Term', 'Long Term', 'Short Term', '36 months', None],
+            'purpose': [' Home Improvements', 'Debt Consolidation ', '', 'other', 'other'],
+        })
+        
+        out = normalize_categoricals(df)
+        
+        assert out['employment_length'].tolist()[:3] == [10.0, 0.0, 3.0]
+        assert np.isnan(out['employment_length'].iloc[3])
+        assert out['term'].tolist()[:4] == [36.0, 60.0, 36.0, 36.0]
+        assert out['purpose'].iloc[0] == 'Home Improvements'
+        assert pd.isna(out['purpose'].iloc[2])
+    
+    def test_loan_status_normalization(self):
+        """Test loan status labels collapse to default/approved."""
+        from ml.features import normalize_loan_status
+        
+        s = pd.Series(['Fully Paid', 'Charged Off', 'fully paid', None, 'Current'])
+        out = normalize_loan_status(s)
+        
+        assert out.tolist()[:3] == ['approved', 'default', 'approved']
+        assert pd.isna(out.iloc[3])
+        assert out.iloc[4] == 'current'
+
+
+class TestColumnProfiling:
+    """Test identifier detection and bounded encoding of high-cardinality columns."""
+    
+    @pytest.fixture
+    def wide_data(self):
+        rng = np.random.default_rng(0)
+        n = 500
+        return pd.DataFrame({
+            'Loan ID': [f'L{i}' for i in range(n)],
+            'ref': [f'R{i}' for i in range(n)],
+            'customer_id': np.arange(n),
+            'city': rng.choice([f'city_{i}' for i in range(120)], n),
+            'purpose': rng.choice(['home', 'auto', 'other'], n),
+            'income': rng.normal(50000, 5000, n),
+            'loan_status': rng.choice(['approved', 'default'], n),
+        })
+    
+    def test_profile_excludes_ids_and_targets(self, wide_data):
+        """Test identifier-like and target columns are not encoded."""
+        from ml.features import profile_columns
+        
+        profile = profile_columns(wide_data)
+        
+        assert profile['id_cols'] == ['customer_id', 'Loan ID', 'ref']
+        assert profile['high_cardinality_cols'] == ['city']
+        assert profile['categorical_cols'] == ['purpose']
+        assert profile['numeric_cols'] == ['income']
+    
+    @pytest.mark.parametrize('strategy, max_width', [('frequency', 1 + 3 + 50), ('hashing', 1 + 3 + 16)])
+    def test_encoding_width_is_bounded(self, wide_data, strategy, max_width):
+        """Test high-cardinality strategies cap the encoded width."""
+        from ml.features import profile_columns, build_preprocessor
+        
+        profile = profile_columns(wide_data, {'strategy': strategy, 'n_hash_features': 16})
+        preprocessor = build_preprocessor(wide_data, profile=profile).fit(wide_data)
+        
+        X = preprocessor.transform(wide_data.iloc[:5])
+        assert X.shape == (5, preprocessor.get_feature_names_out().shape[0])
+        assert X.shape[1] <= max_width
+    
+    def test_unseen_values_in_infrequent_bucket_are_not_lost(self, wide_data):
+        """Test only unseen values encoded as all zeros count toward a refit."""
+        from ml.features import profile_columns, build_preprocessor, count_unseen_categories
+        
+        preprocessor = build_preprocessor(wide_data, profile=profile_columns(wide_data)).fit(wide_data)
+        new = wide_data.iloc[:10].copy()
+        new.loc[new.index[:4], 'city'] = 'atlantis'
+        new.loc[new.index[2:5], 'purpose'] = 'boat'
+        
+        report = count_unseen_categories(preprocessor, new)
+        
+        assert report['city'] == {'rows': 4, 'values': ['atlantis'], 'encoded_as': 'infrequent'}
+        assert report['purpose']['encoded_as'] == 'zeros'
+        assert report['_rows_with_unseen'] == 3
+        assert report['_rows_mapped_to_infrequent'] == 2
+
+
+class TestShardedTransform:
+    """Test process-parallel sharded preprocessing."""
+    
+    def test_sharded_matches_single_process(self):
+        """Test shards transformed on a process pool reassemble to the in-process result."""
+        from ml.features import build_preprocessor, transform_sharded
+        
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'income': rng.normal(50000, 5000, 200),
+            'credit_score': rng.normal(700, 30, 200),
+            'purpose': rng.choice(['home', 'auto', 'other'], 200),
+        })
+        preprocessor = build_preprocessor(df).fit(df)
+        
+        expected = preprocessor.transform(df)
+        result = transform_sharded(preprocessor, df, n_jobs=2, shard_size=64)
+        
+        to_dense = lambda m: m.toarray() if hasattr(m, 'toarray') else np.asarray(m)
+        assert result.shape == expected.shape
+        np.testing.assert_allclose(to_dense(result), to_dense(expected))
+
+
+class TestAppendMode:
+    """Test incremental append of new loans with the frozen preprocessor."""
+    
+    @pytest.fixture
+    def workspace(self, tmp_path, monkeypatch):
+        import ml.prepare_data as prep
+        
+        rng = np.random.default_rng(0)
+        n = 60
+        raw = pd.DataFrame({
+            'Loan ID': [f'L{i}' for i in range(n)],
+            'Loan Status': rng.choice(['Fully Paid', 'Charged Off'], n),
+            'Current Loan Amount': rng.integers(1000, 9000, n),
+            'Annual Income': rng.normal(50000, 5000, n),
+            'Purpose': rng.choice(['home', 'auto'], n),
+        })
+        data_path = tmp_path / 'bank_loan.csv'
+        for name, value in {
+            'DATA_PATH': data_path,
+            'OUT_DIR': tmp_path,
+            'MODELS_DIR': tmp_path,
+            'STATE_PATH': tmp_path / 'prepare_state.json',
+            'KEYS_PATH': tmp_path / 'processed_keys.csv',
+        }.items():
+            monkeypatch.setattr(prep, name, value)
+        return prep, raw, data_path
+    
+    def test_append_only_processes_new_rows(self, workspace):
+        """Test append mode transforms unseen keys only and reports unseen categories."""
+        prep, raw, data_path = workspace
+        raw.iloc[:40].to_csv(data_path, index=False)
+        prep.prepare(n_jobs=1)
+        
+        new = raw.iloc[40:].copy()
+        new.loc[new.index[:5], 'Purpose'] = 'boat'
+        pd.concat([raw.iloc[:40], new]).to_csv(data_path, index=False)
+        report = prep.append_new_rows(n_jobs=1)
+        
+        assert report['new_rows'] == 20
+        assert report['unseen_categories']['purpose']['rows'] == 5
+        assert len(pd.read_csv(data_path.parent / 'for_classification.csv')) == 60
+        assert prep.append_new_rows(n_jobs=1)['new_rows'] == 0
+    
+    def test_retraining_check_reads_only_new_rows(self, workspace):
+        """Test the retraining check triggers on new-row volume and drift, and not on unchanged data."""
+        from ml.retraining import check_retraining
+        from ml.train import TRAINING_STATE_PATH, record_training
+        
+        prep, raw, data_path = workspace
+        raw.iloc[:40].to_csv(data_path, index=False)
+        prep.prepare(n_jobs=1)
+        triggers = {'new_row_fraction': 0.6, 'min_rows': 10}
+        assert check_retraining(triggers=triggers)['reasons'] == ['no previous training run']
+        record_training(40, path=prep.OUT_DIR / TRAINING_STATE_PATH.name)
+        assert check_retraining(triggers=triggers)['retrain'] is False
+        
+        new = raw.iloc[40:].copy()
+        new['Annual Income'] *= 3
+        pd.concat([raw.iloc[:40], new]).to_csv(data_path, index=False)
+        # appending the rows to the processed data does not train on them
+        prep.append_new_rows(n_jobs=1)
+        report = check_retraining(triggers=triggers)
+        
+        assert report['new_rows'] == 20 and report['trained_rows'] == 40
+        assert report['retrain'] is True
+        # income (and debt_to_income, derived from it) drifted; 20 rows stay under the volume trigger
+        assert 'income' in report['drifted_columns']
+        assert len(report['reasons']) == 1 and report['reasons'][0].startswith('PSI')
+    
+    def test_retraining_offset_skips_rows_dropped_by_key(self, workspace):
+        """Test rows with a repeated or missing key do not count as new after training on the appended data."""
+        from ml.retraining import check_retraining
+        from ml.train import TRAINING_STATE_PATH, record_training
+        
+        prep, raw, data_path = workspace
+        raw.iloc[:30].to_csv(data_path, index=False)
+        prep.prepare(n_jobs=1)
+        
+        repeated, missing = raw.iloc[[0]], raw.iloc[[1]].assign(**{'Loan ID': np.nan})
+        pd.concat([raw.iloc[:30], repeated, missing, raw.iloc[30:40]]).to_csv(data_path, index=False)
+        assert prep.append_new_rows(n_jobs=1)['new_rows'] == 10
+        # train on the 40 processed rows, built from the first 42 raw lines
+        state = json.loads(prep.STATE_PATH.read_text())
+        assert state['rows_processed'] == 40 and state['raw_rows'] == 42
+        record_training(state['rows_processed'], state['raw_rows'], prep.OUT_DIR / TRAINING_STATE_PATH.name)
+        assert check_retraining()['new_rows'] == 0
+        
+        pd.concat([raw.iloc[:30], repeated, missing, raw.iloc[30:45]]).to_csv(data_path, index=False)
+        assert check_retraining()['new_rows'] == 5
+
+
+class TestDimensionalityReduction:
+    """Test the configurable reduction engines."""
+    
+    @pytest.fixture
+    def sparse_matrix(self):
+        from scipy import sparse
+        return sparse.random(300, 80, density=0.1, format='csr', random_state=0)
+    
+    @pytest.mark.parametrize('method', ['randomized', 'incremental'])
+    def test_reducer_transform_compatible(self, sparse_matrix, method):
+        """Test every engine can transform sparse rows like the serving path does."""
+        from ml.reduction import fit_reducer
+        
+        reducer, X_reduced = fit_reducer(sparse_matrix, {'method': method, 'n_components': 10, 'batch_size': 64})
+        
+        assert X_reduced.shape == (300, 10)
+        assert reducer.transform(sparse_matrix[:1]).shape == (1, 10)
+    
+    def test_variance_target_truncates_components(self, sparse_matrix):
+        """Test explained-variance selection keeps fewer components."""
+        from ml.reduction import fit_reducer
+        
+        reducer, X_reduced = fit_reducer(sparse_matrix, {'n_components': 40, 'variance_target': 0.3})
+        
+        assert X_reduced.shape[1] == reducer.components_.shape[0] < 40
+        assert reducer.transform(sparse_matrix[:2]).shape == (2, X_reduced.shape[1])
+
+
+class TestCheckpoints:
+    """Test per-stage checkpoints used to resume interrupted runs."""
+    
+    def test_resume_skips_only_intact_stages(self, tmp_path):
+        """Test a stage is skipped only with the same key and unchanged artifacts."""
+        from ml.checkpoints import Checkpoints
+        
+        artifact = tmp_path / 'model.pkl'
+        artifact.write_bytes(b'fitted')
+        Checkpoints('train', directory=tmp_path).complete('fit', {'rows': 10}, [artifact])
+        
+        resumed = Checkpoints('train', resume=True, directory=tmp_path)
+        assert resumed.done('fit', {'rows': 10})
+        assert not resumed.done('fit', {'rows': 11})
+        assert not Checkpoints('train', directory=tmp_path).done('fit', {'rows': 10})
+        artifact.write_bytes(b'truncated')
+        assert not resumed.done('fit', {'rows': 10})
+    
+    def test_intermediate_results_are_atomic(self, tmp_path):
+        """Test saved intermediates round-trip and leave no temporary files behind."""
+        from ml.checkpoints import Checkpoints
+        
+        checkpoints = Checkpoints('prepare', directory=tmp_path)
+        X = np.arange(6.0).reshape(3, 2)
+        checkpoints.save('encoded', (X, ['a', 'b']))
+        
+        loaded, names = checkpoints.load('encoded')
+        np.testing.assert_array_equal(loaded, X)
+        assert names == ['a', 'b']
+        assert [p.name for p in tmp_path.iterdir()] == ['prepare.encoded.joblib']
+    
+    def test_atomic_write_keeps_default_permissions(self, tmp_path):
+        """Test artifacts get the umask default mode, or keep the mode of the file they replace."""
+        from ml.checkpoints import atomic_write
+        
+        path, plain = tmp_path / 'model.pkl', tmp_path / 'plain.pkl'
+        atomic_write(path, lambda tmp: Path(tmp).write_bytes(b'fitted'))
+        plain.write_bytes(b'fitted')
+        assert path.stat().st_mode & 0o777 == plain.stat().st_mode & 0o777 != 0o600
+        
+        path.chmod(0o640)
+        atomic_write(path, lambda tmp: Path(tmp).write_bytes(b'refitted'))
+        assert path.stat().st_mode & 0o777 == 0o640
+
+
+class TestLeakageScreen:
+    """Test the vectorized feature/target leakage screen."""
+    
+    @staticmethod
+    def _frame(n=400):
+        rng = np.random.default_rng(0)
+        amount = rng.normal(10000, 3000, n)
+        status = np.where(rng.random(n) < 0.3, 'Charged Off', 'Fully Paid')
+        X = pd.DataFrame({
+            'loan_amount': amount,
+            'leaky_amount': amount * 2 + 1,
+            'noise': rng.normal(size=n).astype(np.float32),
+            'flag': rng.random(n) < 0.5,
+            'grade': rng.choice(['A', 'B', 'C'], n),
+            'status_text': pd.Series(status).map({'Charged Off': 'late', 'Fully Paid': 'ok'}),
+        })
+        X.loc[::7, 'noise'] = np.nan
+        return X, amount, pd.Series(status)
+    
+    def test_numeric_target_matches_pandas(self):
+        """Test Pearson values match pandas and float32/bool columns are included."""
+        from ml.leakage import screen_leakage
+        
+        X, amount, _ = self._frame()
+        result = screen_leakage(X, amount)
+        y = pd.Series(amount)
+        
+        for col in ['loan_amount', 'noise', 'flag']:
+            assert result['feature_target_correlation'][col] == pytest.approx(X[col].astype(float).corr(y), abs=1e-9)
+        flagged = {f['column'] for f in result['high_correlation_features']}
+        assert flagged == {'loan_amount', 'leaky_amount'}
+    
+    def test_categorical_leak_is_flagged(self):
+        """Test a text column that restates the label is caught by Cramer's V."""
+        from ml.leakage import screen_leakage
+        
+        X, _, status = self._frame()
+        result = screen_leakage(X, status)
+        
+        assert result['associations']['status_text']['measure'] == 'cramers_v'
+        assert result['associations']['status_text']['value'] == pytest.approx(1.0)
+        assert result['associations']['status_text']['uncertainty_coefficient'] == pytest.approx(1.0)
+        assert [f['column'] for f in result['high_correlation_features']] == ['status_text']
+    
+    def test_chunked_screen_matches_single_pass(self):
+        """Test accumulating over chunks gives the same associations as one pass."""
+        from ml.leakage import screen_leakage
+        
+        X, amount, status = self._frame()
+        for y in (amount, status):
+            whole = screen_leakage(X, y)['feature_target_correlation']
+            chunked = screen_leakage(X, y, chunk_size=37)['feature_target_correlation']
+            assert chunked == pytest.approx(whole)
+
+
+class TestDriftDetection:
+    """Test drift detection against a binned reference profile."""
+    
+    @staticmethod
+    def _frame(n=2000, seed=0):
+        rng = np.random.default_rng(seed)
+        income = rng.lognormal(11, 0.4, n)
+        income[::50] = np.nan
+        return pd.DataFrame({
+            'income': income,
+            'credit_score': rng.normal(700, 40, n),
+            'purpose': rng.choice(['Debt Consolidation', 'Home Improvements', 'Other'], n, p=[0.6, 0.3, 0.1]),
+        })
+    
+    def test_same_distribution_is_stable(self):
+        """Test a fresh sample of the training distribution shows no drift, whole or chunked."""
+        from ml.drift import DriftAccumulator, build_reference_profile, detect_drift
+        
+        profile = build_reference_profile(self._frame())
+        current = self._frame(seed=1)
+        report = detect_drift(current, profile)
+        
+        assert report['columns_with_drift'] == []
+        assert report['max_psi'] < 0.1
+        assert sum(profile['features']['income']['counts']) == 2000
+        whole = DriftAccumulator(profile).update(current).counts
+        chunked = DriftAccumulator(profile)
+        for start in range(0, len(current), 300):
+            chunked.update(current.iloc[start:start + 300])
+        np.testing.assert_array_equal(chunked.counts, whole)
+    
+    def test_shifted_features_are_flagged(self):
+        """Test shifted numeric and categorical features raise alerts and binned KS tracks the exact one."""
+        from scipy.stats import ks_2samp
+        from ml.drift import build_reference_profile, detect_drift
+        
+        train = self._frame()
+        current = self._frame(seed=1)
+        current['income'] *= 1.5
+        current['purpose'] = np.where(np.arange(len(current)) % 2, 'Business Loan', current['purpose'])
+        report = detect_drift(current, build_reference_profile(train), chunk_size=500)
+        
+        assert {d['column'] for d in report['columns_with_drift']} == {'income', 'purpose'}
+        assert report['features']['income']['status'] == 'ALERT'
+        assert report['features']['purpose']['chi2_pvalue'] < 1e-6
+        assert report['features']['credit_score']['status'] == 'OK'
+        exact = ks_2samp(train['income'].dropna(), current['income'].dropna()).statistic
+        assert report['features']['income']['ks'] == pytest.approx(exact, abs=0.05)
+    
+    def test_windowed_sketch_matches_batch_counts(self):
+        """Test live rows land in the same bins as a batch check and old windows roll off."""
+        from ml.drift import DriftAccumulator, WindowedSketch, build_reference_profile
+        
+        profile = build_reference_profile(self._frame())
+        current = self._frame(seed=1).iloc[:200]
+        sketch = WindowedSketch(profile, features=['income', 'purpose'], window_seconds=60, n_windows=3)
+        for row in current.to_dict('records'):
+            sketch.observe(row, now=0)
+        
+        batch = DriftAccumulator(sketch.profile).update(current).counts
+        np.testing.assert_array_equal(sketch.window_counts(now=30), batch)
+        assert sketch.report(now=30)['rows'] == 200
+        sketch.observe({'income': 1.0}, now=240)
+        assert sketch.window_counts(windows=3, now=240)[0].sum() == 1
+
+
+class TestIntegrityScan:
+    """Test the single-pass, chunked data-integrity checks."""
+    
+    @pytest.fixture
+    def loans_csv(self, tmp_path):
+        rng = np.random.default_rng(0)
+        n = 300
+        df = pd.DataFrame({
+            'Loan ID': [f'L{i}' for i in range(n)],
+            'Loan Status': rng.choice(['Fully Paid', 'Charged Off'], n),
+            'Credit Score': rng.normal(700, 40, n).round(),
+            'Bankruptcies': rng.integers(0, 2, n).astype(float),
+            'Purpose': rng.choice(['home', 'auto'], n),
+        })
+        df.loc[10, 'Credit Score'] = 7100
+        df.loc[20:29, 'Bankruptcies'] = np.nan
+        # a row repeated in a later chunk and a reused loan id with different values
+        df = pd.concat([df, df.iloc[[3]], df.iloc[[5]].assign(Purpose='boat')], ignore_index=True)
+        df['Credit Score'] = df['Credit Score'].astype(object)
+        df.loc[40, 'Credit Score'] = 'unknown'
+        path = tmp_path / 'loans.csv'
+        df.to_csv(path, index=False)
+        return path, df
+    
+    @pytest.mark.parametrize('duplicates', ['exact', 'approximate'])
+    def test_chunked_scan_finds_every_issue(self, loans_csv, duplicates):
+        """Test nulls, type violations, ranges and duplicates across chunk boundaries."""
+        from ml.integrity import scan_csv
+        
+        path, df = loans_csv
+        report = scan_csv(path, duplicates=duplicates, chunk_size=64)
+        
+        assert report['rows'] == len(df)
+        assert report['passed']
+        assert report['null_counts'] == {'Bankruptcies': 10}
+        assert report['dtype_violations'] == {'Credit Score': 1}
+        assert report['out_of_range'] == {'Credit Score': 1}
+        assert report['duplicate_rows'] == 1
+        assert report['duplicate_keys'] == {'Loan ID': 2}
+    
+    def test_frame_scan_matches_pandas(self, loans_csv):
+        """Test the in-memory scan agrees with DataFrame.duplicated and isnull."""
+        from ml.integrity import DEFAULT_SCHEMA, default_schema, scan_frame
+        
+        _, df = loans_csv
+        report = scan_frame(df, default_schema(df.columns), chunk_size=50)
+        
+        assert report['duplicate_rows'] == df.duplicated().sum()
+        assert report['null_count'] == df.isnull().sum().sum()
+        assert not scan_frame(df.drop(columns=['Loan ID']), DEFAULT_SCHEMA)['passed']
+
+
+class TestEdaSummary:
+    """Test the single-pass EDA summary and histogram rendering."""
+    
+    def test_chunked_summary_matches_pandas(self):
+        """Test moments, correlations and quartiles from chunks against pandas on the whole frame."""
+        from ml.eda import summarize
+        
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'income': rng.lognormal(11, 0.5, 3000),
+            'score': rng.normal(700, 40, 3000),
+            'purpose': rng.choice(['home', 'auto'], 3000),
+        })
+        df.loc[::9, 'score'] = np.nan
+        # later chunks extend the range seen in the first one
+        df.loc[2990:, 'income'] *= 20
+        summary = summarize(df, chunk_size=700)
+        
+        expected = df[['income', 'score']].describe()
+        for col in ['income', 'score']:
+            got = summary['numeric_describe'][col]
+            assert got['mean'] == pytest.approx(expected[col]['mean'])
+            assert got['std'] == pytest.approx(expected[col]['std'])
+            assert got['max'] == expected[col]['max']
+            span = expected[col]['max'] - expected[col]['min']
+            assert got['50%'] == pytest.approx(expected[col]['50%'], abs=span / 500)
+            assert sum(summary['histograms'][col]['counts']) == df[col].notna().sum()
+        assert summary['correlation']['income']['score'] == pytest.approx(df['income'].corr(df['score']))
+        assert summary['missing'] == {'income': 0, 'score': 334, 'purpose': 0}
+    
+    def test_histograms_render_from_bin_counts(self, tmp_path):
+        """Test PNGs are drawn from precomputed bins, skipping empty columns."""
+        from ml.eda import render_histograms
+        
+        saved = render_histograms({
+            'income': {'edges': [0.0, 1.0, 2.0], 'counts': [3, 5]},
+            'empty': {'edges': [], 'counts': []},
+        }, out_dir=tmp_path, n_jobs=1)
+        
+        assert [Path(p).name for p in saved] == ['hist_income.png']
+        assert (tmp_path / 'hist_income.png').stat().st_size > 0
 
 
 class TestDataValidation:
@@ -97,6 +97,482 @@ class TestModelInference:
             assert result >= 0
         except RuntimeError:
             pytest.skip("Models not loaded in this test environment")
+    
+    def test_request_sketched_once_across_endpoints(self, monkeypatch):
+        """Test one request id sent to several endpoints is added to the drift windows once."""
+        from app import predict
+        
+        observed = []
+        monitor = type('Monitor', (), {'observe': lambda self, row: observed.append(row)})()
+        monkeypatch.setattr(predict, 'input_monitor', monitor)
+        monkeypatch.setattr(predict, 'monitor_fields', {'income': 'income'})
+        monkeypatch.setattr(predict, '_recent_requests', type(predict._recent_requests)())
+        for _ in range(3):
+            predict._observe_inputs({'income': 50000.0, 'purpose': 'home'}, request_id='a')
+        predict._observe_inputs({'income': 60000.0, 'purpose': 'home'}, request_id='b')
+        
+        assert observed == [{'income': 50000.0}, {'income': 60000.0}]
+    
+    def test_identical_payloads_from_distinct_requests_are_counted(self, monkeypatch):
+        """Test two applicants with the same fields are both added to the drift windows."""
+        from app import predict
+        
+        observed = []
+        monitor = type('Monitor', (), {'observe': lambda self, row: observed.append(row)})()
+        monkeypatch.setattr(predict, 'input_monitor', monitor)
+        monkeypatch.setattr(predict, 'monitor_fields', {'income': 'income'})
+        monkeypatch.setattr(predict, '_recent_requests', type(predict._recent_requests)())
+        predict._observe_inputs({'income': 50000.0}, request_id='a')
+        predict._observe_inputs({'income': 50000.0}, request_id='b')
+        predict._observe_inputs({'income': 50000.0})
+        predict._observe_inputs({'income': 50000.0})
+        
+        assert observed == [{'income': 50000.0}] * 4
+
+
+class TestServingParity:
+    """Test the serving path scores raw loans like the training pipeline."""
+    
+    @pytest.fixture
+    def workspace(self, tmp_path, monkeypatch):
+        """Raw loans prepared and a small classifier trained in ``tmp_path``, loaded for serving."""
+        import ml.prepare_data as prep
+        from app import predict
+        from ml.parity import training_features
+        
+        rng = np.random.default_rng(0)
+        n = 120
+        income = rng.normal(50000, 5000, n)
+        income[::15] = np.nan
+        raw = pd.DataFrame({
+            'Loan ID': [f'L{i}' for i in range(n)],
+            'Loan Status': rng.choice(['Fully Paid', 'Charged Off'], n),
+            'Current Loan Amount': rng.integers(1000, 9000, n),
+            'Term': rng.choice(['Short Term', 'Long Term'], n),
+            'Credit Score': rng.normal(700, 40, n),
+            'Annual Income': income,
+            'Years in current job': rng.choice(['< 1 year', '5 years', '10+ years'], n),
+            'Purpose': rng.choice(['home', 'auto', 'other'], n),
+        })
+        for name, value in {
+            'DATA_PATH': tmp_path / 'bank_loan.csv',
+            'OUT_DIR': tmp_path,
+            'MODELS_DIR': tmp_path,
+            'STATE_PATH': tmp_path / 'prepare_state.json',
+            'KEYS_PATH': tmp_path / 'processed_keys.csv',
+        }.items():
+            monkeypatch.setattr(prep, name, value)
+        raw.to_csv(tmp_path / 'bank_loan.csv', index=False)
+        prep.prepare(n_jobs=1)
+        
+        X = training_features(raw, joblib.load(tmp_path / 'preprocessor.joblib'))
+        y = prep.clean_dataset(raw)['loan_status']
+        joblib.dump(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y),
+                    tmp_path / 'classification_model.pkl')
+        
+        # serve from the workspace and restore the loaded models afterwards
+        for name in ('classification_model', 'regression_model', 'clustering_model', 'preprocessor',
+                     'preprocessor_config', 'svd', 'decision_threshold', 'input_monitor', 'prediction_monitor',
+                     'monitor_fields', 'shadow'):
+            monkeypatch.setattr(predict, name, getattr(predict, name))
+        monkeypatch.setattr(predict, 'MODELS_DIR', tmp_path)
+        monkeypatch.setattr(predict, 'CHALLENGER_DIR', tmp_path / 'challenger')
+        monkeypatch.setattr(predict, 'REFERENCE_PROFILE_PATH', tmp_path / 'reference_profile.json')
+        return raw
+    
+    def test_serving_matches_training_path(self, workspace):
+        """Test single-row and batch serving score raw loans like the training pipeline."""
+        from ml.parity import check_parity
+        
+        report = check_parity(workspace, n_single=10)
+        
+        assert report['passed'], report['failures']
+        assert list(report['tasks']) == ['classification']
+        assert report['features']['columns'] > 0
+
+
+class TestTrainingData:
+    """Test the shared training data context."""
+    
+    @pytest.fixture
+    def processed_dir(self, tmp_path):
+        rng = np.random.default_rng(0)
+        features = pd.DataFrame(rng.normal(size=(100, 4)), columns=[f'svd_{i}' for i in range(4)])
+        cls_df = features.assign(loan_status=rng.choice(['approved', 'default'], 100))
+        reg_df = features.assign(loan_amount=rng.normal(10000, 1000, 100))
+        reg_df.loc[:4, 'loan_amount'] = np.nan
+        cls_df.to_csv(tmp_path / 'for_classification.csv', index=False)
+        reg_df.to_csv(tmp_path / 'for_regression.csv', index=False)
+        return tmp_path
+    
+    def test_loads_once_and_memory_maps(self, processed_dir):
+        """Test features are cached and reloaded as a read-only memory map."""
+        from ml.train import TrainingData
+        
+        first = TrainingData.load(processed_dir)
+        second = TrainingData.load(processed_dir)
+        
+        assert isinstance(second.X, np.memmap)
+        assert not second.X.flags.writeable
+        np.testing.assert_array_equal(first.X, second.X)
+        assert second.feature_names == [f'svd_{i}' for i in range(4)]
+    
+    def test_splits_are_shared_views(self, processed_dir):
+        """Test splits are computed once and are views when no target is missing."""
+        from ml.train import TrainingData
+        
+        data = TrainingData.load(processed_dir)
+        X_train, X_test, y_train, y_test = data.split('loan_status')
+        
+        assert data.split('loan_status')[0] is X_train
+        assert np.shares_memory(X_train, data.X)
+        assert len(X_train) + len(X_test) == 100
+        X_train_r, X_test_r, y_train_r, _ = data.split('loan_amount')
+        assert len(X_train_r) + len(X_test_r) == 95
+        assert not np.isnan(y_train_r).any()
+    
+    def test_parallel_fits_match_sequential(self, processed_dir):
+        """Test the parallel scheduler produces the same models as sequential fitting."""
+        from ml.train import TrainingData, fit_all_parallel, classification_candidates
+        
+        data = TrainingData.load(processed_dir)
+        X_train, X_test, y_train, _ = data.split('loan_status')
+        fitted = fit_all_parallel(data, n_jobs=2, n_components=2, n_clusters=3)
+        
+        sequential_rf = classification_candidates()['rf'].fit(X_train, y_train)
+        np.testing.assert_allclose(fitted['classification']['rf'].predict_proba(X_test),
+                                   sequential_rf.predict_proba(X_test))
+        assert set(fitted['regression']) == {'lr', 'rf'}
+        assert fitted['segmentation'][1].n_clusters == 3
+
+    
+    def test_folds_partition_labelled_rows(self, processed_dir):
+        """Test CV folds are built once and cover every row with a target exactly once."""
+        from ml.train import TrainingData
+        
+        data = TrainingData.load(processed_dir)
+        folds = data.folds('loan_amount', n_folds=5)
+        
+        assert data.folds('loan_amount', n_folds=5) is folds
+        test_rows = np.concatenate([test for _, test in folds])
+        assert len(test_rows) == len(np.unique(test_rows)) == 95
+        assert not np.isnan(data.y_reg[test_rows]).any()
+    
+    def test_cross_validation_is_cached(self, processed_dir):
+        """Test fold results are cached by model config and reused."""
+        from ml.train import TrainingData, regression_candidates
+        from ml.cv import cross_validate
+        
+        data = TrainingData.load(processed_dir)
+        cache = processed_dir / 'cv_cache'
+        first = cross_validate(data, 'loan_amount', regression_candidates(), n_folds=3, n_jobs=2, cache_dir=cache)
+        second = cross_validate(data, 'loan_amount', regression_candidates(), n_folds=3, n_jobs=2, cache_dir=cache)
+        
+        assert first['rf']['cached_folds'] == 0 and second['rf']['cached_folds'] == 3
+        assert second['rf']['mean'] == first['rf']['mean']
+        assert set(first['lr']['std']) == {'rmse', 'mae', 'r2'}
+        changed = cross_validate(data, 'loan_amount', regression_candidates(params={'rf_regressor': {'max_depth': 3}}),
+                                 n_folds=3, n_jobs=2, cache_dir=cache)
+        assert changed['rf']['cached_folds'] == 0 and changed['lr']['cached_folds'] == 3
+
+
+class TestBackends:
+    """Test the pluggable tree-ensemble backends."""
+    
+    @pytest.fixture
+    def loans(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(300, 4))
+        y = np.where(X[:, 0] + rng.normal(scale=0.5, size=300) > 0, 'approved', 'default')
+        return X, y
+    
+    def test_backends_keep_string_classes(self, loans):
+        """Test every backend predicts the original labels with aligned probabilities."""
+        from ml.backends import BACKENDS, make_estimator
+        
+        X, y = loans
+        for backend in BACKENDS:
+            model = make_estimator('classifier', backend, {}, n_jobs=1).fit(X, y)
+            assert list(model.classes_) == ['approved', 'default']
+            proba = model.predict_proba(X[:5])
+            assert proba.shape == (5, 2)
+            np.testing.assert_array_equal(model.predict(X[:5]), model.classes_[proba.argmax(axis=1)])
+    
+    def test_forest_growth_stops_on_oob_plateau(self, loans):
+        """Test warm-start growth stops early and keeps the smallest forest near the best OOB score."""
+        from ml.backends import grow_forest, make_estimator
+        
+        X, y = loans
+        forest = grow_forest(make_estimator('classifier', 'rf', {'max_depth': 4}, n_jobs=1), X, y,
+                             {'step': 5, 'max_estimators': 200, 'tol': 0.01})
+        
+        growth = forest.growth_
+        assert growth['stopped_early']
+        assert len(forest.estimators_) == forest.n_estimators == growth['n_estimators']
+        best = max(score for _, score in growth['oob_curve'])
+        assert forest.oob_score_ >= best - 0.01
+        assert not hasattr(forest, 'oob_decision_function_')
+        assert forest.predict_proba(X[:3]).shape == (3, 2)
+    
+    def test_serving_cost_report(self, loans):
+        """Test the cost report covers size, single-row and batch latency."""
+        from ml.backends import make_estimator
+        from ml.evaluate import serving_cost
+        
+        X, y = loans
+        model = make_estimator('classifier', 'hgb', {'max_iter': 10}).fit(X, y)
+        cost = serving_cost(model, X, n_single=20, batch_size=100)
+        
+        assert cost['size_bytes'] > 0
+        assert 0 < cost['single_p50_ms'] <= cost['single_p99_ms']
+        assert cost['batch_rows'] == 100 and cost['rows_per_sec'] > 0
+    
+    def test_untrained_serve_backend_is_rejected(self):
+        """Test pinning a backend that is not among the candidates fails before any fit."""
+        from ml.train import run_all
+        
+        with pytest.raises(ValueError, match='serve'):
+            run_all(serve='hgb')
+
+
+class TestThresholdSweep:
+    """Test the one-pass ROC/PR sweep and the cost-optimal cutoff."""
+    
+    @pytest.fixture
+    def scored(self):
+        rng = np.random.default_rng(0)
+        y = np.where(rng.random(500) < 0.3, 'default', 'approved')
+        # rounded scores create ties, which the sweep must treat as one threshold
+        scores = np.round(np.clip((y == 'default') * 0.3 + rng.random(500) * 0.7, 0, 1), 2)
+        return y, scores
+    
+    def test_curves_match_sklearn(self, scored):
+        """Test AUC and average precision agree with sklearn."""
+        from sklearn.metrics import average_precision_score, roc_auc_score
+        from ml.evaluate import threshold_sweep
+        
+        y, scores = scored
+        sweep = threshold_sweep(y, scores, 'default')
+        assert sweep['roc_auc'] == pytest.approx(roc_auc_score(y == 'default', scores))
+        assert sweep['average_precision'] == pytest.approx(average_precision_score(y == 'default', scores))
+    
+    def test_optimal_cutoff_minimises_expected_loss(self, scored):
+        """Test the chosen cutoff beats every candidate threshold by brute force."""
+        from ml.evaluate import threshold_sweep
+        
+        y, scores = scored
+        loss = {'false_approval': 4.0, 'false_decline': 1.0}
+        sweep = threshold_sweep(y, scores, 'default', loss)
+        positive = y == 'default'
+        brute = min((4.0 * (positive & (scores < t)).sum() + ((~positive) & (scores >= t)).sum()) / len(y)
+                    for t in np.r_[np.unique(scores), np.inf])
+        assert sweep['optimal']['expected_loss'] == pytest.approx(brute)
+        assert sweep['optimal']['expected_loss'] <= sweep['expected_loss_at_0_5']
+
+
+class TestShadowScorer:
+    """Test challenger scoring on the background thread."""
+    
+    @pytest.fixture
+    def challenger(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(200, 3))
+        y = np.where(X[:, 0] > 0, 'approved', 'default')
+        return RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y), X
+    
+    def test_disagreements_are_counted(self, challenger):
+        """Test every submitted request is scored and disagreements with the champion are counted."""
+        from app.shadow import ShadowScorer
+        
+        model, X = challenger
+        shadow = ShadowScorer({'classification': model})
+        labels = model.predict(X[:20])
+        for i, label in enumerate(labels):
+            # flip the champion's label on the first five requests
+            served = ('default' if label == 'approved' else 'approved') if i < 5 else label
+            shadow.submit('classification', X[i:i + 1], {'loan_status': served, 'probability': 0.5}, 1.0)
+        shadow.queue.join()
+        report = shadow.report()['classification']
+        shadow.stop()
+        
+        assert report['scored'] == 20 and report['dropped'] == 0
+        assert report['disagreements'] == 5
+        assert report['latency_ms']['challenger']['p50'] > 0
+    
+    def test_full_queue_drops_without_blocking(self, challenger):
+        """Test submit and stop return immediately and work is dropped once the queue is full."""
+        import threading
+        import time
+        from app.shadow import ShadowScorer
+        
+        model, X = challenger
+        gate = threading.Event()
+        
+        class Slow:
+            classes_ = model.classes_
+            
+            def predict_proba(self, rows):
+                gate.wait()
+                return model.predict_proba(rows)
+        
+        shadow = ShadowScorer({'classification': Slow()}, queue_size=2)
+        for _ in range(10):
+            shadow.submit('classification', X[:1], {'loan_status': 'approved', 'probability': 0.5}, 1.0)
+        report = shadow.report()['classification']
+        start = time.perf_counter()
+        shadow.stop(timeout=0.1)
+        stopped_in = time.perf_counter() - start
+        # only the stop sentinel is left for the worker
+        left = shadow.queue.qsize()
+        gate.set()
+        
+        # one request is being scored, two are queued, the rest were dropped
+        assert report['submitted'] == 10
+        assert report['dropped'] >= 7
+        # stopping discards the queue instead of waiting behind the slow challenger
+        assert stopped_in < 1.0 and left <= 1
+
+
+class TestClustering:
+    """Test scalable segmentation and sampled cluster scores."""
+    
+    @pytest.fixture
+    def blobs(self):
+        from sklearn.datasets import make_blobs
+        X, _ = make_blobs(n_samples=3000, centers=4, cluster_std=0.5, random_state=0)
+        return X
+    
+    def test_stratified_sample_keeps_every_cluster(self):
+        """Test small clusters are represented in the silhouette sample."""
+        from ml.evaluate import stratified_sample
+        
+        labels = np.array([0] * 990 + [1] * 10)
+        rows = stratified_sample(labels, 100)
+        
+        assert len(rows) == 101
+        assert (labels[rows] == 1).sum() == 2
+        assert len(np.unique(rows)) == len(rows)
+    
+    def test_minibatch_k_selection(self, blobs):
+        """Test mini-batch KMeans picks the true k and reports sampled scores."""
+        from ml.clustering import fit_clusterer
+        
+        model, selection = fit_clusterer(blobs, {'method': 'minibatch', 'k_values': [2, 4, 6],
+                                                 'silhouette_sample': 500}, n_jobs=1)
+        
+        assert selection['chosen_k'] == 4 == model.n_clusters
+        best = next(c for c in selection['candidates'] if c['k'] == 4)
+        assert best['method'] == 'MiniBatchKMeans'
+        assert best['silhouette_sample'] == 500
+        low, high = best['silhouette_ci']
+        assert low <= best['silhouette'] <= high
+        assert best['calinski_harabasz'] > 0 and best['inertia'] > 0
+
+
+class TestModelSelection:
+    """Test cost-aware model selection policies."""
+    
+    @pytest.fixture
+    def reports(self):
+        return {
+            'rf': {'rmse': 100.0, 'single_p99_ms': 20.0, 'size_bytes': 50 * 2 ** 20},
+            'hgb': {'rmse': 100.5, 'single_p99_ms': 2.0, 'size_bytes': 2 ** 20},
+            'lr': {'rmse': 140.0, 'single_p99_ms': 0.5, 'size_bytes': 2 ** 10},
+            'slow': {'rmse': 150.0, 'single_p99_ms': 30.0, 'size_bytes': 60 * 2 ** 20},
+        }
+    
+    def test_metric_policy_ignores_cost(self, reports):
+        """Test the default policy keeps the lowest RMSE."""
+        from ml.selection import select_model
+        
+        assert select_model(reports, 'regression')[0] == 'rf'
+    
+    def test_budget_policy(self, reports):
+        """Test over-budget candidates are excluded and reported."""
+        from ml.selection import select_model
+        
+        name, analysis = select_model(reports, 'regression', {'strategy': 'budget', 'max_p99_ms': 10})
+        
+        assert name == 'hgb'
+        assert set(analysis['over_budget']) == {'rf', 'slow'}
+        name, _ = select_model(reports, 'regression', {'strategy': 'budget', 'max_size_mb': 0.0001})
+        assert name == 'lr'  # nothing fits; fastest kept
+    
+    def test_pareto_policy(self, reports):
+        """Test dominated candidates leave the front and near-best fast models win."""
+        from ml.selection import select_model
+        
+        name, analysis = select_model(reports, 'regression', {'strategy': 'pareto', 'tolerance': 0.01})
+        
+        assert analysis['pareto_front'] == ['rf', 'hgb', 'lr']
+        assert name == 'hgb'
+
+
+class TestStageProfiler:
+    """Test the per-stage profiler."""
+    
+    def test_nested_stages_are_recorded(self, tmp_path):
+        """Test stages record time, memory and sizes, nest by name and keep other runs' entries."""
+        import json
+        from ml.profiling import profiled, stage
+        
+        report_path = tmp_path / 'profile.json'
+        with profiled('prepare', report_path):
+            pass
+        with profiled('train', report_path):
+            with stage('fit', inputs=np.zeros((100, 4))):
+                with stage('allocate') as rec:
+                    rec['output'] = np.ones((1000, 1000))
+        
+        report = json.loads(report_path.read_text())
+        assert set(report) == {'prepare', 'train'}
+        stages = {s['stage']: s for s in report['train']['stages']}
+        assert list(stages) == ['train', 'train.fit', 'train.fit.allocate']
+        assert stages['train.fit']['inputs'] == {'rows': 100, 'cols': 4, 'bytes': 3200}
+        assert stages['train.fit.allocate']['outputs']['bytes'] == 8000000
+        # the child's allocation counts towards its parent's peak
+        assert stages['train.fit']['peak_mb'] >= stages['train.fit.allocate']['peak_mb'] >= 7.6
+        assert stages['train']['wall_s'] >= stages['train.fit']['wall_s']
+    
+    def test_stage_is_noop_without_profiler(self):
+        """Test instrumented code runs unprofiled outside a profiled block."""
+        from ml.profiling import stage
+        
+        with stage('fit') as rec:
+            rec['output'] = np.zeros(3)
+        assert 'wall_s' not in rec
+
+
+class TestHyperparameterSearch:
+    """Test the successive-halving tuner."""
+    
+    def test_successive_halving_narrows_candidates(self):
+        """Test rounds grow the sample size while keeping fewer candidates."""
+        from ml.tuning import successive_halving, SEARCH_SPACES
+        
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(900, 4))
+        y = np.where(X[:, 0] + rng.normal(scale=0.5, size=900) > 0, 'approved', 'default')
+        
+        search = successive_halving('rf_classifier', X[:700], y[:700], X[700:], y[700:],
+                                    n_candidates=9, min_samples=100, n_jobs=1)
+        
+        rounds = search['rounds']
+        assert [len(r['results']) for r in rounds] == [9, 3, 1]
+        assert rounds[0]['n_samples'] < rounds[-1]['n_samples'] <= 700
+        for key, value in search['best_params'].items():
+            assert value in SEARCH_SPACES['rf_classifier'][key]
+    
+    def test_time_budget_stops_search(self):
+        """Test an exhausted budget stops after the first round."""
+        from ml.tuning import successive_halving
+        
+        X = np.random.default_rng(1).normal(size=(600, 3))
+        search = successive_halving('kmeans', X[:500], None, X[500:], None, time_budget=0,
+                                    n_candidates=9, min_samples=50, n_jobs=1)
+        
+        assert search['stopped_by_budget']
+        assert len(search['rounds']) == 1
 
 
 class TestModelMetrics: